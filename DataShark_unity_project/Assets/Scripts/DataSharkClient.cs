@@ -16,12 +16,36 @@ public class DataSharkClient : MonoBehaviour
     [SerializeField] private string playerSkillLevel = "intermedio";
     [SerializeField] private bool enableArVr = true;
 
+    [Header("Assistant")]
+    [SerializeField] private string assistantSessionId = "";
+    // Empty uses the local assistant; otherwise an /ai/generate provider such as "openai".
+    [SerializeField] private string assistantProvider = "";
+
+    // Raised per streamed section (name, raw NDJSON line) by GenerateWorldStreaming.
+    public event System.Action<string, string> SectionReceived;
+
+    // Raised per streamed piece of the assistant's answer by AskAssistantStreaming.
+    public event System.Action<string> TokenReceived;
+
+    private float assistantStartedAt;
+    private float assistantFirstTokenAt = -1f;
+
     public void GenerateWorld()
     {
         StartCoroutine(GenerateWorldRoutine());
     }
 
-    private IEnumerator GenerateWorldRoutine()
+    public void GenerateWorldStreaming()
+    {
+        StartCoroutine(GenerateWorldStreamingRoutine());
+    }
+
+    public void AskAssistantStreaming(string message)
+    {
+        StartCoroutine(AskAssistantStreamingRoutine(message));
+    }
+
+    private byte[] BuildRequestBody()
     {
         var request = new GenerationRequest
         {
@@ -34,7 +58,12 @@ public class DataSharkClient : MonoBehaviour
         };
 
         string json = JsonUtility.ToJson(request);
-        byte[] payload = Encoding.UTF8.GetBytes(json);
+        return Encoding.UTF8.GetBytes(json);
+    }
+
+    private IEnumerator GenerateWorldRoutine()
+    {
+        byte[] payload = BuildRequestBody();
 
         using (var webRequest = new UnityWebRequest($"{baseUrl}/generate", "POST"))
         {
@@ -54,6 +83,151 @@ public class DataSharkClient : MonoBehaviour
         }
     }
 
+    private IEnumerator GenerateWorldStreamingRoutine()
+    {
+        byte[] payload = BuildRequestBody();
+
+        using (var webRequest = new UnityWebRequest($"{baseUrl}/generate/stream", "POST"))
+        {
+            webRequest.uploadHandler = new UploadHandlerRaw(payload);
+            webRequest.downloadHandler = new NdjsonDownloadHandler(HandleStreamLine);
+            webRequest.SetRequestHeader("Content-Type", "application/json");
+
+            yield return webRequest.SendWebRequest();
+
+            if (webRequest.result != UnityWebRequest.Result.Success)
+            {
+                Debug.LogError($"DataShark error: {webRequest.error}");
+            }
+        }
+    }
+
+    private IEnumerator AskAssistantStreamingRoutine(string message)
+    {
+        var request = new NpcChatRequest
+        {
+            message = message,
+            session_id = assistantSessionId,
+            provider = assistantProvider
+        };
+        byte[] payload = Encoding.UTF8.GetBytes(JsonUtility.ToJson(request));
+
+        using (var webRequest = new UnityWebRequest($"{baseUrl}/npc/chat/stream", "POST"))
+        {
+            webRequest.uploadHandler = new UploadHandlerRaw(payload);
+            webRequest.downloadHandler = new NdjsonDownloadHandler(HandleAssistantLine);
+            webRequest.SetRequestHeader("Content-Type", "application/json");
+            // Same events as SSE, one JSON object per line, so the NDJSON handler can be reused.
+            webRequest.SetRequestHeader("Accept", "application/x-ndjson");
+
+            assistantStartedAt = Time.realtimeSinceStartup;
+            assistantFirstTokenAt = -1f;
+            yield return webRequest.SendWebRequest();
+
+            if (webRequest.result != UnityWebRequest.Result.Success)
+            {
+                Debug.LogError($"DataShark error: {webRequest.error}");
+            }
+        }
+    }
+
+    private void HandleAssistantLine(string line)
+    {
+        var streamEvent = JsonUtility.FromJson<StreamEvent>(line);
+        if (streamEvent.@event == "token")
+        {
+            if (assistantFirstTokenAt < 0f)
+            {
+                assistantFirstTokenAt = Time.realtimeSinceStartup;
+            }
+            TokenReceived?.Invoke(streamEvent.text);
+        }
+        else if (streamEvent.@event == "done")
+        {
+            float firstToken = assistantFirstTokenAt < 0f ? 0f : assistantFirstTokenAt - assistantStartedAt;
+            float total = Time.realtimeSinceStartup - assistantStartedAt;
+            Debug.Log($"DataShark assistant: first token {firstToken * 1000f:F0} ms, total {total * 1000f:F0} ms");
+        }
+        else
+        {
+            Debug.Log($"DataShark stream: {line}");
+        }
+    }
+
+    private void HandleStreamLine(string line)
+    {
+        var streamEvent = JsonUtility.FromJson<StreamEvent>(line);
+        if (streamEvent.@event == "section")
+        {
+            SectionReceived?.Invoke(streamEvent.section, line);
+        }
+        else
+        {
+            Debug.Log($"DataShark stream: {line}");
+        }
+    }
+
+    // Splits the response body into lines as bytes arrive instead of buffering it.
+    private class NdjsonDownloadHandler : DownloadHandlerScript
+    {
+        private readonly System.Action<string> onLine;
+        private readonly Decoder decoder = Encoding.UTF8.GetDecoder();
+        private readonly StringBuilder buffer = new StringBuilder();
+
+        public NdjsonDownloadHandler(System.Action<string> onLine) : base(new byte[16 * 1024])
+        {
+            this.onLine = onLine;
+        }
+
+        protected override bool ReceiveData(byte[] data, int dataLength)
+        {
+            var chars = new char[decoder.GetCharCount(data, 0, dataLength)];
+            decoder.GetChars(data, 0, dataLength, chars, 0);
+            buffer.Append(chars);
+
+            string text = buffer.ToString();
+            int start = 0;
+            int newline;
+            while ((newline = text.IndexOf('\n', start)) >= 0)
+            {
+                string line = text.Substring(start, newline - start).Trim();
+                if (line.Length > 0)
+                {
+                    onLine(line);
+                }
+                start = newline + 1;
+            }
+            buffer.Remove(0, start);
+            return true;
+        }
+
+        protected override void CompleteContent()
+        {
+            string rest = buffer.ToString().Trim();
+            if (rest.Length > 0)
+            {
+                onLine(rest);
+            }
+            buffer.Clear();
+        }
+    }
+
+    [System.Serializable]
+    private class StreamEvent
+    {
+        public string @event;
+        public string section;
+        public string text;
+    }
+
+    [System.Serializable]
+    private class NpcChatRequest
+    {
+        public string message;
+        public string session_id;
+        public string provider;
+    }
+
     [System.Serializable]
     private class GenerationRequest
     {
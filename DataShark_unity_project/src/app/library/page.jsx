@@ -10,6 +10,7 @@ export default function LibraryPage() {
   const [userId, setUserId] = useState("");
   const [username, setUsername] = useState("");
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
 
   useEffect(() => {
     const storedUserId = localStorage.getItem("userId");
@@ -25,11 +26,13 @@ export default function LibraryPage() {
     loadWorlds(storedUserId);
   }, []);
 
-  const loadWorlds = async (uid) => {
+  const loadWorlds = async (uid, cursor = null) => {
     try {
-      const res = await fetch(`${DEFAULT_API}/worlds?user_id=${uid}`);
+      const query = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
+      const res = await fetch(`${DEFAULT_API}/worlds?user_id=${uid}${query}`);
       const data = await res.json();
-      setWorlds(data.worlds || []);
+      setWorlds((prev) => (cursor ? [...prev, ...(data.worlds || [])] : data.worlds || []));
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       console.error(error);
     } finally {
@@ -75,6 +78,12 @@ export default function LibraryPage() {
           ))}
         </div>
       )}
+
+      {nextCursor && (
+        <button onClick={() => loadWorlds(userId, nextCursor)} style={{ marginTop: 24, padding: "8px 16px", borderRadius: "6px" }}>
+          Cargar más
+        </button>
+      )}
     </div>
   );
 }
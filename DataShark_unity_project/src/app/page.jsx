@@ -6,6 +6,37 @@ import WorldCanvas from "../components/WorldCanvas";
 
 const DEFAULT_API = process.env.NEXT_PUBLIC_API_BASE || "http://127.0.0.1:8000";
 
+// Yields { event, data } for each Server-Sent Event in a fetch response body.
+async function* readSse(body) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const frames = buffer.split("\n\n");
+    buffer = frames.pop();
+    for (const frame of frames) {
+      let event = "message";
+      let data = "";
+      for (const line of frame.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (data) yield { event, data: JSON.parse(data) };
+    }
+  }
+}
+
+function applySection(payload, section, data) {
+  if (section.startsWith("world.")) {
+    payload.world = { ...(payload.world || {}), [section.slice("world.".length)]: data };
+  } else {
+    payload[section] = data;
+  }
+}
+
 export default function HomePage() {
   const [prompt, setPrompt] = useState("Ciudad costera futurista con clima cambiante");
   const [theme, setTheme] = useState("ciencia ficción");
@@ -14,8 +45,14 @@ export default function HomePage() {
   const [enableArVr, setEnableArVr] = useState(true);
   const [response, setResponse] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [zones, setZones] = useState([]);
+  const [firstRenderMs, setFirstRenderMs] = useState(null);
   const [userId, setUserId] = useState("");
   const [username, setUsername] = useState("");
+  const [chatMessage, setChatMessage] = useState("");
+  const [chatReply, setChatReply] = useState("");
+  const [chatTiming, setChatTiming] = useState(null);
+  const [chatting, setChatting] = useState(false);
 
   useEffect(() => {
     const storedUserId = localStorage.getItem("userId");
@@ -33,8 +70,12 @@ export default function HomePage() {
   const handleGenerate = async () => {
     setLoading(true);
     setResponse(null);
+    setZones([]);
+    setFirstRenderMs(null);
+    const started = performance.now();
     try {
-      const res = await fetch(`${DEFAULT_API}/generate`, {
+      // Sections arrive as NDJSON lines while the backend is still generating.
+      const res = await fetch(`${DEFAULT_API}/generate/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -47,8 +88,41 @@ export default function HomePage() {
         })
       });
 
-      const data = await res.json();
-      setResponse(data);
+      if (!res.ok || !res.body) {
+        setResponse(await res.json());
+        return;
+      }
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      const payload = {};
+      let result = {};
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const event = JSON.parse(line);
+          if (event.event === "start") {
+            result = { seed: event.seed };
+          } else if (event.event === "section") {
+            applySection(payload, event.section, event.data);
+            if (event.section === "world.zones") {
+              setZones(event.data);
+              setFirstRenderMs(Math.round(performance.now() - started));
+            }
+          } else if (event.event === "done") {
+            result = { ...result, world_id: event.world_id, summary: event.summary };
+          } else if (event.event === "error") {
+            result = { ...result, error: event.detail };
+          }
+        }
+        setResponse({ ...result, payload: { ...payload } });
+      }
     } catch (error) {
       setResponse({ error: String(error) });
     } finally {
@@ -56,6 +130,43 @@ export default function HomePage() {
     }
   };
 
+  const handleChat = async () => {
+    if (!chatMessage.trim()) return;
+    setChatting(true);
+    setChatReply("");
+    setChatTiming(null);
+    const started = performance.now();
+    let firstTokenMs = null;
+    try {
+      // Tokens arrive as SSE while the assistant is still answering.
+      const res = await fetch(`${DEFAULT_API}/npc/chat/stream`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+        body: JSON.stringify({ message: chatMessage, user_id: userId, world_summary: response?.summary })
+      });
+
+      if (!res.ok || !res.body) {
+        setChatReply((await res.json()).detail || "Error");
+        return;
+      }
+
+      for await (const { event, data } of readSse(res.body)) {
+        if (event === "token") {
+          if (firstTokenMs === null) firstTokenMs = Math.round(performance.now() - started);
+          setChatReply((reply) => reply + data.text);
+        } else if (event === "done") {
+          setChatTiming({ ttft: firstTokenMs ?? 0, total: Math.round(performance.now() - started) });
+        } else if (event === "error") {
+          setChatReply((reply) => reply + `\n[${data.detail}]`);
+        }
+      }
+    } catch (error) {
+      setChatReply(String(error));
+    } finally {
+      setChatting(false);
+    }
+  };
+
   const handleLogout = () => {
     localStorage.clear();
     window.location.href = "/auth";
@@ -116,12 +227,29 @@ export default function HomePage() {
 
         <div className="panel">
           <strong>Respuesta del backend</strong>
+          {firstRenderMs !== null && (
+            <p style={{ color: "var(--muted)", fontSize: "0.85rem" }}>Primer render: {firstRenderMs} ms</p>
+          )}
           <pre>{response ? JSON.stringify(response, null, 2) : "Sin respuesta todavía."}</pre>
         </div>
+
+        <div className="panel">
+          <strong>Asistente</strong>
+          <textarea value={chatMessage} onChange={(e) => setChatMessage(e.target.value)} rows={2} />
+          <button onClick={handleChat} disabled={chatting}>
+            {chatting ? "Respondiendo..." : "Preguntar"}
+          </button>
+          {chatTiming !== null && (
+            <p style={{ color: "var(--muted)", fontSize: "0.85rem" }}>
+              Primer token: {chatTiming.ttft} ms · Total: {chatTiming.total} ms
+            </p>
+          )}
+          <p style={{ whiteSpace: "pre-wrap" }}>{chatReply}</p>
+        </div>
       </aside>
       <section>
         <h2>Vista 3D</h2>
-        <WorldCanvas theme={theme} />
+        <WorldCanvas theme={theme} zones={zones} />
       </section>
     </main>
   );
@@ -12,14 +12,45 @@ function PlaceholderWorld({ theme }) {
   );
 }
 
-export default function WorldCanvas({ theme }) {
+const THREAT_COLORS = {
+  low: "#166534",
+  medium: "#a16207",
+  high: "#b91c1c",
+  extreme: "#581c87"
+};
+
+function ZoneTerrain({ zones }) {
+  return (
+    <group scale={0.25}>
+      {zones.map((zone, index) => (
+        <group key={zone.name} position={[(index - (zones.length - 1) / 2) * 6, 0, 0]}>
+          <mesh position={[0, -0.1, 0]}>
+            <boxGeometry args={[5, 0.2, 5]} />
+            <meshStandardMaterial color={THREAT_COLORS[zone.threat] || "#334155"} />
+          </mesh>
+          {(zone.buildings || []).map((building, i) => {
+            const height = building.height * 0.15;
+            return (
+              <mesh key={i} position={[(i - 1) * 1.5, height / 2, 0]}>
+                <boxGeometry args={[building.width * 0.2, height, building.depth * 0.2]} />
+                <meshStandardMaterial color="#94a3b8" />
+              </mesh>
+            );
+          })}
+        </group>
+      ))}
+    </group>
+  );
+}
+
+export default function WorldCanvas({ theme, zones = [] }) {
   return (
     <div className="canvas-container">
       <Canvas camera={{ position: [3, 3, 3], fov: 55 }}>
         <color attach="background" args={["#050816"]} />
         <ambientLight intensity={0.6} />
         <directionalLight position={[5, 5, 5]} intensity={1.2} />
-        <PlaceholderWorld theme={theme} />
+        {zones.length > 0 ? <ZoneTerrain zones={zones} /> : <PlaceholderWorld theme={theme} />}
         <OrbitControls enablePan={false} />
         <Environment preset="city" />
       </Canvas>
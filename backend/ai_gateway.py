@@ -0,0 +1,575 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful game design assistant."
+DEFAULT_MAX_TOKENS = 500
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 60 * 60
+
+
+class ProviderUnavailable(Exception):
+    """The provider cannot be called: its SDK is not installed or it has no API key."""
+
+    def __init__(self, provider: str, message: str, missing_package: bool = False) -> None:
+        super().__init__(message)
+        self.provider = provider
+        self.missing_package = missing_package
+
+
+class Provider(ABC):
+    """One model backend. Subclasses implement :meth:`complete`."""
+
+    name = "provider"
+    label = "Provider"
+
+    def __init__(self, model: str = "", max_concurrency: int = DEFAULT_CONCURRENCY) -> None:
+        self.model = model
+        self.max_concurrency = max_concurrency
+
+    @abstractmethod
+    async def complete(self, prompt: str, system: str, max_tokens: int) -> str:
+        ...
+
+    async def stream(self, prompt: str, system: str, max_tokens: int) -> AsyncIterator[str]:
+        """Yield the answer as it is produced; providers without streaming yield it whole."""
+        yield await self.complete(prompt, system, max_tokens)
+
+
+class UnavailableProvider(Provider):
+    def __init__(self, name: str, label: str, message: str, missing_package: bool = False) -> None:
+        super().__init__()
+        self.name = name
+        self.label = label
+        self.message = message
+        self.missing_package = missing_package
+
+    async def complete(self, prompt: str, system: str, max_tokens: int) -> str:
+        raise ProviderUnavailable(self.name, self.message, self.missing_package)
+
+
+class StubProvider(Provider):
+    """Offline provider for tests and local development.
+
+    Echoes the prompt after ``latency`` seconds; when streaming, the echo
+    arrives word by word with ``token_latency`` seconds between words.
+    """
+
+    name = "stub"
+    label = "Stub"
+
+    def __init__(
+        self, latency: float = 0.0, token_latency: float = 0.0, max_concurrency: int = DEFAULT_CONCURRENCY
+    ) -> None:
+        super().__init__("stub", max_concurrency)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.calls = 0
+
+    async def complete(self, prompt: str, system: str, max_tokens: int) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._answer(prompt, max_tokens)
+
+    async def stream(self, prompt: str, system: str, max_tokens: int) -> AsyncIterator[str]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for position, token in enumerate(split_tokens(self._answer(prompt, max_tokens))):
+            if position and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield token
+
+    @staticmethod
+    def _answer(prompt: str, max_tokens: int) -> str:
+        return f"[stub] {prompt[: max_tokens * 4]}"
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+    label = "OpenAI"
+
+    def __init__(self, api_key: str, model: str, max_concurrency: int = DEFAULT_CONCURRENCY) -> None:
+        from openai import AsyncOpenAI
+
+        super().__init__(model, max_concurrency)
+        self._client = AsyncOpenAI(api_key=api_key)
+
+    async def complete(self, prompt: str, system: str, max_tokens: int) -> str:
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+        )
+        return response.choices[0].message.content or ""
+
+    async def stream(self, prompt: str, system: str, max_tokens: int) -> AsyncIterator[str]:
+        chunks = await self._client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        async for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class ClaudeProvider(Provider):
+    name = "claude"
+    label = "Claude"
+
+    def __init__(self, api_key: str, model: str, max_concurrency: int = DEFAULT_CONCURRENCY) -> None:
+        from anthropic import AsyncAnthropic
+
+        super().__init__(model, max_concurrency)
+        self._client = AsyncAnthropic(api_key=api_key)
+
+    async def complete(self, prompt: str, system: str, max_tokens: int) -> str:
+        response = await self._client.messages.create(
+            model=self.model,
+            system=system,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return "".join(getattr(block, "text", "") for block in response.content)
+
+    async def stream(self, prompt: str, system: str, max_tokens: int) -> AsyncIterator[str]:
+        async with self._client.messages.stream(
+            model=self.model,
+            system=system,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+        ) as response:
+            async for text in response.text_stream:
+                yield text
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+    label = "Gemini"
+
+    def __init__(self, api_key: str, model: str, max_concurrency: int = DEFAULT_CONCURRENCY) -> None:
+        import google.generativeai as genai
+
+        super().__init__(model, max_concurrency)
+        genai.configure(api_key=api_key)
+        self._genai = genai
+
+    async def complete(self, prompt: str, system: str, max_tokens: int) -> str:
+        model = self._genai.GenerativeModel(self.model, system_instruction=system)
+        response = await model.generate_content_async(prompt, generation_config={"max_output_tokens": max_tokens})
+        return response.text
+
+    async def stream(self, prompt: str, system: str, max_tokens: int) -> AsyncIterator[str]:
+        model = self._genai.GenerativeModel(self.model, system_instruction=system)
+        response = await model.generate_content_async(
+            prompt, generation_config={"max_output_tokens": max_tokens}, stream=True
+        )
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class MistralProvider(Provider):
+    name = "mistral"
+    label = "Mistral"
+
+    def __init__(self, api_key: str, model: str, max_concurrency: int = DEFAULT_CONCURRENCY) -> None:
+        from mistralai import Mistral
+
+        super().__init__(model, max_concurrency)
+        self._client = Mistral(api_key=api_key)
+
+    async def complete(self, prompt: str, system: str, max_tokens: int) -> str:
+        response = await self._client.chat.complete_async(
+            model=self.model,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+        )
+        return response.choices[0].message.content or ""
+
+    async def stream(self, prompt: str, system: str, max_tokens: int) -> AsyncIterator[str]:
+        events = await self._client.chat.stream_async(
+            model=self.model,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+        )
+        async for event in events:
+            content = event.data.choices[0].delta.content
+            if content:
+                yield content
+
+
+# name -> (class, label, pip package, API key variable, model variable, default model)
+PROVIDER_SPECS: Dict[str, Tuple[type, str, str, str, str, str]] = {
+    "openai": (OpenAIProvider, "OpenAI", "openai", "OPENAI_API_KEY", "OPENAI_MODEL", "gpt-4.1"),
+    "claude": (ClaudeProvider, "Claude", "anthropic", "ANTHROPIC_API_KEY", "CLAUDE_MODEL", "claude-3-5-haiku-latest"),
+    "gemini": (GeminiProvider, "Gemini", "google-generativeai", "GEMINI_API_KEY", "GEMINI_MODEL", "gemini-1.5-flash"),
+    "mistral": (MistralProvider, "Mistral", "mistralai", "MISTRAL_API_KEY", "MISTRAL_MODEL", "mistral-small-latest"),
+}
+
+
+def build_provider(name: str, env: Dict[str, str], max_concurrency: int = DEFAULT_CONCURRENCY) -> Provider:
+    """Provider ``name`` configured from ``env``, or an UnavailableProvider saying what is missing."""
+    cls, label, package, key_variable, model_variable, default_model = PROVIDER_SPECS[name]
+    api_key = env.get(key_variable)
+    if not api_key:
+        return UnavailableProvider(name, label, f"{label} not configured")
+    try:
+        return cls(api_key, env.get(model_variable, default_model), max_concurrency)
+    except ImportError:
+        return UnavailableProvider(
+            name, label, f"{label} integration requires its SDK. Install: pip install {package}", missing_package=True
+        )
+
+
+def split_tokens(text: str) -> List[str]:
+    """Split text into word-sized pieces that join back to ``text``."""
+    return re.findall(r"\s*\S+\s*", text) or ([text] if text else [])
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Prompt with case, accents, spacing and surrounding punctuation folded away.
+
+    Unlike knowledge_index.fold, letters outside ASCII are kept, so prompts in
+    other scripts do not collapse onto one key.
+    """
+    decomposed = unicodedata.normalize("NFKD", prompt.casefold())
+    text = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(text.split()).strip(" ¿?¡!.")
+
+
+class GatewayResult(NamedTuple):
+    provider: str
+    text: str
+    # "exact" / "normalized" cache hit, "coalesced" onto an in-flight call, or "miss".
+    cache: str
+
+
+class ProviderGateway:
+    """Async front door for provider calls.
+
+    Answers are cached in an LRU with TTL under two keys: the exact prompt
+    and its normalized form, so "¿Qué es un bioma?" and "que es un bioma"
+    share one answer. Identical prompts already in flight are coalesced onto
+    a single call, and each provider has its own semaphore bounding
+    concurrent requests. Failures are never cached.
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, Provider],
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        cache_ttl: float = DEFAULT_CACHE_TTL,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> None:
+        self.providers = providers
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+
+        self._cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._in_flight: Dict[str, "asyncio.Task[str]"] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+
+        self._exact_hits = 0
+        self._normalized_hits = 0
+        self._coalesced = 0
+        self._misses = 0
+        self._errors = 0
+        self._calls: Dict[str, int] = {}
+        self._call_total = 0.0
+        self._streams = 0
+        self._stream_first_tokens = 0
+        self._stream_ttft_total = 0.0
+        self._stream_total = 0.0
+
+    async def generate(
+        self,
+        provider: str,
+        prompt: str,
+        system: str = DEFAULT_SYSTEM_PROMPT,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+    ) -> GatewayResult:
+        """Answer ``prompt`` with ``provider``; raises KeyError for unknown providers."""
+        backend = self.providers[provider]
+        exact_key, normalized_key = self._keys(backend, system, max_tokens, prompt)
+        text, source = self._lookup(exact_key, normalized_key)
+        if text is not None:
+            return GatewayResult(provider, text, source)
+
+        # The call runs as its own task that every caller awaits through shield(),
+        # so a caller going away cancels neither the call nor the other callers.
+        task = self._in_flight.get(normalized_key)
+        if task is None:
+            source = "miss"
+            task = asyncio.ensure_future(self._call(backend, prompt, system, max_tokens))
+            self._in_flight[normalized_key] = task
+            task.add_done_callback(lambda done: self._settle(done, exact_key, normalized_key))
+        else:
+            source = "coalesced"
+        with self._lock:
+            if source == "miss":
+                self._misses += 1
+            else:
+                self._coalesced += 1
+        return GatewayResult(provider, await asyncio.shield(task), source)
+
+    def stream(
+        self,
+        provider: str,
+        prompt: str,
+        system: str = DEFAULT_SYSTEM_PROMPT,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+    ) -> "TokenStream":
+        """Stream the answer to ``prompt``; raises KeyError for unknown providers.
+
+        Unavailable providers raise ProviderUnavailable here rather than
+        mid-stream. Cached answers arrive as a single piece. Streams are not
+        coalesced, but a stream that runs to completion is cached for later
+        calls.
+        """
+        backend = self.providers[provider]
+        if isinstance(backend, UnavailableProvider):
+            raise ProviderUnavailable(backend.name, backend.message, backend.missing_package)
+        exact_key, normalized_key = self._keys(backend, system, max_tokens, prompt)
+        text, source = self._lookup(exact_key, normalized_key)
+        if text is None:
+            with self._lock:
+                self._misses += 1
+        return TokenStream(self, backend, prompt, system, max_tokens, (exact_key, normalized_key), text, source)
+
+    def _keys(self, backend: Provider, system: str, max_tokens: int, prompt: str) -> Tuple[str, str]:
+        return self._key(backend, system, max_tokens, prompt), self._key(backend, system, max_tokens, normalize_prompt(prompt))
+
+    def _lookup(self, exact_key: str, normalized_key: str) -> Tuple[Optional[str], str]:
+        for key, source in ((exact_key, "exact"), (normalized_key, "normalized")):
+            text = self._cache_get(key)
+            if text is not None:
+                with self._lock:
+                    if source == "exact":
+                        self._exact_hits += 1
+                    else:
+                        self._normalized_hits += 1
+                return text, source
+        return None, "miss"
+
+    def _semaphore(self, backend: Provider) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(backend.name)
+        if semaphore is None:
+            semaphore = self._semaphores.setdefault(backend.name, asyncio.Semaphore(backend.max_concurrency))
+        return semaphore
+
+    def _record_stream(self, provider: str, ttft: Optional[float], total: float, failed: bool) -> None:
+        with self._lock:
+            self._calls[provider] = self._calls.get(provider, 0) + 1
+            self._streams += 1
+            self._stream_total += total
+            if ttft is not None:
+                self._stream_first_tokens += 1
+                self._stream_ttft_total += ttft
+            if failed:
+                self._errors += 1
+
+    def _settle(self, task: "asyncio.Task[str]", exact_key: str, normalized_key: str) -> None:
+        self._in_flight.pop(normalized_key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._cache_put(exact_key, task.result())
+        self._cache_put(normalized_key, task.result())
+
+    async def _call(self, backend: Provider, prompt: str, system: str, max_tokens: int) -> str:
+        async with self._semaphore(backend):
+            started = time.perf_counter()
+            try:
+                return await asyncio.wait_for(backend.complete(prompt, system, max_tokens), self.timeout)
+            except ProviderUnavailable:
+                raise
+            except Exception:
+                with self._lock:
+                    self._errors += 1
+                raise
+            finally:
+                with self._lock:
+                    self._calls[backend.name] = self._calls.get(backend.name, 0) + 1
+                    self._call_total += time.perf_counter() - started
+
+    @staticmethod
+    def _key(backend: Provider, system: str, max_tokens: int, prompt: str) -> str:
+        raw = json.dumps([backend.name, backend.model, system, max_tokens, prompt], ensure_ascii=False)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            text, expires_at = entry
+            if expires_at <= time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return text
+
+    def _cache_put(self, key: str, text: str) -> None:
+        with self._lock:
+            self._cache[key] = (text, time.time() + self.cache_ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = sum(self._calls.values())
+            lookups = self._exact_hits + self._normalized_hits + self._coalesced + self._misses
+            return {
+                "providers": {
+                    name: {
+                        "available": not isinstance(backend, UnavailableProvider),
+                        "model": backend.model,
+                        "max_concurrency": backend.max_concurrency,
+                        "calls": self._calls.get(name, 0),
+                    }
+                    for name, backend in self.providers.items()
+                },
+                "cache_entries": len(self._cache),
+                "exact_hits": self._exact_hits,
+                "normalized_hits": self._normalized_hits,
+                "coalesced": self._coalesced,
+                "misses": self._misses,
+                "errors": self._errors,
+                "hit_ratio": ((lookups - self._misses) / lookups) if lookups else 0.0,
+                "in_flight": len(self._in_flight),
+                "call_ms_avg": (self._call_total / (calls - self._streams) * 1000) if calls > self._streams else 0.0,
+                "streams": self._streams,
+                # Time to first token versus time to the last one, for provider streams.
+                "stream_ttft_ms_avg": (
+                    (self._stream_ttft_total / self._stream_first_tokens * 1000) if self._stream_first_tokens else 0.0
+                ),
+                "stream_total_ms_avg": (self._stream_total / self._streams * 1000) if self._streams else 0.0,
+            }
+
+
+class TokenStream:
+    """Async iterator over the pieces of one streamed answer.
+
+    ``cache`` tells where the answer came from; once iteration finishes,
+    ``ttft_ms`` and ``total_ms`` hold the time to the first piece and to the
+    end, measured from the start of iteration.
+    """
+
+    def __init__(
+        self,
+        gateway: ProviderGateway,
+        backend: Provider,
+        prompt: str,
+        system: str,
+        max_tokens: int,
+        keys: Tuple[str, str],
+        cached: Optional[str],
+        cache: str,
+    ) -> None:
+        self.provider = backend.name
+        self.cache = cache
+        self.tokens = 0
+        self.ttft_ms: Optional[float] = None
+        self.total_ms: Optional[float] = None
+        self._gateway = gateway
+        self._backend = backend
+        self._prompt = prompt
+        self._system = system
+        self._max_tokens = max_tokens
+        self._keys = keys
+        self._cached = cached
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._run()
+
+    async def _run(self) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        if self._cached is not None:
+            self._mark(started)
+            self.tokens = 1
+            yield self._cached
+            self._finish(started)
+            return
+
+        gateway = self._gateway
+        pieces: List[str] = []
+        ttft: Optional[float] = None
+        failed = True
+        async with gateway._semaphore(self._backend):
+            started = time.perf_counter()
+            chunks = self._backend.stream(self._prompt, self._system, self._max_tokens).__aiter__()
+            try:
+                while True:
+                    # The timeout applies to each piece, so long answers are not cut off.
+                    try:
+                        piece = await asyncio.wait_for(chunks.__anext__(), gateway.timeout)
+                    except StopAsyncIteration:
+                        break
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                        self._mark(started)
+                    pieces.append(piece)
+                    self.tokens += 1
+                    yield piece
+                failed = False
+            except (ProviderUnavailable, GeneratorExit, asyncio.CancelledError):
+                # Not the provider's fault: it is unavailable, or the consumer
+                # stopped reading (closed the stream or disconnected).
+                failed = False
+                raise
+            finally:
+                await chunks.aclose()
+                gateway._record_stream(self._backend.name, ttft, time.perf_counter() - started, failed)
+
+        self._finish(started)
+        text = "".join(pieces)
+        for key in self._keys:
+            gateway._cache_put(key, text)
+
+    def _mark(self, started: float) -> None:
+        self.ttft_ms = (time.perf_counter() - started) * 1000
+
+    def _finish(self, started: float) -> None:
+        self.total_ms = (time.perf_counter() - started) * 1000
+
+
+if __name__ == "__main__":
+    # 200 concurrent requests over 20 distinct prompts (with case and accent
+    # variants) against a stub with 50 ms latency: provider calls made and wall time.
+    async def _main() -> None:
+        stub = StubProvider(latency=0.05, max_concurrency=4)
+        gateway = ProviderGateway({"stub": stub})
+        prompts = [f"¿Qué es el bioma {i % 20}?" if i % 2 else f"que es el BIOMA {i % 20}" for i in range(200)]
+        started = time.perf_counter()
+        results = await asyncio.gather(*(gateway.generate("stub", prompt) for prompt in prompts))
+        elapsed = time.perf_counter() - started
+        assert stub.calls == 20, stub.calls
+        print(f"{len(results)} requests -> {stub.calls} provider calls in {elapsed * 1000:.0f} ms")
+        print({key: value for key, value in gateway.stats().items() if key != "providers"})
+
+        # Streaming a 60-word answer: time to the first word versus the whole answer.
+        streamer = StubProvider(latency=0.05, token_latency=0.01)
+        gateway = ProviderGateway({"stub": streamer})
+        tokens = gateway.stream("stub", " ".join(f"palabra{i}" for i in range(60)))
+        async for _ in tokens:
+            pass
+        print(f"stream: first token {tokens.ttft_ms:.0f} ms, complete {tokens.total_ms:.0f} ms ({tokens.tokens} tokens)")
+
+    asyncio.run(_main())
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sorted_keys import DEFAULT_LOAD, SortedKeys
+
+# Worlds whose summary and username are kept for building pages without SQL.
+DEFAULT_MAX_DETAILS = 20000
+
+# /browse orderings: sort key of a world from (id, created_at, play_count, likes),
+# most significant first and ending with the id, like the SQL keyset columns.
+ORDERINGS: Dict[str, Callable[[str, str, int, int], Tuple[Any, ...]]] = {
+    "popular": lambda world_id, created_at, play_count, likes: (play_count, likes, world_id),
+    "recent": lambda world_id, created_at, play_count, likes: (created_at, world_id),
+    "likes": lambda world_id, created_at, play_count, likes: (likes, world_id),
+}
+# Type of each sort key value, for checking cursors before they are compared.
+KEY_TYPES: Dict[str, Tuple[type, ...]] = {
+    "popular": (int, int, str),
+    "recent": (str, str),
+    "likes": (int, str),
+}
+
+PUBLIC_WORLDS_SQL = "SELECT id, created_at, play_count, likes FROM worlds WHERE is_public = 1"
+DETAILS_SQL = """SELECT w.id, w.summary, u.username FROM worlds w LEFT JOIN users u ON w.user_id = u.id
+                 WHERE w.id IN ({placeholders})"""
+
+# id -> (summary, username) for the given ids; neither changes once a world exists.
+DetailsFetch = Callable[[List[str]], Dict[str, Tuple[str, Optional[str]]]]
+
+
+class BrowseRankings:
+    """In-memory /browse orderings of the public worlds.
+
+    Each ordering is a :class:`SortedKeys` of sort keys, so a page is a
+    bisect to the cursor plus ``limit`` steps, however many worlds are
+    public. Publish, unpublish and flushed counter deltas update the keys
+    in place; :meth:`rebuild` reloads everything from the ``worlds`` table.
+    Counts are the stored ones, so pages line up with keyset cursors. The
+    summary and username of recently served worlds are kept in an LRU, so
+    the popular first pages are built without touching SQLite. The rankings
+    live in this process, so every server process keeps its own.
+    """
+
+    def __init__(self, load: int = DEFAULT_LOAD, max_details: int = DEFAULT_MAX_DETAILS) -> None:
+        self.load = load
+        self.max_details = max_details
+        self._details: "OrderedDict[str, Tuple[str, Optional[str]]]" = OrderedDict()
+        # id -> (created_at, play_count, likes)
+        self._worlds: Dict[str, Tuple[str, int, int]] = {}
+        self._rankings = {name: SortedKeys(load=load) for name in ORDERINGS}
+        self._lock = threading.Lock()
+
+        self._rebuilds = 0
+        self._last_rebuild_ms = 0.0
+        self._updates = 0
+        self._pages = 0
+        self._detail_hits = 0
+        self._detail_misses = 0
+
+    def __len__(self) -> int:
+        return len(self._worlds)
+
+    def rebuild(self, rows: Iterable[Sequence[Any]]) -> int:
+        """Replace the rankings with ``(id, created_at, play_count, likes)`` rows; returns the world count."""
+        started = time.perf_counter()
+        worlds = {row[0]: (row[1], int(row[2] or 0), int(row[3] or 0)) for row in rows}
+        rankings = {
+            name: SortedKeys((key(world_id, *values) for world_id, values in worlds.items()), self.load)
+            for name, key in ORDERINGS.items()
+        }
+        with self._lock:
+            self._worlds = worlds
+            self._rankings = rankings
+            for world_id in [world_id for world_id in self._details if world_id not in worlds]:
+                del self._details[world_id]
+            self._rebuilds += 1
+            self._last_rebuild_ms = (time.perf_counter() - started) * 1000
+        return len(worlds)
+
+    def publish(self, world_id: str, created_at: str, play_count: int, likes: int) -> None:
+        with self._lock:
+            self._discard(world_id)
+            self._insert(world_id, (created_at, int(play_count or 0), int(likes or 0)))
+            self._updates += 1
+
+    def unpublish(self, world_id: str) -> bool:
+        with self._lock:
+            self._updates += 1
+            self._details.pop(world_id, None)
+            return self._discard(world_id)
+
+    def add_counts(self, deltas: Dict[str, Tuple[int, int]]) -> int:
+        """Apply ``id -> (play_count delta, likes delta)``; worlds that are not public are ignored."""
+        touched = 0
+        with self._lock:
+            for world_id, (plays, likes) in deltas.items():
+                values = self._worlds.get(world_id)
+                if values is None:
+                    continue
+                created_at, play_count, like_count = values
+                self._discard(world_id)
+                self._insert(world_id, (created_at, play_count + plays, like_count + likes))
+                touched += 1
+            self._updates += touched
+        return touched
+
+    def page(self, sort: str, after: Optional[Sequence[Any]], limit: int, fetch: DetailsFetch) -> List[Dict[str, Any]]:
+        """Up to ``limit`` /browse rows in ``sort`` order that come after the key ``after``.
+
+        ``fetch`` is only called for worlds missing from the detail cache.
+        ``after`` must hold values of the ordering's :data:`KEY_TYPES`.
+        """
+        bound = tuple(after) if after is not None else None
+        entries: List[Tuple[str, Tuple[str, int, int]]] = []
+        missing: List[str] = []
+        details: Dict[str, Tuple[str, Optional[str]]] = {}
+        with self._lock:
+            for key in self._rankings[sort].descending(bound):
+                world_id = key[-1]
+                entries.append((world_id, self._worlds[world_id]))
+                cached = self._details.get(world_id)
+                if cached is None:
+                    missing.append(world_id)
+                else:
+                    self._details.move_to_end(world_id)
+                    details[world_id] = cached
+                if len(entries) == limit:
+                    break
+            self._pages += 1
+            self._detail_hits += len(entries) - len(missing)
+            self._detail_misses += len(missing)
+
+        if missing:
+            fetched = fetch(missing)
+            details.update(fetched)
+            with self._lock:
+                for world_id, detail in fetched.items():
+                    if world_id in self._worlds:
+                        self._details[world_id] = detail
+                while len(self._details) > self.max_details:
+                    self._details.popitem(last=False)
+
+        rows = []
+        for world_id, (created_at, play_count, likes) in entries:
+            if world_id not in details:
+                # Deleted since the rankings were built.
+                continue
+            summary, username = details[world_id]
+            rows.append(
+                {
+                    "id": world_id,
+                    "summary": summary,
+                    "created_at": created_at,
+                    "play_count": play_count,
+                    "likes": likes,
+                    "username": username,
+                }
+            )
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "public_worlds": len(self._worlds),
+                "orderings": sorted(self._rankings),
+                "rebuilds": self._rebuilds,
+                "last_rebuild_ms": self._last_rebuild_ms,
+                "updates": self._updates,
+                "pages": self._pages,
+                "cached_details": len(self._details),
+                "detail_hit_ratio": (
+                    (self._detail_hits / (self._detail_hits + self._detail_misses)) if self._detail_misses else 1.0
+                ),
+            }
+
+    def _insert(self, world_id: str, values: Tuple[str, int, int]) -> None:
+        self._worlds[world_id] = values
+        for name, key in ORDERINGS.items():
+            self._rankings[name].add(key(world_id, *values))
+
+    def _discard(self, world_id: str) -> bool:
+        values = self._worlds.pop(world_id, None)
+        if values is None:
+            return False
+        for name, key in ORDERINGS.items():
+            self._rankings[name].remove(key(world_id, *values))
+        return True
+
+
+def load_public_worlds(conn: sqlite3.Connection) -> List[Tuple[str, str, int, int]]:
+    return [tuple(row) for row in conn.execute(PUBLIC_WORLDS_SQL)]
+
+
+def fetch_details(conn: sqlite3.Connection, ids: List[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+    """Summary and username of each world in ``ids``, one primary-key lookup per world."""
+    rows = conn.execute(DETAILS_SQL.format(placeholders=", ".join("?" for _ in ids)), ids)
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+if __name__ == "__main__":
+    # /browse against N public worlds: the keyset query over the partial
+    # indexes versus a ranking page plus a primary-key fetch, on the first
+    # page and deep in the listing, and the cost of a like reaching the rankings.
+    import os
+    import random
+    import sys
+    import tempfile
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rounds = 200
+    random.seed(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "browse.db"))
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("CREATE TABLE users (id TEXT PRIMARY KEY, username TEXT)")
+        conn.execute(
+            """CREATE TABLE worlds (id TEXT PRIMARY KEY, user_id TEXT, summary TEXT, created_at TEXT,
+               is_public INTEGER, play_count INTEGER, likes INTEGER)"""
+        )
+        conn.execute(
+            "CREATE INDEX idx_worlds_public_popular ON worlds (play_count DESC, likes DESC, id DESC) WHERE is_public = 1"
+        )
+        conn.executemany("INSERT INTO users VALUES (?, ?)", ((f"u{i}", f"user{i}") for i in range(1000)))
+        started = time.perf_counter()
+        conn.executemany(
+            "INSERT INTO worlds VALUES (?, ?, ?, ?, 1, ?, ?)",
+            (
+                (
+                    f"w{i:07d}",
+                    f"u{i % 1000}",
+                    f"Mundo {i}",
+                    f"2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}.{i:07d}",
+                    int(random.paretovariate(1.2)),
+                    int(random.paretovariate(1.5)),
+                )
+                for i in range(count)
+            ),
+        )
+        conn.commit()
+        print(f"{count} public worlds inserted in {time.perf_counter() - started:.1f} s")
+
+        rankings = BrowseRankings()
+        started = time.perf_counter()
+        rankings.rebuild(load_public_worlds(conn))
+        print(f"rebuild             : {(time.perf_counter() - started) * 1000:10.1f} ms")
+
+        columns = "w.id, w.summary, w.created_at, w.play_count, w.likes, u.username"
+        keyset_sql = f"""SELECT {columns} FROM worlds w LEFT JOIN users u ON w.user_id = u.id
+            WHERE w.is_public = 1 AND (w.play_count, w.likes, w.id) < (?, ?, ?)
+            ORDER BY w.play_count DESC, w.likes DESC, w.id DESC LIMIT ?"""
+
+        def _fetch(ids: List[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+            return fetch_details(conn, ids)
+
+        # A page deep in the listing is a detail-cache miss every time.
+        keys = list(rankings._rankings["popular"].descending())
+        pages = (("first page", (1 << 62, 0, ""), 0), ("deep pages", None, 1))
+        for label, bound, deep in pages:
+            bounds = [keys[count // 2 + i * 51] for i in range(rounds)] if deep else [bound] * rounds
+            started = time.perf_counter()
+            sql_pages = [conn.execute(keyset_sql, (*after, 51)).fetchall() for after in bounds]
+            sql_time = (time.perf_counter() - started) / rounds
+            rankings.max_details = 0 if deep else DEFAULT_MAX_DETAILS
+            started = time.perf_counter()
+            ranked_pages = [rankings.page("popular", after, 51, _fetch) for after in bounds]
+            ranked_time = (time.perf_counter() - started) / rounds
+            assert [[row[0] for row in page] for page in sql_pages] == [[row["id"] for row in page] for page in ranked_pages]
+            print(f"{label:12s} keyset: {sql_time * 1e6:10.1f} us   rankings: {ranked_time * 1e6:10.1f} us")
+
+        started = time.perf_counter()
+        for i in range(10000):
+            rankings.add_counts({f"w{random.randrange(count):07d}": (1, 1)})
+        print(f"like -> rankings    : {(time.perf_counter() - started) / 10000 * 1e6:10.1f} us")
+        conn.close()
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import sqlite3
+import struct
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from utils import now_iso
+
+DICTIONARY_SIZE = 32 * 1024  # zlib only looks back 32 KiB
+LEVEL = 6
+
+# Dictionary kinds and the data they are trained on.
+SAVES = "save"
+TEMPLATES = "template"
+
+# Encoding of world sections: each body is one sync-flushed raw deflate
+# segment (see deflate_segment) so gzip responses can be spliced from the
+# stored rows. No dictionary, since a gzip decoder would not have it.
+DEFLATE = "deflate"
+
+# Encoding of rows stored as MessagePack (binary saves); they are not text,
+# so dictionary training and recompression leave them alone.
+MSGPACK = "msgpack"
+
+_lock = threading.Lock()
+_dictionaries: Dict[int, bytes] = {}
+_active: Dict[str, Tuple[int, bytes]] = {}
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = DICTIONARY_SIZE, segment: int = 32, step: int = 8) -> bytes:
+    """Build a zlib preset dictionary from representative samples.
+
+    Fixed-size segments are scored by how many samples contain them; the best
+    segments are packed until ``size`` is reached, most common last because
+    zlib encodes nearer matches more cheaply.
+    """
+    samples = [sample for sample in samples if sample]
+    if not samples:
+        return b""
+    counts: Counter = Counter()
+    for sample in samples:
+        seen = {sample[i:i + segment] for i in range(0, max(len(sample) - segment, 0) + 1, step)}
+        counts.update(seen)
+
+    chosen: List[bytes] = []
+    total = 0
+    for fragment, frequency in counts.most_common():
+        if frequency < 2 and len(samples) > 1:
+            break
+        if any(fragment in kept for kept in chosen):
+            continue
+        chosen.append(fragment)
+        total += len(fragment)
+        if total >= size:
+            break
+    return b"".join(reversed(chosen))[-size:]
+
+
+def compress(data: bytes, dictionary: bytes = b"") -> bytes:
+    if dictionary:
+        compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, dictionary)
+    else:
+        compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(blob: bytes, dictionary: bytes = b"") -> bytes:
+    if dictionary:
+        decompressor = zlib.decompressobj(-15, dictionary)
+    else:
+        decompressor = zlib.decompressobj(-15)
+    return decompressor.decompress(blob) + decompressor.flush()
+
+
+def _load_dictionary(conn: sqlite3.Connection, dictionary_id: int) -> bytes:
+    with _lock:
+        cached = _dictionaries.get(dictionary_id)
+    if cached is not None:
+        return cached
+    row = conn.execute("SELECT data FROM compression_dictionaries WHERE id = ?", (dictionary_id,)).fetchone()
+    if not row:
+        raise LookupError(f"Unknown compression dictionary {dictionary_id}")
+    with _lock:
+        _dictionaries[dictionary_id] = bytes(row[0])
+    return bytes(row[0])
+
+
+def active_dictionary(conn: sqlite3.Connection, kind: str) -> Optional[Tuple[int, bytes]]:
+    with _lock:
+        cached = _active.get(kind)
+    if cached is not None:
+        return cached
+    row = conn.execute(
+        "SELECT id, data FROM compression_dictionaries WHERE kind = ? ORDER BY id DESC LIMIT 1", (kind,)
+    ).fetchone()
+    if not row:
+        return None
+    entry = (row[0], bytes(row[1]))
+    with _lock:
+        _active[kind] = entry
+        _dictionaries[entry[0]] = entry[1]
+    return entry
+
+
+def store_dictionary(conn: sqlite3.Connection, kind: str, dictionary: bytes) -> int:
+    cursor = conn.execute(
+        "INSERT INTO compression_dictionaries (kind, data, created_at) VALUES (?, ?, ?)",
+        (kind, dictionary, now_iso()),
+    )
+    dictionary_id = cursor.lastrowid
+    with _lock:
+        _dictionaries[dictionary_id] = dictionary
+        _active[kind] = (dictionary_id, dictionary)
+    return dictionary_id
+
+
+def encode(conn: sqlite3.Connection, kind: str, text: str) -> Tuple[Union[str, bytes], Optional[str]]:
+    """Compress ``text`` with the active dictionary for ``kind``.
+
+    Returns ``(value, encoding)``; encoding is None when no dictionary has
+    been trained yet and the text is stored as-is.
+    """
+    entry = active_dictionary(conn, kind)
+    if entry is None:
+        return text, None
+    dictionary_id, dictionary = entry
+    return compress(text.encode(), dictionary), f"zd:{dictionary_id}"
+
+
+def decode(conn: sqlite3.Connection, value: Union[str, bytes], encoding: Optional[str]) -> str:
+    if not encoding:
+        return value if isinstance(value, str) else bytes(value).decode()
+    if encoding == DEFLATE:
+        return decompress(bytes(value)).decode()
+    if not encoding.startswith("zd:"):
+        raise ValueError(f"Unsupported encoding {encoding}")
+    dictionary = _load_dictionary(conn, int(encoding[3:]))
+    return decompress(bytes(value), dictionary).decode()
+
+
+# ---- table maintenance -------------------------------------------------
+
+MIN_TRAINING_SAMPLES = 8
+
+# kind -> (table, key columns, compressed columns); each table has an
+# ``encoding`` column shared by its compressed columns.
+COMPRESSED_COLUMNS: Dict[str, Tuple[str, Tuple[str, ...], Tuple[str, ...]]] = {
+    SAVES: ("game_saves", ("id",), ("game_state", "player_stats")),
+    TEMPLATES: ("world_templates", ("id",), ("template_data",)),
+}
+
+
+def train_from_table(
+    conn: sqlite3.Connection,
+    kind: str,
+    extra_samples: Iterable[bytes] = (),
+    limit: int = 2000,
+) -> Optional[int]:
+    """Train and activate a dictionary for ``kind`` from stored rows; None if too few samples."""
+    table, _, columns = COMPRESSED_COLUMNS[kind]
+    rows = conn.execute(
+        f"SELECT {', '.join(columns)}, encoding FROM {table} WHERE encoding IS NOT ? ORDER BY RANDOM() LIMIT ?",
+        (MSGPACK, limit),
+    ).fetchall()
+    samples = [decode(conn, row[index], row[-1]).encode() for row in rows for index in range(len(columns))]
+    samples.extend(extra_samples)
+    if len(samples) < MIN_TRAINING_SAMPLES:
+        return None
+    return store_dictionary(conn, kind, train_dictionary(samples))
+
+
+def recompress_table(conn: sqlite3.Connection, kind: str, batch_size: int = 500) -> int:
+    """Rewrite every row of ``kind`` with the active dictionary, in place."""
+    table, keys, columns = COMPRESSED_COLUMNS[kind]
+    entry = active_dictionary(conn, kind)
+    if entry is None:
+        return 0
+    target = f"zd:{entry[0]}"
+    key_list = ", ".join(keys)
+    all_keys = conn.execute(
+        f"SELECT {key_list} FROM {table} WHERE encoding IS NULL OR encoding NOT IN (?, ?)", (target, MSGPACK)
+    ).fetchall()
+    match = " AND ".join(f"{key} = ?" for key in keys)
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    for start in range(0, len(all_keys), batch_size):
+        updates = []
+        for key in all_keys[start:start + batch_size]:
+            row = conn.execute(
+                f"SELECT {', '.join(columns)}, encoding FROM {table} WHERE {match}", tuple(key)
+            ).fetchone()
+            values = [encode(conn, kind, decode(conn, row[index], row[-1]))[0] for index in range(len(columns))]
+            updates.append((*values, target, *tuple(key)))
+        conn.executemany(f"UPDATE {table} SET {assignments}, encoding = ? WHERE {match}", updates)
+    return len(all_keys)
+
+
+def ensure_dictionaries(conn: sqlite3.Connection) -> None:
+    """Train dictionaries for kinds that have none yet once enough rows exist."""
+    for kind in COMPRESSED_COLUMNS:
+        if active_dictionary(conn, kind) is None and train_from_table(conn, kind) is not None:
+            recompress_table(conn, kind)
+
+
+# ---- gzip pass-through -------------------------------------------------
+#
+# World sections are stored as sync-flushed raw deflate segments along with
+# their length and CRC-32. A gzip body for a whole document (or any envelope
+# around it) is built by compressing only the short JSON glue between the
+# sections and splicing the stored segments in between; no stored bytes are
+# inflated. The CRC of the body is folded together with crc32_combine.
+
+_GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+# A stored part of a document: (deflate_segment(data), len(data), zlib.crc32(data)).
+Segment = Tuple[bytes, int, int]
+
+
+def deflate_segment(data: bytes) -> bytes:
+    compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def stored_segment(data: bytes) -> Segment:
+    return deflate_segment(data), len(data), zlib.crc32(data)
+
+
+def crc32_combine(crc1: int, crc2: int, length2: int) -> int:
+    """CRC-32 of ``a + b`` from ``crc32(a)``, ``crc32(b)`` and ``len(b)``.
+
+    CRC-32 is affine, so feeding ``length2`` zero bytes after ``a`` and
+    cancelling the zeros' own CRC leaves only ``b``'s contribution to add.
+    """
+    zeros = bytes(length2)
+    return zlib.crc32(zeros, crc1) ^ zlib.crc32(zeros) ^ crc2
+
+
+def _stored_blocks(data: bytes) -> bytes:
+    """``data`` as non-final stored (uncompressed) deflate blocks.
+
+    Used for the few bytes of JSON around stored segments: cheaper than a
+    compressor per piece, and stored blocks never refer back into the
+    neighbouring segments.
+    """
+    out = bytearray()
+    for start in range(0, len(data), 0xFFFF):
+        chunk = data[start:start + 0xFFFF]
+        out += struct.pack("<BHH", 0, len(chunk), len(chunk) ^ 0xFFFF) + chunk
+    return bytes(out)
+
+
+def gzip_splice(parts: Iterable[Union[bytes, Segment]]) -> bytes:
+    """Build a gzip body for the concatenation of ``parts``.
+
+    ``bytes`` parts (short JSON glue) go in as stored blocks; :data:`Segment`
+    parts are copied as stored.
+    """
+    out = [_GZIP_HEADER]
+    crc = 0
+    size = 0
+    for part in parts:
+        if isinstance(part, tuple):
+            segment, length, part_crc = part
+            out.append(segment)
+            crc = crc32_combine(crc, part_crc, length)
+            size += length
+        elif part:
+            out.append(_stored_blocks(part))
+            crc = zlib.crc32(part, crc)
+            size += len(part)
+    # Empty final fixed-Huffman block: BFINAL=1, BTYPE=01, end-of-block code.
+    out.append(b"\x03\x00")
+    out.append(struct.pack("<II", crc & 0xFFFFFFFF, size & 0xFFFFFFFF))
+    return b"".join(out)
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        params = params.strip()
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        return quality > 0
+    return False
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+DEFAULT_MAX_TURNS = 8
+DEFAULT_MAX_SESSIONS = 10000
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_IDLE_TTL = 60 * 60
+# Longer messages are truncated before they are remembered.
+MAX_STORED_CHARS = 500
+# Rough cost of a turn beyond its strings (tuple, deque slot, float).
+_TURN_OVERHEAD = 120
+_SESSION_OVERHEAD = 800
+
+
+class Turn(NamedTuple):
+    message: str
+    reply: str
+    # Knowledge base category, "faq", "tutorial" or None when nothing matched.
+    intent: Optional[str]
+    at: float
+
+
+def _turn_size(turn: Turn) -> int:
+    return sys.getsizeof(turn.message) + sys.getsizeof(turn.reply) + _TURN_OVERHEAD
+
+
+class ConversationMemory:
+    """Recent turns per chat session, bounded in every direction.
+
+    Each session keeps a ring buffer of its last ``max_turns`` turns.
+    Sessions are kept in LRU order; the least recently used ones are
+    evicted when there are more than ``max_sessions``, when the estimated
+    size passes ``max_bytes``, or when they sit idle for ``idle_ttl``
+    seconds.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+    ) -> None:
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+
+        # Least recently used session first.
+        self._sessions: "OrderedDict[str, Deque[Turn]]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._turns_recorded = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._hits = 0
+        self._misses = 0
+
+    def recent(self, session: str) -> List[Turn]:
+        """Turns of a session, oldest first (empty for unknown or expired sessions)."""
+        now = time.time()
+        with self._lock:
+            turns = self._sessions.get(session)
+            if turns is None or self._expired(session, now):
+                if turns is not None:
+                    self._drop(session)
+                    self._expirations += 1
+                self._misses += 1
+                return []
+            self._hits += 1
+            self._sessions.move_to_end(session)
+            self._last_used[session] = now
+            return list(turns)
+
+    def last_matched(self, session: str) -> Optional[Turn]:
+        """Most recent turn that resolved to an intent, skipping turns that matched nothing."""
+        for turn in reversed(self.recent(session)):
+            if turn.intent is not None:
+                return turn
+        return None
+
+    def record(self, session: str, message: str, reply: str, intent: Optional[str]) -> None:
+        now = time.time()
+        turn = Turn(message[:MAX_STORED_CHARS], reply, intent, now)
+        with self._lock:
+            turns = self._sessions.get(session)
+            if turns is None:
+                turns = deque(maxlen=self.max_turns)
+                self._sessions[session] = turns
+                self._bytes += _SESSION_OVERHEAD
+            elif len(turns) == turns.maxlen:
+                # The ring buffer drops its oldest turn on append.
+                self._bytes -= _turn_size(turns[0])
+            turns.append(turn)
+            self._bytes += _turn_size(turn)
+            self._sessions.move_to_end(session)
+            self._last_used[session] = now
+            self._turns_recorded += 1
+            self._evict(now)
+
+    def forget(self, session: str) -> bool:
+        with self._lock:
+            if session not in self._sessions:
+                return False
+            self._drop(session)
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "turns": sum(len(turns) for turns in self._sessions.values()),
+                "max_turns_per_session": self.max_turns,
+                "bytes_estimate": self._bytes,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl,
+                "turns_recorded": self._turns_recorded,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "hit_ratio": (self._hits / lookups) if lookups else 0.0,
+            }
+
+    def _expired(self, session: str, now: float) -> bool:
+        return now - self._last_used[session] > self.idle_ttl
+
+    def _drop(self, session: str) -> None:
+        turns = self._sessions.pop(session)
+        del self._last_used[session]
+        self._bytes -= _SESSION_OVERHEAD + sum(_turn_size(turn) for turn in turns)
+
+    def _evict(self, now: float) -> None:
+        # Oldest first: idle sessions, then whatever is needed to fit the caps.
+        while self._sessions:
+            session = next(iter(self._sessions))
+            if self._expired(session, now):
+                self._expirations += 1
+            elif len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes:
+                self._evictions += 1
+            else:
+                break
+            self._drop(session)
+
+
+if __name__ == "__main__":
+    # Memory stays bounded while many sessions chat, and eviction keeps the
+    # per-call cost flat.
+    count = 200000
+    memory = ConversationMemory(max_turns=4, max_sessions=5000, max_bytes=2 * 1024 * 1024)
+    started = time.perf_counter()
+    for i in range(count):
+        session = f"user-{i % 20000}"
+        memory.record(session, f"como funciona el combate {i}", "Sistema de combate disponible...", "combate")
+        memory.last_matched(session)
+    elapsed = time.perf_counter() - started
+    stats = memory.stats()
+    print(f"{elapsed / count * 1e6:6.2f} us per record + lookup")
+    print(stats)
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+# Applied to every connection when the backend runs in WAL storage mode.
+WAL_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -65536,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+
+@contextmanager
+def read_transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Run several SELECTs against one snapshot of the database.
+
+    Pooled connections run SELECTs in autocommit mode, so consecutive reads
+    can see different commits; inside this block they all see the database
+    as of the first read. A transaction that is already open is reused.
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.commit()
+
+
+class _PooledConnection:
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+        self.depth = 0
+
+
+class ConnectionPool:
+    """Thread-local SQLite connections with bounded checkout and recycling.
+
+    Each worker thread keeps one connection open between requests. PRAGMAs are
+    applied once when the connection is opened, idle connections are
+    health-checked before reuse and connections are recycled after
+    ``max_age`` seconds or ``max_uses`` checkouts.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_connections: int = 32,
+        max_age: float = 600.0,
+        max_uses: int = 10000,
+        health_check_after: float = 30.0,
+        pragmas: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.max_age = max_age
+        self.max_uses = max_uses
+        self.health_check_after = health_check_after
+        self.pragmas = dict(pragmas or {})
+
+        self._local = threading.local()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._open: Dict[int, _PooledConnection] = {}
+        self._dir_ready = False
+
+        self._checkouts = 0
+        self._in_use = 0
+        self._opened = 0
+        self._recycled = 0
+        self._failed_health_checks = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self) -> _PooledConnection:
+        if not self._dir_ready:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._dir_ready = True
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        pooled = _PooledConnection(conn)
+        with self._lock:
+            self._open[id(pooled)] = pooled
+            self._opened += 1
+        return pooled
+
+    def _discard(self, pooled: _PooledConnection) -> None:
+        with self._lock:
+            self._open.pop(id(pooled), None)
+        try:
+            pooled.conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        now = time.monotonic()
+        if now - pooled.created_at > self.max_age or pooled.uses >= self.max_uses:
+            self._recycled += 1
+            return False
+        if now - pooled.last_used > self.health_check_after:
+            try:
+                pooled.conn.execute("SELECT 1").fetchone()
+            except sqlite3.Error:
+                self._failed_health_checks += 1
+                return False
+        return True
+
+    def _thread_connection(self) -> _PooledConnection:
+        pooled: Optional[_PooledConnection] = getattr(self._local, "pooled", None)
+        if pooled is not None and pooled.depth == 0 and not self._is_healthy(pooled):
+            self._discard(pooled)
+            pooled = None
+        if pooled is None or id(pooled) not in self._open:
+            pooled = self._connect()
+            self._local.pooled = pooled
+        return pooled
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out this thread's connection.
+
+        Behaves like ``with sqlite3.connect(...) as conn``: the transaction is
+        committed on success and rolled back on error. Nested checkouts in the
+        same thread share the connection and only the outermost one commits.
+        """
+        pooled: Optional[_PooledConnection] = getattr(self._local, "pooled", None)
+        outermost = pooled is None or pooled.depth == 0
+        if outermost:
+            started = time.perf_counter()
+            self._slots.acquire()
+            waited = time.perf_counter() - started
+            try:
+                pooled = self._thread_connection()
+            except Exception:
+                self._slots.release()
+                raise
+            with self._lock:
+                self._checkouts += 1
+                self._in_use += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+        assert pooled is not None
+        pooled.depth += 1
+        try:
+            yield pooled.conn
+            if pooled.depth == 1:
+                pooled.conn.commit()
+        except BaseException:
+            if pooled.depth == 1:
+                pooled.conn.rollback()
+            raise
+        finally:
+            pooled.depth -= 1
+            if outermost:
+                pooled.uses += 1
+                pooled.last_used = time.monotonic()
+                with self._lock:
+                    self._in_use -= 1
+                self._slots.release()
+
+    def close_all(self) -> None:
+        with self._lock:
+            pooled_all = list(self._open.values())
+            self._open.clear()
+        for pooled in pooled_all:
+            try:
+                pooled.conn.close()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "db_path": self.db_path,
+                "max_connections": self.max_connections,
+                "open_connections": len(self._open),
+                "in_use": self._in_use,
+                "opened_total": self._opened,
+                "recycled_total": self._recycled,
+                "failed_health_checks": self._failed_health_checks,
+                "checkouts": checkouts,
+                "wait_ms_avg": (self._wait_total / checkouts * 1000) if checkouts else 0.0,
+                "wait_ms_max": self._wait_max * 1000,
+            }
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+WriteJob = Callable[[sqlite3.Connection], Any]
+
+_STOP = object()
+
+
+class WriteQueue:
+    """Single writer thread that applies queued writes with group commit.
+
+    Callers submit a function that receives the writer connection; pending
+    jobs are drained into one transaction (each under its own SAVEPOINT so a
+    failing job does not abort its neighbours) and committed together.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        pragmas: Optional[Dict[str, Any]] = None,
+        max_batch: int = 256,
+        max_delay: float = 0.0,
+    ) -> None:
+        self.db_path = db_path
+        self.pragmas = dict(pragmas or {})
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self._jobs = 0
+        self._failed_jobs = 0
+        self._batches = 0
+        self._max_batch_seen = 0
+        self._commit_total = 0.0
+        self._latency_total = 0.0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="datashark-db-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def submit(self, job: WriteJob) -> "Future[Any]":
+        if self._thread is None:
+            self.start()
+        future: "Future[Any]" = Future()
+        self._queue.put((job, future, time.perf_counter()))
+        return future
+
+    def run(self, job: WriteJob, timeout: Optional[float] = 30.0) -> Any:
+        """Submit a write and block until its batch has been committed."""
+        return self.submit(job).result(timeout)
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _collect(self, first: Any) -> Tuple[List[Tuple[WriteJob, "Future[Any]", float]], bool]:
+        batch = [first]
+        stopping = False
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+        return batch, stopping
+
+    def _apply(self, conn: sqlite3.Connection, batch: List[Tuple[WriteJob, "Future[Any]", float]]) -> None:
+        results: List[Tuple["Future[Any]", bool, Any]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job, future, _ in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT job")
+                try:
+                    value = job(conn)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((future, False, exc))
+                else:
+                    conn.execute("RELEASE job")
+                    results.append((future, True, value))
+            started = time.perf_counter()
+            conn.execute("COMMIT")
+            commit_time = time.perf_counter() - started
+        except Exception as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future, _ in batch:
+                if future.running():
+                    future.set_exception(exc)
+            with self._lock:
+                self._failed_jobs += len(batch)
+            return
+
+        finished = time.perf_counter()
+        failed = 0
+        for future, ok, value in results:
+            if ok:
+                future.set_result(value)
+            else:
+                failed += 1
+                future.set_exception(value)
+        with self._lock:
+            self._jobs += len(results)
+            self._failed_jobs += failed
+            self._batches += 1
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+            self._commit_total += commit_time
+            self._latency_total += sum(finished - queued_at for _, _, queued_at in batch)
+
+    def _run(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                first = self._queue.get()
+                if first is _STOP:
+                    break
+                batch, stopping = self._collect(first)
+                self._apply(conn, batch)
+                if stopping:
+                    break
+            # Drain anything submitted before stop() so no write is lost.
+            leftovers = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    leftovers.append(item)
+            if leftovers:
+                self._apply(conn, leftovers)
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            batches = self._batches
+            jobs = self._jobs
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "queue_depth": self._queue.qsize(),
+                "jobs": jobs,
+                "failed_jobs": self._failed_jobs,
+                "batches": batches,
+                "avg_batch_size": (jobs / batches) if batches else 0.0,
+                "max_batch_size": self._max_batch_seen,
+                "commit_ms_avg": (self._commit_total / batches * 1000) if batches else 0.0,
+                "write_latency_ms_avg": (self._latency_total / jobs * 1000) if jobs else 0.0,
+            }
+
+
+if __name__ == "__main__":
+    # Contended write throughput: N threads incrementing one row through the
+    # writer queue versus each thread committing on its own connection.
+    import sys
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    from db_pool import WAL_PRAGMAS
+
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    writes = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    def _setup(path: str) -> None:
+        with sqlite3.connect(path) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("CREATE TABLE counters (id TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute("INSERT INTO counters VALUES ('hot', 0)")
+
+    def _increment(conn: sqlite3.Connection) -> None:
+        conn.execute("UPDATE counters SET value = value + 1 WHERE id = 'hot'")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        direct_path = os.path.join(tmp, "direct.db")
+        _setup(direct_path)
+
+        def _direct(_: int) -> None:
+            conn = sqlite3.connect(direct_path, timeout=30)
+            for name, value in WAL_PRAGMAS.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+            with conn:
+                _increment(conn)
+            conn.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(_direct, range(writes)))
+        direct = time.perf_counter() - started
+
+        queued_path = os.path.join(tmp, "queued.db")
+        _setup(queued_path)
+        writer = WriteQueue(queued_path, pragmas=WAL_PRAGMAS)
+        writer.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda _: writer.run(_increment), range(writes)))
+        queued = time.perf_counter() - started
+        stats = writer.stats()
+        writer.stop()
+
+    print(f"direct commits : {writes / direct:10.0f} writes/s")
+    print(f"writer queue   : {writes / queued:10.0f} writes/s (avg batch {stats['avg_batch_size']:.1f})")
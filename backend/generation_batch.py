@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import generation_cache
+import generation_pipeline
+import historical_research
+from generation_pipeline import Stage, StageError, StageGraph
+
+DEFAULT_BATCH_LIMIT = 1000
+
+# (payload, None) on success, (None, error message) on failure.
+BatchResult = Tuple[Optional[Dict[str, Any]], Optional[str]]
+
+
+def _shared_research(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    return ctx["research_context"]
+
+
+# The world generation graph with research looked up once per theme by the
+# parent instead of once per world. Stage timeouts only apply to async runs.
+_GRAPH = StageGraph(
+    [
+        Stage("research", _shared_research) if stage.name == "research" else stage
+        for stage in generation_pipeline.build_generation_graph(None).stages
+    ],
+    default_timeout=None,
+)
+
+
+def generate(world_recipe: str, research: Dict[str, Any]) -> BatchResult:
+    """Run every stage for one recipe; runs inside a pool worker."""
+    fields, seed = generation_cache.recipe_fields(world_recipe)
+    try:
+        results, _ = _GRAPH.run_sync({"fields": fields, "seed": seed, "research_context": research})
+    except StageError as exc:
+        return None, str(exc)
+    return generation_pipeline.assemble_payload(results), None
+
+
+def _generate_packed(job: Tuple[str, Dict[str, Any]]) -> BatchResult:
+    return generate(*job)
+
+
+class BatchGenerator:
+    """Generates many recipes across a process pool.
+
+    The pool is created on first use and uses the ``spawn`` start method, so
+    workers do not inherit the server's threads or open database handles.
+    With ``workers=0`` everything runs on the calling thread.
+    """
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def run(self, recipes: List[str]) -> List[BatchResult]:
+        """Generate each recipe; results are returned in input order."""
+        research: Dict[Optional[str], Dict[str, Any]] = {}
+        jobs = []
+        for world_recipe in recipes:
+            fields, _ = generation_cache.recipe_fields(world_recipe)
+            theme = fields["theme"]
+            if theme not in research:
+                # The research context only depends on the theme.
+                research[theme] = historical_research.gather_context(fields["prompt"], theme)
+            jobs.append((world_recipe, research[theme]))
+
+        if self.workers <= 0 or len(jobs) <= 1:
+            return [_generate_packed(job) for job in jobs]
+        chunksize = max(1, len(jobs) // (self.workers * 4))
+        return list(self._executor().map(_generate_packed, jobs, chunksize=chunksize))
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+
+if __name__ == "__main__":
+    # Wall time for a batch of distinct prompts: one at a time on this thread
+    # versus fanned out across the process pool.
+    import sys
+    import time
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    themes = ["ciencia ficción", "fantasía", "histórico", None]
+    recipes = [
+        generation_cache.recipe(
+            {"prompt": f"Mundo de plantilla número {i}", "theme": themes[i % len(themes)], "platforms": ["Windows"]},
+            i,
+        )
+        for i in range(count)
+    ]
+
+    inline = BatchGenerator(workers=0)
+    pooled = BatchGenerator()
+    pooled.run(recipes[:2])  # start the workers outside the timed run
+
+    started = time.perf_counter()
+    sequential = inline.run(recipes)
+    sequential_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    parallel = pooled.run(recipes)
+    parallel_time = time.perf_counter() - started
+    pooled.close()
+
+    assert sequential == parallel
+    print(f"{count} worlds, {pooled.workers} workers")
+    print(f"inline : {sequential_time * 1000:8.1f} ms")
+    print(f"pool   : {parallel_time * 1000:8.1f} ms")
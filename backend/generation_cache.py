@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, ContextManager, Dict, Iterable, Optional, Tuple
+
+import compression
+
+# Bump when the generation pipeline changes shape so stale results are not served.
+GENERATOR_VERSION = 1
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_DISK_ENTRIES = 10000
+PRUNE_EVERY = 100
+
+
+def _normalize_text(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    return " ".join(value.split()) or None
+
+
+def recipe(fields: Dict[str, Any], seed: Optional[int] = None) -> str:
+    """Canonical JSON of the generation inputs and seed.
+
+    Only fields that influence the generated world are kept; ``user_id``
+    just decides who owns the stored copy. With a seed, the recipe is
+    enough to regenerate the world exactly.
+    """
+    platforms = []
+    for platform in fields.get("platforms") or []:
+        if platform not in platforms:
+            platforms.append(platform)
+    canonical = {
+        "v": GENERATOR_VERSION,
+        "prompt": _normalize_text(fields.get("prompt")),
+        "theme": _normalize_text(fields.get("theme")),
+        "platforms": platforms,
+        "enable_ar_vr": bool(fields.get("enable_ar_vr")),
+        "multiplayer_mode": _normalize_text(fields.get("multiplayer_mode")),
+        "player_skill_level": _normalize_text(fields.get("player_skill_level")),
+        "seed": seed,
+    }
+    return json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def recipe_fields(raw: str) -> Tuple[Dict[str, Any], Optional[int]]:
+    """Inverse of :func:`recipe`: ``(fields, seed)``."""
+    fields = json.loads(raw)
+    fields.pop("v", None)
+    return fields, fields.pop("seed", None)
+
+
+def recipe_key(raw: str) -> str:
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def cache_key(fields: Dict[str, Any], seed: Optional[int] = None) -> str:
+    """SHA-256 of :func:`recipe`."""
+    return recipe_key(recipe(fields, seed))
+
+
+def derive_seed(fields: Dict[str, Any]) -> int:
+    """Stable seed for requests that do not pick one, so equal requests give equal worlds."""
+    return int(cache_key(fields)[:15], 16)
+
+
+class GenerationCache:
+    """Two-tier cache of generated payloads (JSON text) keyed by :func:`cache_key`.
+
+    The memory tier is an LRU bounded by entry count; the disk tier is the
+    ``generation_cache`` table. Both honour the same TTL. Disk rows are
+    written by the caller inside its own transaction via :meth:`store_disk`
+    or :meth:`store_disk_many`.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], ContextManager[sqlite3.Connection]],
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES,
+    ) -> None:
+        self._connect = connect
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._disk_stores = 0
+        self._lookup_total = 0.0
+
+    def get(self, key: str) -> Tuple[Optional[str], str]:
+        """Return ``(payload_json, source)``; source is "memory", "disk" or "miss"."""
+        started = time.perf_counter()
+        now = time.time()
+        body = self._get_memory(key, now)
+        source = "memory"
+        if body is None:
+            body, expires_at = self._get_disk(key, now)
+            source = "disk"
+            if body is not None:
+                self._put_memory(key, body, expires_at)
+        with self._lock:
+            self._lookup_total += time.perf_counter() - started
+            if body is None:
+                self._misses += 1
+                return None, "miss"
+            if source == "memory":
+                self._memory_hits += 1
+            else:
+                self._disk_hits += 1
+        return body, source
+
+    def put(self, key: str, body: str) -> None:
+        """Add a freshly generated payload to the memory tier."""
+        self._put_memory(key, body, time.time() + self.ttl)
+        with self._lock:
+            self._stores += 1
+
+    def store_disk(self, conn: sqlite3.Connection, key: str, body: str) -> None:
+        self.store_disk_many(conn, [(key, body)])
+
+    def store_disk_many(self, conn: sqlite3.Connection, entries: Iterable[Tuple[str, str]]) -> None:
+        now = time.time()
+        rows = [(key, compression.compress(body.encode()), now, now + self.ttl) for key, body in entries]
+        conn.executemany(
+            "INSERT OR REPLACE INTO generation_cache (key, body, created_at, expires_at) VALUES (?, ?, ?, ?)", rows
+        )
+        with self._lock:
+            before = self._disk_stores
+            self._disk_stores += len(rows)
+            prune = before // PRUNE_EVERY != self._disk_stores // PRUNE_EVERY
+        if prune:
+            self.prune(conn)
+
+    def prune(self, conn: sqlite3.Connection) -> int:
+        """Delete expired disk rows and trim the table to ``max_disk_entries``, oldest first."""
+        removed = conn.execute("DELETE FROM generation_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        removed += conn.execute(
+            """DELETE FROM generation_cache WHERE key IN (
+                   SELECT key FROM generation_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+               )""",
+            (self.max_disk_entries,),
+        ).rowcount
+        return removed
+
+    def invalidate(self, keys: Iterable[str] = ()) -> None:
+        """Drop the given keys from memory, or everything when none are given."""
+        keys = list(keys)
+        with self._lock:
+            if not keys:
+                self._entries.clear()
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            body, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return body
+
+    def _put_memory(self, key: str, body: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (body, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def _get_disk(self, key: str, now: float) -> Tuple[Optional[str], float]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT body, expires_at FROM generation_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        if not row:
+            return None, 0.0
+        return compression.decompress(bytes(row[0])).decode(), row[1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._memory_hits + self._disk_hits
+            lookups = hits + self._misses
+            return {
+                "memory_entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": hits,
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_ratio": (hits / lookups) if lookups else 0.0,
+                "stores": self._stores,
+                "disk_stores": self._disk_stores,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "lookup_ms_avg": (self._lookup_total / lookups * 1000) if lookups else 0.0,
+            }
+
+
+if __name__ == "__main__":
+    # Latency of a full (stub) generation versus memory and disk cache hits.
+    import contextlib
+    import sys
+
+    import historical_research
+    import models_integration
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute("CREATE TABLE generation_cache (key TEXT PRIMARY KEY, body BLOB, created_at REAL, expires_at REAL)")
+    cache = GenerationCache(lambda: contextlib.nullcontext(conn))
+    fields = {"prompt": "Ciudad costera futurista", "theme": "ciencia ficción", "platforms": ["Windows"]}
+    key = cache_key(fields)
+
+    def _generate() -> str:
+        research = historical_research.gather_context(fields["prompt"], fields["theme"])
+        world = models_integration.generate_world(fields["prompt"], research, fields["platforms"], False)
+        return json.dumps({"world": world, "research": research})
+
+    cache.store_disk(conn, key, _generate())
+
+    def _disk() -> Optional[str]:
+        cache.invalidate()
+        return cache.get(key)[0]
+
+    for label, fn in (("generate", _generate), ("disk hit", _disk), ("memory hit", lambda: cache.get(key)[0])):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            assert fn()
+        print(f"{label:12s}: {(time.perf_counter() - started) / iterations * 1000:8.3f} ms")
@@ -0,0 +1,394 @@
+from __future__ import annotations
+
+import asyncio
+import http.client
+import ipaddress
+import json
+import math
+import socket
+import sqlite3
+import ssl
+import threading
+import time
+import urllib.parse
+from typing import Any, Awaitable, Callable, ContextManager, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from utils import now_iso
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_LIMIT = 100
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 2.0
+POLL_INTERVAL = 1.0
+WEBHOOK_TIMEOUT = 5.0
+# Redirect hops followed when a JobQueue is told to follow webhook redirects.
+MAX_WEBHOOK_REDIRECTS = 3
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Literal statuses so the partial index idx_generation_jobs_queued applies.
+CLAIM_SQL = """SELECT id, request, attempts FROM generation_jobs
+               WHERE status = 'queued' AND available_at <= ?
+               ORDER BY priority DESC, available_at, id LIMIT 1"""
+PENDING_SQL = "SELECT COUNT(*) FROM generation_jobs WHERE status IN ('queued', 'running')"
+
+WriteFn = Callable[[Callable[[sqlite3.Connection], Any]], Any]
+JobFn = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Generation queue is full")
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """Persistent generation queue drained by a fixed number of asyncio workers.
+
+    Jobs live in the ``generation_jobs`` table, so queued work survives a
+    restart. Workers claim the highest priority job that is due, await
+    ``run_job(request)`` and record the result; failures are retried with
+    exponential backoff up to ``max_attempts``. Cancelling a running job
+    cancels its task.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], ContextManager[sqlite3.Connection]],
+        write: WriteFn,
+        run_job: JobFn,
+        workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_QUEUE_LIMIT,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        follow_webhook_redirects: bool = False,
+    ) -> None:
+        self._connect = connect
+        self._write = write
+        self._run_job = run_job
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.follow_webhook_redirects = follow_webhook_redirects
+
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._running: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+        self._cancel_requested: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+        self._completed = 0
+        self._failed = 0
+        self._retried = 0
+        self._rejected = 0
+        self._run_total = 0.0
+
+    # ---- lifecycle -------------------------------------------------------
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        # Jobs left running by a crash or restart go back to the queue.
+        await asyncio.to_thread(
+            self._write,
+            lambda conn: conn.execute(
+                "UPDATE generation_jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING)
+            ),
+        )
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ---- API -------------------------------------------------------------
+
+    def submit(self, request: Dict[str, Any], priority: int = 0, webhook_url: Optional[str] = None) -> str:
+        """Queue a job and return its id; raises QueueFull when too much work is pending.
+
+        Raises ValueError when ``webhook_url`` is not http(s) or its host
+        resolves to a private, loopback or link-local address.
+        """
+        if webhook_url:
+            check_webhook_url(webhook_url)
+        job_id = uuid4().hex
+
+        def _insert(conn: sqlite3.Connection) -> int:
+            pending = conn.execute(PENDING_SQL).fetchone()[0]
+            if pending >= self.max_pending:
+                return pending
+            conn.execute(
+                """INSERT INTO generation_jobs
+                   (id, status, priority, request, attempts, webhook_url, available_at, created_at)
+                   VALUES (?, ?, ?, ?, 0, ?, ?, ?)""",
+                (job_id, QUEUED, priority, json.dumps(request), webhook_url, time.time(), now_iso()),
+            )
+            return -1
+
+        pending = self._write(_insert)
+        if pending >= 0:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFull(self._retry_after(pending))
+        self._notify()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_dict(row) if row else None
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a queued or running job; returns its resulting status, or None if unknown."""
+
+        def _cancel(conn: sqlite3.Connection) -> Tuple[Optional[str], Optional[str]]:
+            row = conn.execute("SELECT status, webhook_url FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+            if not row:
+                return None, None
+            if row["status"] in FINISHED:
+                return row["status"], None
+            conn.execute(
+                "UPDATE generation_jobs SET status = ?, finished_at = ? WHERE id = ?", (CANCELLED, now_iso(), job_id)
+            )
+            return CANCELLED, row["webhook_url"]
+
+        status, webhook_url = self._write(_cancel)
+        task = self._running.get(job_id)
+        if task is not None and self._loop is not None:
+            self._cancel_requested.add(job_id)
+            self._loop.call_soon_threadsafe(task.cancel)
+        if webhook_url:
+            self._notify_webhook(webhook_url, job_id)
+        return status
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            counts = dict(
+                conn.execute(
+                    "SELECT status, COUNT(*) FROM generation_jobs WHERE status IN ('queued', 'running') GROUP BY status"
+                ).fetchall()
+            )
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": counts.get(QUEUED, 0),
+                "running": counts.get(RUNNING, 0),
+                "max_pending": self.max_pending,
+                "completed": self._completed,
+                "failed": self._failed,
+                "retried": self._retried,
+                "rejected": self._rejected,
+                "run_seconds_avg": (self._run_total / self._completed) if self._completed else 0.0,
+            }
+
+    # ---- workers ---------------------------------------------------------
+
+    def _notify(self) -> None:
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _retry_after(self, pending: int) -> int:
+        with self._lock:
+            average = (self._run_total / self._completed) if self._completed else 5.0
+        return max(1, math.ceil(pending / max(self.workers, 1) * average))
+
+    def _claim(self, conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+        row = conn.execute(CLAIM_SQL, (time.time(),)).fetchone()
+        if not row:
+            return None
+        conn.execute(
+            "UPDATE generation_jobs SET status = ?, attempts = attempts + 1, started_at = ? WHERE id = ?",
+            (RUNNING, now_iso(), row["id"]),
+        )
+        return {"id": row["id"], "request": json.loads(row["request"]), "attempts": row["attempts"] + 1}
+
+    def _claim_ready(self) -> Optional[Dict[str, Any]]:
+        # A plain read first, so idle workers polling an empty queue never
+        # take the write lock; the claim re-checks inside the writer.
+        with self._connect() as conn:
+            if conn.execute(CLAIM_SQL, (time.time(),)).fetchone() is None:
+                return None
+        return self._write(self._claim)
+
+    async def _worker(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            job = await asyncio.to_thread(self._claim_ready)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        task = asyncio.ensure_future(self._run_job(job["request"]))
+        self._running[job_id] = task
+        started = time.perf_counter()
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if job_id in self._cancel_requested:
+                # Cancelled through cancel(); the row is already marked.
+                self._cancel_requested.discard(job_id)
+                return
+            # The worker itself is shutting down; leave the job for the next start.
+            task.cancel()
+            await asyncio.to_thread(self._finish, job_id, QUEUED, None, None, time.time())
+            raise
+        except Exception as exc:
+            if job["attempts"] < self.max_attempts:
+                delay = RETRY_BACKOFF ** job["attempts"]
+                await asyncio.to_thread(self._finish, job_id, QUEUED, None, str(exc), time.time() + delay)
+                with self._lock:
+                    self._retried += 1
+            else:
+                await asyncio.to_thread(self._finish, job_id, FAILED, None, str(exc), None)
+                with self._lock:
+                    self._failed += 1
+        else:
+            await asyncio.to_thread(self._finish, job_id, SUCCEEDED, result, None, None)
+            with self._lock:
+                self._completed += 1
+                self._run_total += time.perf_counter() - started
+        finally:
+            self._running.pop(job_id, None)
+
+    def _finish(
+        self,
+        job_id: str,
+        status: str,
+        result: Optional[Dict[str, Any]],
+        error: Optional[str],
+        available_at: Optional[float],
+    ) -> None:
+        def _update(conn: sqlite3.Connection) -> Optional[str]:
+            # A job cancelled while running keeps its cancelled status.
+            cursor = conn.execute(
+                """UPDATE generation_jobs SET status = ?, result = ?, error = ?,
+                   available_at = COALESCE(?, available_at), finished_at = ?
+                   WHERE id = ? AND status = ?""",
+                (
+                    status,
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    available_at,
+                    now_iso() if status in FINISHED else None,
+                    job_id,
+                    RUNNING,
+                ),
+            )
+            if cursor.rowcount and status in FINISHED:
+                row = conn.execute("SELECT webhook_url FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+                return row["webhook_url"]
+            return None
+
+        webhook_url = self._write(_update)
+        if webhook_url:
+            self._notify_webhook(webhook_url, job_id)
+
+    def _notify_webhook(self, url: str, job_id: str) -> None:
+        threading.Thread(
+            target=_post_webhook, args=(url, self.get(job_id), self.follow_webhook_redirects), daemon=True
+        ).start()
+
+
+def _job_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "job_id": row["id"],
+        "status": row["status"],
+        "priority": row["priority"],
+        "attempts": row["attempts"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+    }
+
+
+def _public_address(url: str) -> Tuple[urllib.parse.SplitResult, str]:
+    """(parsed url, an address its host resolves to); ValueError unless http(s) and every address is public."""
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("Webhook URL must be an absolute http or https URL")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    try:
+        infos = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as exc:
+        raise ValueError(f"Webhook host {parts.hostname} does not resolve") from exc
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        # is_global is False for private, loopback, link-local, shared and reserved ranges.
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"Webhook host {parts.hostname} resolves to a non-public address")
+    return parts, addresses[0]
+
+
+def check_webhook_url(url: str) -> None:
+    """Raise ValueError unless ``url`` is an http(s) URL whose host only resolves to public addresses."""
+    _public_address(url)
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connects to the address that was checked, not to whatever the host resolves to next."""
+
+    def __init__(self, host: str, port: int, address: str, timeout: float) -> None:
+        super().__init__(host, port, timeout=timeout)
+        self._address = address
+
+    def connect(self) -> None:
+        self.sock = socket.create_connection((self._address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, host: str, port: int, address: str, timeout: float) -> None:
+        super().__init__(host, port, timeout=timeout, context=ssl.create_default_context())
+        self._address = address
+
+    def connect(self) -> None:
+        sock = socket.create_connection((self._address, self.port), self.timeout)
+        # Certificate and SNI still use the host name.
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def _post_webhook(url: str, body: Optional[Dict[str, Any]], follow_redirects: bool = False) -> None:
+    data = json.dumps(body).encode()
+    try:
+        for _ in range(MAX_WEBHOOK_REDIRECTS + 1):
+            # Checked again at delivery: DNS may have changed since the job was queued.
+            parts, address = _public_address(url)
+            connection_class = _PinnedHTTPSConnection if parts.scheme == "https" else _PinnedHTTPConnection
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            connection = connection_class(parts.hostname or "", port, address, WEBHOOK_TIMEOUT)
+            try:
+                target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+                connection.request("POST", target, body=data, headers={"Content-Type": "application/json"})
+                response = connection.getresponse()
+                location = response.getheader("Location")
+                status = response.status
+            finally:
+                connection.close()
+            if not (follow_redirects and status in (301, 302, 303, 307, 308) and location):
+                return
+            url = urllib.parse.urljoin(url, location)
+    except Exception:
+        # Webhooks are best effort (unsafe or unreachable targets are dropped);
+        # clients can always poll the job.
+        pass
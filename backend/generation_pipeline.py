@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import collaborative_story_module
+import error_correction_module
+import historical_research
+import learning_guide_module
+import models_integration
+import mods_module
+import multiplayer_module
+import physics_module
+import simulation_module
+
+DEFAULT_STAGE_TIMEOUT = 30.0
+
+StageFn = Callable[[Dict[str, Any]], Any]
+
+
+class StageError(Exception):
+    """A stage failed or ran past its timeout; the remaining stages were cancelled."""
+
+    def __init__(self, stage: str, message: str, timed_out: bool = False) -> None:
+        super().__init__(f"Stage '{stage}' {message}")
+        self.stage = stage
+        self.timed_out = timed_out
+
+
+class Stage:
+    """One step of a pipeline.
+
+    ``fn`` receives the pipeline inputs merged with the results of every
+    finished stage and may be sync (run on a worker thread) or async.
+    """
+
+    def __init__(self, name: str, fn: StageFn, deps: Iterable[str] = (), timeout: Optional[float] = None) -> None:
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.timeout = timeout
+
+
+class StageGraph:
+    """Runs stages as soon as their dependencies finish.
+
+    Stages must be listed after the stages they depend on. A stage that
+    raises or times out cancels everything still pending. Sync stages
+    already running on a thread cannot be interrupted; their results are
+    discarded.
+    """
+
+    def __init__(self, stages: List[Stage], default_timeout: Optional[float] = DEFAULT_STAGE_TIMEOUT) -> None:
+        seen: set = set()
+        for stage in stages:
+            missing = [dep for dep in stage.deps if dep not in seen]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown or later stages {missing}")
+            seen.add(stage.name)
+        self.stages = stages
+        self.default_timeout = default_timeout
+
+    def run_sync(self, inputs: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """Run every stage in order on the calling thread; timeouts are not enforced."""
+        results: Dict[str, Any] = {}
+        timings: Dict[str, float] = {}
+        for stage in self.stages:
+            started = time.perf_counter()
+            try:
+                results[stage.name] = stage.fn({**inputs, **results})
+            except Exception as exc:
+                raise StageError(stage.name, f"failed: {exc}") from exc
+            timings[stage.name] = (time.perf_counter() - started) * 1000
+        return results, timings
+
+    async def run(
+        self,
+        inputs: Dict[str, Any],
+        on_stage: Optional[Callable[[str, Any], None]] = None,
+    ) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """Run the graph concurrently; returns ``(results, timings_ms)``.
+
+        ``on_stage(name, result)`` is called on the event loop as each stage
+        finishes.
+        """
+        results: Dict[str, Any] = {}
+        timings: Dict[str, float] = {}
+        pending = list(self.stages)
+        running: Dict["asyncio.Task[Any]", Stage] = {}
+        try:
+            while pending or running:
+                for stage in [stage for stage in pending if all(dep in results for dep in stage.deps)]:
+                    pending.remove(stage)
+                    task = asyncio.ensure_future(self._run_stage(stage, {**inputs, **results}, timings))
+                    running[task] = stage
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = running.pop(task)
+                    results[stage.name] = task.result()
+                    if on_stage is not None:
+                        on_stage(stage.name, results[stage.name])
+        finally:
+            for task in running:
+                task.cancel()
+        return results, timings
+
+    async def _run_stage(self, stage: Stage, context: Dict[str, Any], timings: Dict[str, float]) -> Any:
+        timeout = stage.timeout if stage.timeout is not None else self.default_timeout
+        if asyncio.iscoroutinefunction(stage.fn):
+            work = stage.fn(context)
+        else:
+            work = asyncio.to_thread(stage.fn, context)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(work, timeout)
+        except asyncio.TimeoutError as exc:
+            raise StageError(stage.name, f"timed out after {timeout:g}s", timed_out=True) from exc
+        except StageError:
+            raise
+        except Exception as exc:
+            raise StageError(stage.name, f"failed: {exc}") from exc
+        timings[stage.name] = (time.perf_counter() - started) * 1000
+        return result
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Format stage timings as a Server-Timing header value."""
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+
+# ---- world generation --------------------------------------------------
+#
+# Inputs: "fields" (normalized request, see generation_cache.recipe) and "seed".
+
+# Key order of the merged payload; stored and cached payloads depend on it.
+PAYLOAD_ORDER = ("world", "research", "simulations", "story", "tutorial", "physics", "multiplayer", "corrections", "mods")
+
+
+def _research(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    return historical_research.gather_context(ctx["fields"]["prompt"], ctx["fields"]["theme"])
+
+
+def _world(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    fields = ctx["fields"]
+    return models_integration.generate_world(
+        prompt=fields["prompt"],
+        research_context=ctx["research"],
+        platforms=fields["platforms"],
+        enable_ar_vr=fields["enable_ar_vr"],
+        seed=ctx["seed"],
+    )
+
+
+def _merged(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: ctx[key] for key in PAYLOAD_ORDER if key in ctx}
+
+
+def build_generation_graph(timeout: Optional[float] = DEFAULT_STAGE_TIMEOUT) -> StageGraph:
+    enrichment = ("simulations", "story", "tutorial", "physics", "multiplayer")
+    return StageGraph(
+        [
+            Stage("research", _research),
+            Stage("world", _world, deps=("research",)),
+            # Everything below only reads the base world and runs concurrently.
+            Stage("simulations", lambda ctx: simulation_module.simulate_systems(ctx["world"]), deps=("world",)),
+            Stage("story", lambda ctx: collaborative_story_module.build_story(ctx["world"]), deps=("world",)),
+            Stage(
+                "tutorial",
+                lambda ctx: learning_guide_module.create_tutorial(ctx["world"], ctx["fields"]["player_skill_level"]),
+                deps=("world",),
+            ),
+            Stage(
+                "physics",
+                lambda ctx: physics_module.optimize_physics(ctx["world"], ctx["fields"]["platforms"]),
+                deps=("world",),
+            ),
+            Stage(
+                "multiplayer",
+                lambda ctx: multiplayer_module.configure_multiplayer(ctx["world"], ctx["fields"]["multiplayer_mode"]),
+                deps=("world",),
+            ),
+            Stage(
+                "corrections",
+                lambda ctx: error_correction_module.validate_world(_merged(ctx)),
+                deps=("research", "world", *enrichment),
+            ),
+            Stage("mods", lambda ctx: mods_module.generate_mods(_merged(ctx)), deps=("corrections",)),
+        ],
+        default_timeout=timeout,
+    )
+
+
+def assemble_payload(results: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: results[key] for key in PAYLOAD_ORDER}
+
+
+# World keys streamed first so clients can render terrain and actors early.
+STREAM_WORLD_FIRST = ("zones", "npcs", "enemies")
+
+
+def stage_sections(stage: str, result: Any) -> List[Tuple[str, Any]]:
+    """Split a finished stage into the ``(section, value)`` pairs streamed to clients.
+
+    Section names match world_store sections ("world.zones", "story", ...).
+    """
+    if stage != "world":
+        return [(stage, result)]
+    keys = [key for key in STREAM_WORLD_FIRST if key in result]
+    keys += [key for key in result if key not in STREAM_WORLD_FIRST]
+    return [(f"world.{key}", result[key]) for key in keys]
+
+
+if __name__ == "__main__":
+    # Wall time with every enrichment stage blocking for --latency seconds
+    # (standing in for a model call): sequential versus the concurrent graph.
+    import sys
+
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+
+    def _slow(stage: Stage) -> Stage:
+        def fn(ctx: Dict[str, Any]) -> Any:
+            time.sleep(latency)
+            return stage.fn(ctx)
+
+        return Stage(stage.name, fn, stage.deps, stage.timeout)
+
+    graph = build_generation_graph()
+    slow = StageGraph([_slow(stage) for stage in graph.stages])
+    inputs = {
+        "fields": {
+            "prompt": "Ciudad costera futurista",
+            "theme": "ciencia ficción",
+            "platforms": ["Windows"],
+            "enable_ar_vr": False,
+            "multiplayer_mode": None,
+            "player_skill_level": None,
+        },
+        "seed": 7,
+    }
+
+    started = time.perf_counter()
+    sequential, _ = slow.run_sync(inputs)
+    sequential_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    concurrent, timings = asyncio.run(slow.run(inputs))
+    concurrent_time = time.perf_counter() - started
+
+    assert assemble_payload(sequential) == assemble_payload(concurrent)
+    print(f"sequential : {sequential_time * 1000:8.1f} ms")
+    print(f"concurrent : {concurrent_time * 1000:8.1f} ms")
+    print(f"Server-Timing: {server_timing(timings)}")
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# A pattern is parsed into its top-level groups: \b(crear|generar).*(mundo|juego)\b
+# gives [["crear", "generar"], ["mundo", "juego"]]. Any match must contain one
+# alternative of every group, which is what the keyword prefilter checks.
+_GROUP = re.compile(r"\(([^()]*)\)")
+_CHAR_CLASS = re.compile(r"\[([^\]]+)\]")
+_PLAIN = re.compile(r"[\w\s\-']+")
+
+
+def _expand(alternative: str) -> Optional[List[str]]:
+    """Literal spellings of one alternative (``compa[ñn]ero`` has two), or None if it is not plain text."""
+    variants = [""]
+    position = 0
+    for match in _CHAR_CLASS.finditer(alternative):
+        literal = alternative[position : match.start()]
+        variants = [prefix + literal + char for prefix in variants for char in match.group(1)]
+        position = match.end()
+    variants = [variant + alternative[position:] for variant in variants]
+    if not all(_PLAIN.fullmatch(variant) for variant in variants):
+        return None
+    return variants
+
+
+def keyword_groups(pattern: str) -> List[FrozenSet[str]]:
+    """Keyword sets that must each appear in a matching message; empty when the pattern cannot be prefiltered."""
+    groups = []
+    for body in _GROUP.findall(pattern):
+        keywords: Set[str] = set()
+        for alternative in body.split("|"):
+            variants = _expand(alternative)
+            if variants is None:
+                # Unknown syntax: skip this group rather than risk filtering out a real match.
+                break
+            keywords.update(variant.lower() for variant in variants)
+        else:
+            groups.append(frozenset(keywords))
+    return groups
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Regex matching any of ``words`` that prefers the longest one.
+
+    Shared prefixes are factored out, so each position is tested in time
+    proportional to the keyword length rather than the number of keywords.
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Children are tried before ending here, so the longest keyword wins.
+        return f"(?:{body})?" if "" in node else body
+
+    return render(trie)
+
+
+class IntentMatcher:
+    """Precompiled matcher over a LocalAI-style knowledge base.
+
+    One regex pass over the message finds every keyword that occurs in it;
+    only patterns whose keyword groups are all present are confirmed with
+    their own (precompiled) regex. Every category is scored and the best one
+    wins: each matching pattern adds, per group, the weight of its rarest
+    keyword found in the message (1 / number of categories using it). Topic
+    words such as "combate" outweigh question words such as "como" that
+    appear everywhere. Ties go to the category listed first.
+    """
+
+    def __init__(self, knowledge_base: Dict[str, Dict[str, Any]]) -> None:
+        self.categories = list(knowledge_base)
+        # (category index, compiled pattern, keyword groups)
+        self._patterns: List[Tuple[int, "re.Pattern[str]", List[FrozenSet[str]]]] = []
+        for category_index, data in enumerate(knowledge_base.values()):
+            for pattern in data["patterns"]:
+                self._patterns.append((category_index, re.compile(pattern, re.IGNORECASE), keyword_groups(pattern)))
+
+        categories_by_keyword: Dict[str, Set[int]] = {}
+        patterns_by_keyword: Dict[str, int] = {}
+        for category_index, _, groups in self._patterns:
+            for group in groups:
+                for keyword in group:
+                    categories_by_keyword.setdefault(keyword, set()).add(category_index)
+                    patterns_by_keyword[keyword] = patterns_by_keyword.get(keyword, 0) + 1
+        keywords = sorted(categories_by_keyword)
+        self._weights = {keyword: 1.0 / len(indexes) for keyword, indexes in categories_by_keyword.items()}
+
+        # Each pattern is indexed under the keywords of its rarest group, so
+        # "como" alone does not pull in every "como ... X" pattern. Patterns
+        # that cannot be prefiltered are always confirmed.
+        self._unfiltered: List[int] = []
+        by_keyword: Dict[str, List[int]] = {}
+        for pattern_index, (_, _, groups) in enumerate(self._patterns):
+            if not groups:
+                self._unfiltered.append(pattern_index)
+                continue
+            rarest = min(groups, key=lambda group: sum(patterns_by_keyword[keyword] for keyword in group))
+            for keyword in rarest:
+                by_keyword.setdefault(keyword, []).append(pattern_index)
+        self._by_keyword = {keyword: tuple(indexes) for keyword, indexes in by_keyword.items()}
+
+        # At any position the longest keyword is found; every shorter keyword
+        # starting there is one of its prefixes.
+        self._scanner = re.compile("(?=(" + _trie_pattern(keywords) + "))")
+        self._prefixes: Dict[str, Tuple[str, ...]] = {
+            keyword: tuple(other for other in keywords if keyword.startswith(other)) for keyword in keywords
+        }
+
+    def keywords(self, message: str) -> Set[str]:
+        """Every known keyword occurring in ``message`` (lowercased), possibly inside longer words."""
+        found: Set[str] = set()
+        for longest in set(self._scanner.findall(message)):
+            found.update(self._prefixes[longest])
+        return found
+
+    def scores(self, message: str) -> Dict[str, float]:
+        """Score of every matching category for a lowercased message."""
+        found = self.keywords(message)
+        candidates = set(self._unfiltered)
+        for keyword in found:
+            candidates.update(self._by_keyword.get(keyword, ()))
+
+        totals: Dict[int, float] = {}
+        for pattern_index in sorted(candidates):
+            category_index, compiled, groups = self._patterns[pattern_index]
+            if any(found.isdisjoint(group) for group in groups):
+                continue
+            if compiled.search(message):
+                weight = sum(max(self._weights[keyword] for keyword in group & found) for group in groups)
+                totals[category_index] = totals.get(category_index, 0.0) + (weight or 1.0)
+        return {self.categories[index]: score for index, score in sorted(totals.items())}
+
+    def best(self, message: str) -> Optional[str]:
+        """Best-scoring category for a lowercased message, or None."""
+        scores = self.scores(message)
+        # max() keeps the first of equal scores, i.e. knowledge base order.
+        return max(scores, key=scores.__getitem__) if scores else None
+
+
+def first_match(knowledge_base: Dict[str, Dict[str, Any]], message: str) -> Optional[str]:
+    """The previous behaviour: first category in order with any matching pattern."""
+    for category, data in knowledge_base.items():
+        for pattern in data["patterns"]:
+            if re.search(pattern, message, re.IGNORECASE):
+                return category
+    return None
+
+
+BENCHMARK_MESSAGES: Tuple[str, ...] = (
+    "hola",
+    "hola, como estas?",
+    "como puedo crear un mundo de fantasia",
+    "quiero generar un nivel con dragones",
+    "donde puedo guardar mi partida",
+    "como veo mis logros",
+    "quiero subir un modelo 3d personalizado",
+    "como funciona el combate",
+    "que habilidades tiene mi personaje",
+    "como uso las pociones del inventario",
+    "funciona con oculus quest?",
+    "quiero explorar mundos de la comunidad",
+    "los objetos se pueden romper?",
+    "como entro al leaderboard",
+    "no entiendo nada, ayuda",
+    "gracias!",
+    "adios, nos vemos",
+    "que temas hay disponibles",
+    "en que plataformas puedo jugar",
+    "como exporto el mundo a gltf",
+    "quiero jugar online con amigos",
+    "soy principiante, que dificultad elijo",
+    "cuantos biomas tiene un mundo",
+    "que hacen los npcs",
+    "que tipos de enemigos hay",
+    "como consigo armas y armaduras",
+    "como desbloquear el arbol de habilidades",
+    "como completar misiones",
+    "como craftear armas",
+    "como ganar monedas rapido",
+    "como subir mi reputacion con las facciones",
+    "puedo tener una mascota?",
+    "que clases hay, guerrero o mago?",
+    "cuando es el proximo festival",
+    "como me uno a un clan",
+    "quiero vender items a otros jugadores",
+    "donde veo mis estadisticas",
+    "hay modo daltonismo?",
+    "puedo usar una plantilla",
+    "tengo mucho lag, como mejorar los fps",
+    "el cielo es azul",
+    "me gusta la pizza con piña",
+    "asdf qwer zxcv",
+    "cual es la capital de francia",
+)
+
+
+if __name__ == "__main__":
+    # Per-message cost of the old first-match scan versus the compiled matcher
+    # over a corpus of chat messages, and how many answers changed.
+    import sys
+    import time
+
+    from local_ai import local_assistant
+
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    knowledge_base = local_assistant.knowledge_base
+    matcher = IntentMatcher(knowledge_base)
+    messages = [message.lower().strip() for message in BENCHMARK_MESSAGES]
+
+    for message in messages:
+        # The prefilter must never hide a pattern that matches.
+        expected = {
+            category
+            for category, data in knowledge_base.items()
+            if any(re.search(pattern, message, re.IGNORECASE) for pattern in data["patterns"])
+        }
+        assert set(matcher.scores(message)) == expected, message
+
+    for label, fn in (
+        ("first match", lambda message: first_match(knowledge_base, message)),
+        ("compiled", matcher.best),
+    ):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for message in messages:
+                fn(message)
+        elapsed = time.perf_counter() - started
+        print(f"{label:12s}: {elapsed / (rounds * len(messages)) * 1e6:8.2f} us/message")
+
+    changed = [
+        (message, first_match(knowledge_base, message), matcher.best(message))
+        for message in messages
+        if first_match(knowledge_base, message) != matcher.best(message)
+    ]
+    print(f"{len(changed)} of {len(messages)} messages now resolve to a better-scoring intent:")
+    for message, before, after in changed:
+        print(f"  {message!r}: {before} -> {after}")
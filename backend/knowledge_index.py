@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import heapq
+import math
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+DEFAULT_TOP_K = 5
+# Share of the best score a query could reach (see KnowledgeIndex.search).
+DEFAULT_MIN_CONFIDENCE = 0.35
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Accent-folded Spanish stopwords; question words carry no topic.
+STOPWORDS = frozenset(
+    """
+    a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bien cada como con contra cual cuales
+    cuando cuanto cuantos de del desde donde dos e el ella ellas ellos en entre era eres es esa esas ese eso esos
+    esta estan estar estas este esto estos estoy fue ha hay hasta la las le les lo los mas me mi mis mucho muchos
+    muy nada ni no nos nosotros o otra otras otro otros para pero poco por porque puede pueden puedo que quien
+    quienes se sea ser si sin sobre solo son soy su sus tambien te tengo ti tiene tienen tu tus un una uno unos
+    y ya yo
+    """.split()
+)
+
+# Longest first; only removed when at least MIN_STEM characters remain.
+_SUFFIXES = tuple(
+    sorted(
+        """
+        amientos imientos amiento imiento aciones uciones adoras adores ancias logias encias idades amente mente
+        acion ucion adora ador ancia logia encia idad ismos istas ismo ista ables ibles able ible osos osas oso osa
+        ivas ivos iva ivo aremos eremos iremos ariamos ando iendo ados idos adas idas aron ieron aban aran eran iran
+        ado ido ada ida ar er ir es as os a e o s
+        """.split(),
+        key=len,
+        reverse=True,
+    )
+)
+MIN_STEM = 3
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents ("Próxima Misión" -> "proxima mision"; ñ becomes n)."""
+    # Only [a-z0-9] survives tokenizing, so dropping every non-ASCII code point is enough.
+    return unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+
+
+@lru_cache(maxsize=8192)
+def stem(word: str) -> str:
+    """Light Spanish stemmer for folded words: strips one plural, verb or derivational suffix.
+
+    Cruder than Snowball but enough to conflate "crear", "creando" and
+    "crea", or "mascota" and "mascotas".
+    """
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[: -len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Folded, stemmed terms of ``text`` without stopwords."""
+    return [stem(word) for word in _WORD.findall(fold(text)) if len(word) > 1 and word not in STOPWORDS]
+
+
+class Hit(NamedTuple):
+    doc_id: str
+    score: float
+    # Score over the best score any document could reach for this query, 0..1.
+    confidence: float
+    text: str
+    source: str
+
+
+class KnowledgeIndex:
+    """In-memory BM25 inverted index.
+
+    Documents are added with :meth:`add` and the postings are built once by
+    :meth:`build`. The BM25 weight of every (term, document) pair is
+    precomputed, so a query is a sparse dot product over the postings of its
+    terms.
+    """
+
+    def __init__(self, k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> None:
+        self.k1 = k1
+        self.b = b
+        self._docs: List[Tuple[str, str, str]] = []  # (doc_id, text, source)
+        self._terms: List[List[str]] = []
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        self._max_weight: Dict[str, float] = {}
+        self._unknown_weight = 0.0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc_id: str, text: str, source: str = "", indexed_text: Optional[str] = None) -> None:
+        """Add a document; ``indexed_text`` (default ``text``) is what queries match against."""
+        self._docs.append((doc_id, text, source))
+        self._terms.append(tokenize(indexed_text if indexed_text is not None else text))
+
+    def build(self) -> "KnowledgeIndex":
+        count = len(self._terms)
+        average_length = (sum(len(terms) for terms in self._terms) / count) if count else 0.0
+        frequencies: List[Dict[str, int]] = []
+        document_frequency: Dict[str, int] = {}
+        for terms in self._terms:
+            tf: Dict[str, int] = {}
+            for term in terms:
+                tf[term] = tf.get(term, 0) + 1
+            frequencies.append(tf)
+            for term in tf:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for index, tf in enumerate(frequencies):
+            norm = self.k1 * (1 - self.b + self.b * len(self._terms[index]) / (average_length or 1.0))
+            for term, freq in tf.items():
+                idf = math.log(1 + (count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                postings.setdefault(term, []).append((index, idf * freq * (self.k1 + 1) / (freq + norm)))
+        self._postings = postings
+        self._max_weight = {term: max(weight for _, weight in posting) for term, posting in postings.items()}
+        # Words the index has never seen still count against confidence.
+        self._unknown_weight = (sum(self._max_weight.values()) / len(self._max_weight)) if self._max_weight else 0.0
+        return self
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K) -> List[Hit]:
+        """Top ``k`` documents for ``query``, best first.
+
+        Confidence is the score divided by the sum of the highest weight each
+        query term reaches in any document (unknown words use the average), so
+        it drops for queries that are only partly about the indexed content.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        scores: Dict[int, float] = {}
+        for term in terms:
+            for index, weight in self._postings.get(term, ()):
+                scores[index] = scores.get(index, 0.0) + weight
+        if not scores:
+            return []
+        ceiling = sum(self._max_weight.get(term, self._unknown_weight) for term in terms)
+        hits = []
+        for index, score in heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0])):
+            doc_id, text, source = self._docs[index]
+            hits.append(Hit(doc_id, score, min(1.0, score / ceiling), text, source))
+        return hits
+
+    def best(self, query: str, min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> Optional[Hit]:
+        """The top hit if its confidence reaches ``min_confidence``."""
+        hits = self.search(query, 1)
+        if hits and hits[0].confidence >= min_confidence:
+            return hits[0]
+        return None
+
+
+if __name__ == "__main__":
+    # Query latency over the chat corpus used for the intent matcher, and
+    # what each message resolves to in LocalAI (retrieval or regex fallback).
+    import sys
+    import time
+
+    from intent_matcher import BENCHMARK_MESSAGES
+    from local_ai import local_assistant
+
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    index = local_assistant.knowledge_index
+    print(f"{len(index)} documents, {len(index._postings)} terms")
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for message in BENCHMARK_MESSAGES:
+            index.search(message)
+    elapsed = time.perf_counter() - started
+    print(f"search top-{DEFAULT_TOP_K}: {elapsed / (rounds * len(BENCHMARK_MESSAGES)) * 1e6:8.2f} us/query")
+
+    for message in BENCHMARK_MESSAGES:
+        category = local_assistant.intent_matcher.best(message.lower())
+        hit = local_assistant.retrieve(message.lower(), category)
+        answer = f"{hit.doc_id} ({hit.confidence:.2f})" if hit is not None else f"fallback -> {category}"
+        print(f"  {message!r:50s} {answer}")
@@ -0,0 +1,430 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sorted_keys import SortedKeys
+
+PERIODS = ("all", "daily", "weekly")
+DEFAULT_FLUSH_INTERVAL = 2.0
+# Daily and weekly windows kept in memory per world: the current one and the one before.
+DEFAULT_KEEP_WINDOWS = 2
+DEFAULT_TOP = 10
+DEFAULT_RADIUS = 5
+# Scores accepted by one POST /leaderboards/scores call.
+DEFAULT_BATCH_LIMIT = 1000
+
+UPSERT_SQL = """
+    INSERT INTO leaderboard_best
+        (world_id, board, user_id, username, score, completed_missions, play_time, achieved_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (world_id, board, user_id) DO UPDATE SET
+        username = excluded.username,
+        score = excluded.score,
+        completed_missions = excluded.completed_missions,
+        play_time = excluded.play_time,
+        achieved_at = excluded.achieved_at
+    WHERE excluded.score > leaderboard_best.score
+"""
+
+# (world_id, board, user_id, username, score, completed_missions, play_time, achieved_at)
+BestRow = Tuple[str, str, str, str, int, int, int, str]
+# (world_id, user_id, username, score, completed_missions, play_time)
+Score = Tuple[str, str, str, int, int, int]
+
+
+class Entry(NamedTuple):
+    user_id: str
+    username: str
+    score: int
+    completed_missions: int
+    play_time: int
+    # When the score was first reached; earlier wins ties.
+    achieved_at: str
+
+
+def board_name(period: str, at: Optional[datetime] = None) -> str:
+    """Board holding a period's scores at ``at`` (UTC now by default): "all", "daily:2026-10-17" or "weekly:2026-W42"."""
+    if period == "all":
+        return "all"
+    at = at or datetime.utcnow()
+    if period == "daily":
+        return f"daily:{at:%Y-%m-%d}"
+    if period == "weekly":
+        year, week, _ = at.isocalendar()
+        return f"weekly:{year}-W{week:02d}"
+    raise ValueError(f"Unknown leaderboard period: {period}")
+
+
+def current_boards(keep_windows: int = DEFAULT_KEEP_WINDOWS, at: Optional[datetime] = None) -> List[str]:
+    """Every board the engine keeps in memory at ``at``."""
+    at = at or datetime.utcnow()
+    boards = ["all"]
+    for back in range(keep_windows):
+        boards.append(board_name("daily", at - timedelta(days=back)))
+        boards.append(board_name("weekly", at - timedelta(weeks=back)))
+    return boards
+
+
+def _key(entry: Entry) -> Tuple[int, str, str]:
+    return (-entry.score, entry.achieved_at, entry.user_id)
+
+
+class Board:
+    """Best entry per user on one board, ranked by score (earlier achievement first on ties).
+
+    Rank, top-N and neighbourhood queries are O(log n + results) through
+    the order statistics of :class:`SortedKeys`.
+    """
+
+    def __init__(self) -> None:
+        self.entries: Dict[str, Entry] = {}
+        self.ranking = SortedKeys()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def submit(self, entry: Entry) -> bool:
+        """Keep ``entry`` if it beats the user's best; returns True when it did."""
+        previous = self.entries.get(entry.user_id)
+        if previous is not None:
+            if entry.score <= previous.score:
+                return False
+            self.ranking.remove(_key(previous))
+        self.entries[entry.user_id] = entry
+        self.ranking.add(_key(entry))
+        return True
+
+    def rank(self, user_id: str) -> Optional[int]:
+        """1-based rank of the user, or None when they have no score here."""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        return self.ranking.rank(_key(entry)) + 1
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, Entry]]:
+        rows = []
+        for position, key in enumerate(self.ranking.ascending(offset), offset + 1):
+            rows.append((position, self.entries[key[2]]))
+            if len(rows) == limit:
+                break
+        return rows
+
+
+def _row(rank: int, entry: Entry) -> Dict[str, Any]:
+    return {
+        "rank": rank,
+        "user_id": entry.user_id,
+        "username": entry.username,
+        "score": entry.score,
+        "completed_missions": entry.completed_missions,
+        "play_time": entry.play_time,
+        "created_at": entry.achieved_at,
+    }
+
+
+class LeaderboardEngine:
+    """Per-world leaderboards with all-time, daily and weekly boards.
+
+    Submissions only change memory; improved bests are marked dirty and a
+    background thread hands them to ``persist`` every ``flush_interval``
+    seconds (a failed flush keeps them for the next one, and :meth:`stop`
+    flushes the rest). Daily and weekly boards are keyed by their window,
+    so a new day or week starts an empty board; only the last
+    ``keep_windows`` windows stay in memory.
+    """
+
+    def __init__(
+        self,
+        persist: Callable[[List[BestRow]], None],
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        keep_windows: int = DEFAULT_KEEP_WINDOWS,
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.keep_windows = keep_windows
+        self._persist = persist
+        self._boards: Dict[Tuple[str, str], Board] = {}
+        # (world_id, period) -> windows in memory, oldest first.
+        self._windows: Dict[Tuple[str, str], List[str]] = {}
+        self._dirty: Dict[Tuple[str, str, str], Entry] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._submissions = 0
+        self._improvements = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._rows_flushed = 0
+        self._flush_total = 0.0
+        self._last_error: Optional[str] = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="datashark-leaderboards", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the flush thread and persist every pending best."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            thread.join(timeout)
+        self.flush()
+
+    def load(self, rows: Iterable[Sequence[Any]]) -> int:
+        """Fill boards from persisted ``BestRow`` rows; returns the entries loaded."""
+        loaded = 0
+        with self._lock:
+            for world_id, board, user_id, username, score, missions, play_time, achieved_at in rows:
+                entry = Entry(user_id, username, int(score), int(missions or 0), int(play_time or 0), achieved_at)
+                if self._board(world_id, board).submit(entry):
+                    loaded += 1
+        return loaded
+
+    def submit(
+        self,
+        world_id: str,
+        user_id: str,
+        username: str,
+        score: int,
+        completed_missions: int = 0,
+        play_time: int = 0,
+        at: Optional[datetime] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Record a score on every period's board; returns best score, rank and whether it improved, per period."""
+        return self.submit_many([(world_id, user_id, username, score, completed_missions, play_time)], at)[0]
+
+    def submit_many(self, scores: Sequence[Score], at: Optional[datetime] = None) -> List[Dict[str, Dict[str, Any]]]:
+        """:meth:`submit` for each score under one lock, all stamped ``at``; results in the same order."""
+        at = at or datetime.utcnow()
+        achieved_at = at.isoformat() + "Z"
+        names = [(period, board_name(period, at)) for period in PERIODS]
+        results: List[Dict[str, Dict[str, Any]]] = []
+        with self._lock:
+            for world_id, user_id, username, score, completed_missions, play_time in scores:
+                entry = Entry(user_id, username, score, completed_missions, play_time, achieved_at)
+                self._submissions += 1
+                result: Dict[str, Dict[str, Any]] = {}
+                for period, name in names:
+                    board = self._board(world_id, name)
+                    improved = board.submit(entry)
+                    if improved:
+                        self._improvements += 1
+                        self._dirty[(world_id, name, user_id)] = entry
+                    result[period] = {
+                        "best_score": board.entries[user_id].score,
+                        "rank": board.rank(user_id),
+                        "improved": improved,
+                    }
+                results.append(result)
+        return results
+
+    def top(
+        self, world_id: str, period: str = "all", limit: int = DEFAULT_TOP, offset: int = 0
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """(entries on the board, rows ``offset`` .. ``offset + limit`` in rank order)."""
+        with self._lock:
+            board = self._boards.get((world_id, board_name(period)))
+            if board is None:
+                return 0, []
+            return len(board), [_row(rank, entry) for rank, entry in board.page(offset, limit)]
+
+    def around(
+        self, world_id: str, user_id: str, period: str = "all", radius: int = DEFAULT_RADIUS
+    ) -> Optional[Dict[str, Any]]:
+        """The user's rank and entry plus up to ``radius`` entries on each side, or None when unranked."""
+        with self._lock:
+            board = self._boards.get((world_id, board_name(period)))
+            rank = board.rank(user_id) if board is not None else None
+            if board is None or rank is None:
+                return None
+            start = max(0, rank - 1 - radius)
+            return {
+                "rank": rank,
+                "total": len(board),
+                "entry": _row(rank, board.entries[user_id]),
+                "around": [_row(position, entry) for position, entry in board.page(start, rank - start + radius)],
+            }
+
+    def flush(self, keys: Optional[Iterable[Tuple[str, str, str]]] = None) -> int:
+        """Persist the dirty bests now; returns rows written.
+
+        With ``keys`` (``(world_id, board, user_id)``), only those of them
+        still dirty are written and the rest wait for the next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if keys is None:
+                    dirty, self._dirty = self._dirty, {}
+                else:
+                    dirty = {key: self._dirty.pop(key) for key in set(keys) if key in self._dirty}
+            if not dirty:
+                return 0
+            rows: List[BestRow] = [
+                (world_id, board, user_id, *entry[1:]) for (world_id, board, user_id), entry in dirty.items()
+            ]
+            started = time.perf_counter()
+            try:
+                self._persist(rows)
+            except Exception as exc:
+                with self._lock:
+                    for key, entry in dirty.items():
+                        # A newer best may have been marked while this flush ran.
+                        current = self._dirty.get(key)
+                        if current is None or current.score < entry.score:
+                            self._dirty[key] = entry
+                    self._failed_flushes += 1
+                    self._last_error = str(exc)
+                raise
+            with self._lock:
+                self._flushes += 1
+                self._rows_flushed += len(rows)
+                self._flush_total += time.perf_counter() - started
+            return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            flushes = self._flushes
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "boards": len(self._boards),
+                "entries": sum(len(board) for board in self._boards.values()),
+                "submissions": self._submissions,
+                "improvements": self._improvements,
+                "pending_rows": len(self._dirty),
+                "flushes": flushes,
+                "failed_flushes": self._failed_flushes,
+                "rows_flushed": self._rows_flushed,
+                "flush_ms_avg": (self._flush_total / flushes * 1000) if flushes else 0.0,
+                "last_error": self._last_error,
+            }
+
+    def _board(self, world_id: str, name: str) -> Board:
+        board = self._boards.get((world_id, name))
+        if board is not None:
+            return board
+        board = self._boards[(world_id, name)] = Board()
+        if name != "all":
+            period = name.split(":", 1)[0]
+            windows = self._windows.setdefault((world_id, period), [])
+            windows.append(name)
+            windows.sort()
+            while len(windows) > self.keep_windows:
+                # Persisted rows keep the history; memory only holds recent windows.
+                self._boards.pop((world_id, windows.pop(0)), None)
+        return board
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.flush()
+            except Exception:
+                # Recorded in stats(); the rows are retried on the next tick.
+                pass
+
+
+def persist_rows(conn: sqlite3.Connection, rows: List[BestRow]) -> None:
+    """Upsert bests; the WHERE guard keeps a stored score from ever going down."""
+    conn.executemany(UPSERT_SQL, rows)
+
+
+def load_rows(conn: sqlite3.Connection, boards: Sequence[str]) -> List[BestRow]:
+    placeholders = ", ".join("?" for _ in boards)
+    return [
+        tuple(row)
+        for row in conn.execute(
+            f"""SELECT world_id, board, user_id, username, score, completed_missions, play_time, achieved_at
+                FROM leaderboard_best WHERE board IN ({placeholders})""",
+            list(boards),
+        )
+    ]
+
+
+if __name__ == "__main__":
+    # N submissions from U players on one world: ingest rate, rank and
+    # neighbourhood latency, and the flush of the resulting bests, against
+    # the old row-per-submission table answering the same rank question.
+    import os
+    import random
+    import sys
+    import tempfile
+
+    submissions = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    players = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    random.seed(11)
+
+    engine = LeaderboardEngine(lambda rows: None)
+    at = datetime.utcnow()
+    user_ids = [f"user-{i}" for i in range(players)]
+    started = time.perf_counter()
+    for i in range(submissions):
+        user_id = user_ids[random.randrange(players)]
+        engine.submit("world", user_id, user_id, int(random.paretovariate(1.1) * 100), at=at)
+    ingest = time.perf_counter() - started
+    stats = engine.stats()
+    print(f"{submissions} submissions from {players} players: {submissions / ingest:10.0f} submissions/s")
+    print(f"  {stats['entries']} board entries, {stats['improvements']} improved bests")
+
+    samples = random.sample(user_ids, 1000)
+    for label, query in (
+        ("top 10", lambda user_id: engine.top("world")),
+        ("rank", lambda user_id: engine.around("world", user_id, radius=0)),
+        ("around +-5", lambda user_id: engine.around("world", user_id)),
+        ("weekly around", lambda user_id: engine.around("world", user_id, "weekly")),
+    ):
+        started = time.perf_counter()
+        for user_id in samples:
+            query(user_id)
+        print(f"  {label:14s}: {(time.perf_counter() - started) / len(samples) * 1e6:8.1f} us")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "leaderboard.db"))
+        conn.execute(
+            """CREATE TABLE leaderboard_best (world_id TEXT, board TEXT, user_id TEXT, username TEXT, score INTEGER,
+               completed_missions INTEGER, play_time INTEGER, achieved_at TEXT, PRIMARY KEY (world_id, board, user_id))
+               WITHOUT ROWID"""
+        )
+        rows = [
+            (world_id, board, user_id, *entry[1:]) for (world_id, board, user_id), entry in engine._dirty.items()
+        ]
+        started = time.perf_counter()
+        with conn:
+            persist_rows(conn, rows)
+        print(f"  flush {len(rows)} bests: {(time.perf_counter() - started) * 1000:8.0f} ms")
+
+        # The old schema: one row per submission, best per user by GROUP BY.
+        raw = min(submissions, 1_000_000)
+        conn.execute("CREATE TABLE leaderboard (world_id TEXT, user_id TEXT, score INTEGER)")
+        conn.execute("CREATE INDEX idx_leaderboard_world_score ON leaderboard (world_id, score DESC)")
+        with conn:
+            conn.executemany(
+                "INSERT INTO leaderboard VALUES ('world', ?, ?)",
+                (
+                    (user_ids[random.randrange(players)], int(random.paretovariate(1.1) * 100))
+                    for _ in range(raw)
+                ),
+            )
+        rank_sql = """SELECT COUNT(*) + 1 FROM (
+                          SELECT MAX(score) AS best FROM leaderboard WHERE world_id = 'world' GROUP BY user_id
+                      ) WHERE best > ?"""
+        started = time.perf_counter()
+        for score in (100, 1000, 10000):
+            conn.execute(rank_sql, (score,)).fetchone()
+        print(f"  SQL rank over {raw} raw rows: {(time.perf_counter() - started) / 3 * 1000:8.1f} ms")
+        conn.close()
@@ -4,16 +4,26 @@ No requiere APIs externas
 """
 
 import re
-from typing import Dict, List, Any, Optional
+import textwrap
+from typing import Dict, List, Any, Optional, Tuple
 import random
 
+from conversation_memory import ConversationMemory
+from intent_matcher import IntentMatcher, keyword_groups
+from knowledge_index import DEFAULT_MIN_CONFIDENCE, DEFAULT_TOP_K, Hit, KnowledgeIndex
+
 
 class LocalAI:
     """IA local con base de conocimiento predefinida"""
     
     def __init__(self):
         self.knowledge_base = self._init_knowledge_base()
-        self.conversation_context = []
+        self.intent_matcher = IntentMatcher(self.knowledge_base)
+        self.tutorials = self._init_tutorials()
+        self.knowledge_index = self._build_knowledge_index()
+        self.min_confidence = DEFAULT_MIN_CONFIDENCE
+        # Últimos turnos por sesión, para resolver preguntas de seguimiento
+        self.memory = ConversationMemory()
         
     def _init_knowledge_base(self) -> Dict[str, Any]:
         """Base de conocimiento con patrones y respuestas"""
@@ -435,24 +445,39 @@ class LocalAI:
             }
         }
     
-    def get_response(self, user_message: str, context: Optional[Dict] = None) -> str:
+    def get_response(self, user_message: str, context: Optional[Dict] = None, session: Optional[str] = None) -> str:
         """
         Genera respuesta basada en patrones de la base de conocimiento
+        
+        Con ``session`` se recuerdan los últimos turnos y las preguntas de
+        seguimiento ("¿y cuántos hay?") se resuelven con la intención anterior.
         """
         user_message_lower = user_message.lower().strip()
         
-        # Buscar coincidencias en la base de conocimiento
-        for category, data in self.knowledge_base.items():
-            for pattern in data["patterns"]:
-                if re.search(pattern, user_message_lower, re.IGNORECASE):
-                    # Seleccionar respuesta aleatoria de la categoría
-                    response = random.choice(data["responses"])
-                    
-                    # Agregar contexto si está disponible
-                    if context:
-                        response = self._add_context(response, context)
-                    
-                    return response
+        # Categoría con mejor puntuación según los patrones
+        category = self.intent_matcher.best(user_message_lower)
+        
+        # Documento más relevante (respuestas, FAQ y tutoriales) si hay confianza suficiente
+        hit = self.retrieve(user_message_lower, category)
+        if hit is not None:
+            response = hit.text
+            intent = hit.doc_id.split(":")[0]
+        elif category is not None:
+            # Si no, respuesta aleatoria de la categoría
+            response = random.choice(self.knowledge_base[category]["responses"])
+            intent = category
+        else:
+            response, intent = self._follow_up(user_message_lower, session)
+        
+        if session is not None:
+            self.memory.record(session, user_message_lower, response or "", intent)
+        
+        if response is not None:
+            # Agregar contexto si está disponible
+            if context:
+                response = self._add_context(response, context)
+            
+            return response
         
         # Respuesta por defecto si no hay coincidencia
         default_responses = [
@@ -473,9 +498,66 @@ class LocalAI:
         
         return response
     
+    def _follow_up(self, message: str, session: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """Resuelve un mensaje sin coincidencias contra el último tema de la sesión"""
+        previous = self.memory.last_matched(session) if session is not None else None
+        if previous is None:
+            return None, None
+        
+        # El mensaje anterior aporta el tema; el nuevo, el detalle que se pregunta
+        hit = self.retrieve(f"{previous.message} {message}", previous.intent)
+        if hit is not None and hit.text != previous.reply:
+            return hit.text, hit.doc_id.split(":")[0]
+        
+        # "Cuéntame más": otra respuesta de la misma categoría
+        alternatives = [
+            response
+            for response in self.knowledge_base.get(previous.intent, {}).get("responses", [])
+            if response != previous.reply
+        ]
+        if alternatives:
+            return random.choice(alternatives), previous.intent
+        return None, None
+    
+    def retrieve(self, message: str, category: Optional[str] = None) -> Optional[Hit]:
+        """Mejor documento con confianza suficiente; entre ellos, prefiere los de la categoría detectada"""
+        hits = [hit for hit in self.knowledge_index.search(message) if hit.confidence >= self.min_confidence]
+        preferred = [hit for hit in hits if hit.doc_id.split(":")[0] == category]
+        return (preferred or hits or [None])[0]
+    
+    def search(self, query: str, k: int = DEFAULT_TOP_K) -> List[Hit]:
+        """Busca en respuestas, FAQ y tutoriales (BM25, sin APIs externas)"""
+        return self.knowledge_index.search(query, k)
+    
+    def _build_knowledge_index(self) -> KnowledgeIndex:
+        """Índice invertido sobre respuestas, FAQ y secciones de tutoriales"""
+        index = KnowledgeIndex()
+        for category, data in self.knowledge_base.items():
+            # Las palabras clave de los patrones ayudan a encontrar la respuesta
+            keywords = " ".join(
+                keyword for pattern in data["patterns"] for group in keyword_groups(pattern) for keyword in group
+            )
+            for position, response in enumerate(data["responses"]):
+                index.add(f"{category}:{position}", response, "knowledge_base", f"{category} {keywords} {response}")
+        
+        for position, entry in enumerate(self.get_faq()):
+            index.add(f"faq:{position}", entry["a"], "faq", f"{entry['q']} {entry['a']}")
+        
+        for topic, text in self.tutorials.items():
+            sections = [textwrap.dedent(section).strip() for section in re.split(r"\n\s*\n", text)]
+            title = sections[0] if sections else topic
+            for position, section in enumerate(sections[1:], start=1):
+                if section:
+                    index.add(f"tutorial:{topic}:{position}", section, "tutorial", f"{title} {section}")
+        return index.build()
+    
     def get_tutorial(self, topic: str) -> str:
         """Devuelve tutorial específico sobre un tema"""
-        tutorials = {
+        return self.tutorials.get(topic, "Tutorial no disponible. Temas: 'basico', 'avanzado'")
+    
+    def _init_tutorials(self) -> Dict[str, str]:
+        """Tutoriales por tema"""
+        return {
             "basico": """
             📚 TUTORIAL BÁSICO - DataShark
             
@@ -536,8 +618,6 @@ class LocalAI:
             ¡Domina todas las funcionalidades!
             """
         }
-        
-        return tutorials.get(topic, "Tutorial no disponible. Temas: 'basico', 'avanzado'")
     
     def get_faq(self) -> List[Dict[str, str]]:
         """Devuelve lista de preguntas frecuentes"""
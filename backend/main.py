@@ -1,37 +1,136 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import os
 import sqlite3
-from typing import Any, Dict, List, Optional
+import time
+from datetime import datetime
+from typing import Annotated, Any, AsyncIterator, Awaitable, Callable, ContextManager, Dict, List, Optional, Tuple, TypeVar
 from uuid import uuid4
 from pathlib import Path
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request, Query
-from fastapi.responses import Response, HTMLResponse
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field
-from openai import OpenAI
-
-# import collaborative_story_module
-# import error_correction_module
-# import historical_research
-# import learning_guide_module
-# import models_integration
-# import mods_module
-# import multiplayer_module
-# import physics_module
+from pydantic import AnyHttpUrl, BaseModel, Field, TypeAdapter, ValidationError, WithJsonSchema
+
+import ai_gateway
+import browse_rankings
+import collaborative_story_module
+import compression
+import conversation_memory
+import counters
+import generation_batch
+import generation_cache
+import generation_jobs
+import generation_pipeline
+import historical_research
+import leaderboards
+import learning_guide_module
+import migrations
+import models_integration
+import msgpack_codec
+import multiplayer_module
+import physics_module
+import route_queries
+import save_deltas
 import simulation_module
+import streaming
+import world_store
 from utils import now_iso, safe_slug
 from local_ai import local_assistant
+from db_pool import WAL_PRAGMAS, ConnectionPool, read_transaction
+from ai_gateway import ProviderUnavailable
+from db_writer import WriteQueue
+from generation_jobs import QueueFull
+from generation_pipeline import StageError, server_timing
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, decode_cursor, keyset_page, split_page
 
 load_dotenv()
 
+T = TypeVar("T")
+
 DEFAULT_DB_DIR = os.path.join(os.path.expanduser("~"), ".datashark")
 DEFAULT_DB_PATH = os.path.join(DEFAULT_DB_DIR, "database.db")
 DB_PATH = os.getenv("DATASHARK_DB_PATH", DEFAULT_DB_PATH)
+DB_POOL_SIZE = int(os.getenv("DATASHARK_DB_POOL_SIZE", "32"))
+DB_POOL_MAX_AGE = float(os.getenv("DATASHARK_DB_POOL_MAX_AGE", "600"))
+# "wal" (default): WAL journal, tuned PRAGMAs and a single writer thread.
+# "rollback": SQLite defaults, writes run on the request thread.
+DB_MODE = os.getenv("DATASHARK_DB_MODE", "wal").lower()
+if DB_MODE not in ("wal", "rollback"):
+    raise ValueError(f"DATASHARK_DB_MODE must be 'wal' or 'rollback', got {DB_MODE!r}")
+DB_PRAGMAS = WAL_PRAGMAS if DB_MODE == "wal" else {}
+
+db_pool = ConnectionPool(
+    DB_PATH, max_connections=DB_POOL_SIZE, max_age=DB_POOL_MAX_AGE, pragmas=DB_PRAGMAS
+)
+db_writer = WriteQueue(DB_PATH, pragmas=DB_PRAGMAS) if DB_MODE == "wal" else None
+
+# play_count / likes / downloads increments are buffered in memory and
+# flushed in one transaction every DATASHARK_COUNTER_FLUSH_INTERVAL seconds.
+counter_service = counters.CounterService(
+    lambda deltas: _flush_counters(deltas),
+    shards=int(os.getenv("DATASHARK_COUNTER_SHARDS", str(counters.DEFAULT_SHARDS))),
+    interval=float(os.getenv("DATASHARK_COUNTER_FLUSH_INTERVAL", str(counters.DEFAULT_FLUSH_INTERVAL))),
+    max_pending=int(os.getenv("DATASHARK_COUNTER_MAX_PENDING", str(counters.DEFAULT_MAX_PENDING))),
+)
+
+# /browse orderings of the public worlds, kept in memory and updated on
+# publish, unpublish and counter flushes; rebuilt from the database at startup.
+world_rankings = browse_rankings.BrowseRankings(
+    max_details=int(os.getenv("DATASHARK_BROWSE_DETAIL_CACHE", str(browse_rankings.DEFAULT_MAX_DETAILS)))
+)
+
+# Per-world best scores (all-time, daily, weekly) ranked in memory; improved
+# bests are upserted into leaderboard_best every DATASHARK_LEADERBOARD_FLUSH_INTERVAL seconds.
+leaderboard_engine = leaderboards.LeaderboardEngine(
+    lambda rows: _write(lambda conn: leaderboards.persist_rows(conn, rows)),
+    flush_interval=float(
+        os.getenv("DATASHARK_LEADERBOARD_FLUSH_INTERVAL", str(leaderboards.DEFAULT_FLUSH_INTERVAL))
+    ),
+    keep_windows=int(os.getenv("DATASHARK_LEADERBOARD_WINDOWS", str(leaderboards.DEFAULT_KEEP_WINDOWS))),
+)
+
+# Autosaves are stored as JSON-patch deltas on a snapshot, compacted into a new
+# snapshot every DATASHARK_SAVE_COMPACT_EVERY deltas.
+save_store = save_deltas.SaveStore(
+    compact_every=int(os.getenv("DATASHARK_SAVE_COMPACT_EVERY", str(save_deltas.DEFAULT_COMPACT_EVERY))),
+    max_cached=int(os.getenv("DATASHARK_SAVE_CACHE_SIZE", str(save_deltas.DEFAULT_MAX_CACHED))),
+)
+
+# Per-stage timeout for /generate; a stage that exceeds it cancels the rest.
+generation_graph = generation_pipeline.build_generation_graph(
+    float(os.getenv("DATASHARK_STAGE_TIMEOUT", str(generation_pipeline.DEFAULT_STAGE_TIMEOUT)))
+)
+
+# "full" (default): store every generated world's sections.
+# "recipe": store only the normalized request and seed; sections are
+# regenerated on read (through the generation cache).
+WORLD_STORAGE = os.getenv("DATASHARK_WORLD_STORAGE", "full").lower()
+
+# Results of /generate keyed on the normalized request; 0 entries disables the memory tier.
+world_cache = generation_cache.GenerationCache(
+    db_pool.connection,
+    max_entries=int(os.getenv("DATASHARK_GENERATION_CACHE_SIZE", str(generation_cache.DEFAULT_MAX_ENTRIES))),
+    ttl=float(os.getenv("DATASHARK_GENERATION_CACHE_TTL", str(generation_cache.DEFAULT_TTL))),
+    max_disk_entries=int(
+        os.getenv("DATASHARK_GENERATION_CACHE_DISK_SIZE", str(generation_cache.DEFAULT_MAX_DISK_ENTRIES))
+    ),
+)
+
+# Per-session memory of /npc/chat: turns kept per session, sessions kept (LRU) and a size cap.
+local_assistant.memory = conversation_memory.ConversationMemory(
+    max_turns=int(os.getenv("DATASHARK_NPC_MEMORY_TURNS", str(conversation_memory.DEFAULT_MAX_TURNS))),
+    max_sessions=int(os.getenv("DATASHARK_NPC_MEMORY_SESSIONS", str(conversation_memory.DEFAULT_MAX_SESSIONS))),
+    max_bytes=int(os.getenv("DATASHARK_NPC_MEMORY_BYTES", str(conversation_memory.DEFAULT_MAX_BYTES))),
+    idle_ttl=float(os.getenv("DATASHARK_NPC_MEMORY_TTL", str(conversation_memory.DEFAULT_IDLE_TTL))),
+)
 
 app = FastAPI(title="DataShark AI Backend", version="0.1.0")
 app.add_middleware(
@@ -54,16 +153,80 @@ BASE_DIR = Path(__file__).resolve().parents[1]
 
 # Startup event
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     """Initialize database on startup"""
     init_db()
+    if db_writer is not None:
+        db_writer.start()
+    _rebuild_rankings()
+    with _get_connection() as conn:
+        leaderboard_engine.load(leaderboards.load_rows(conn, leaderboards.current_boards(leaderboard_engine.keep_windows)))
+    counter_service.start()
+    leaderboard_engine.start()
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Requeue running jobs, stop batch workers, flush counters, leaderboards and queued writes and close pooled database connections"""
+    await job_queue.stop()
+    batch_generator.close()
+    counter_service.stop()
+    leaderboard_engine.stop()
+    if db_writer is not None:
+        db_writer.stop()
+    db_pool.close_all()
+
+
+def _get_connection() -> ContextManager[sqlite3.Connection]:
+    return db_pool.connection()
+
+
+def _keyset(scope: str, columns: List[str], cursor: Optional[str], limit: int) -> Tuple[str, str, List[Any]]:
+    try:
+        return keyset_page(scope, columns, cursor, limit)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+def _write(job: Callable[[sqlite3.Connection], T]) -> T:
+    """Run a write job on the writer thread, or inline when WAL mode is off."""
+    if db_writer is None:
+        with _get_connection() as conn:
+            return job(conn)
+    return db_writer.run(job)
 
 
-def _get_connection() -> sqlite3.Connection:
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def _flush_counters(deltas: Dict[counters.CounterKey, int]) -> None:
+    """Commit counter deltas, then move the affected public worlds in the /browse rankings"""
+    _write(lambda conn: counters.apply_deltas(conn, deltas))
+    worlds: Dict[str, Tuple[int, int]] = {}
+    for (table, column, row_id), delta in deltas.items():
+        if table == "worlds":
+            plays, likes = worlds.get(row_id, (0, 0))
+            worlds[row_id] = (plays + delta, likes) if column == "play_count" else (plays, likes + delta)
+    world_rankings.add_counts(worlds)
+
+
+def _rebuild_rankings() -> int:
+    # No flush may land between reading the counts and swapping the rankings in.
+    with counter_service.quiesced():
+        with _get_connection() as conn:
+            rows = browse_rankings.load_public_worlds(conn)
+        return world_rankings.rebuild(rows)
+
+
+def _counted(conn: sqlite3.Connection, table: str, column: str, row_id: str) -> Optional[int]:
+    """Stored counter plus the increments not flushed yet, or None when the row does not exist"""
+
+    def load() -> Optional[int]:
+        row = conn.execute(f"SELECT {column} FROM {table} WHERE id = ?", (row_id,)).fetchone()
+        return None if row is None else int(row[0] or 0)
+
+    def merge(stored: Optional[int]) -> Optional[int]:
+        return None if stored is None else stored + counter_service.pending(table, column, row_id)
+
+    return counter_service.read(load, merge)
 
 
 def init_db() -> None:
@@ -83,15 +246,6 @@ def init_db() -> None:
             )
             """
         )
-        columns = [row[1] for row in conn.execute("PRAGMA table_info(worlds)").fetchall()]
-        if "user_id" not in columns:
-            conn.execute("ALTER TABLE worlds ADD COLUMN user_id TEXT")
-        if "is_public" not in columns:
-            conn.execute("ALTER TABLE worlds ADD COLUMN is_public INTEGER DEFAULT 0")
-        if "play_count" not in columns:
-            conn.execute("ALTER TABLE worlds ADD COLUMN play_count INTEGER DEFAULT 0")
-        if "likes" not in columns:
-            conn.execute("ALTER TABLE worlds ADD COLUMN likes INTEGER DEFAULT 0")
         
         conn.execute(
             """
@@ -541,17 +695,35 @@ def init_db() -> None:
             except:
                 pass
         
+        # Schema changes and indexes for tables created above
+        migrations.apply_migrations(conn)
+        compression.ensure_dictionaries(conn)
+        world_cache.prune(conn)
+        
         conn.commit()
 
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1")
 NPC_SYSTEM_PROMPT = os.getenv(
     "OPENAI_NPC_SYSTEM",
     "Eres un asistente NPC para creación de mundos. Responde breve, útil y en español."
     " Ayuda solo con el juego y la narrativa. Si te preguntan algo fuera del juego, redirige al contexto del juego."
 )
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+
+# /ai/generate providers behind one cache, single-flight and per-provider concurrency limits.
+# "stub" answers locally without any API, for tests and offline development.
+AI_PROVIDER_CONCURRENCY = int(os.getenv("DATASHARK_AI_CONCURRENCY", str(ai_gateway.DEFAULT_CONCURRENCY)))
+ai_providers: Dict[str, ai_gateway.Provider] = {
+    name: ai_gateway.build_provider(name, dict(os.environ), AI_PROVIDER_CONCURRENCY) for name in ai_gateway.PROVIDER_SPECS
+}
+ai_providers["stub"] = ai_gateway.StubProvider(
+    float(os.getenv("DATASHARK_AI_STUB_LATENCY", "0")), float(os.getenv("DATASHARK_AI_STUB_TOKEN_LATENCY", "0"))
+)
+provider_gateway = ai_gateway.ProviderGateway(
+    ai_providers,
+    cache_size=int(os.getenv("DATASHARK_AI_CACHE_SIZE", str(ai_gateway.DEFAULT_CACHE_SIZE))),
+    cache_ttl=float(os.getenv("DATASHARK_AI_CACHE_TTL", str(ai_gateway.DEFAULT_CACHE_TTL))),
+    timeout=float(os.getenv("DATASHARK_AI_TIMEOUT", str(ai_gateway.DEFAULT_TIMEOUT))),
+)
 
 
 class GenerationRequest(BaseModel):
@@ -562,12 +734,15 @@ class GenerationRequest(BaseModel):
     multiplayer_mode: Optional[str] = None
     player_skill_level: Optional[str] = None
     user_id: Optional[str] = None
+    # Same request + seed always yields the same world; derived from the request when omitted.
+    seed: Optional[int] = Field(default=None, ge=0, le=2**63 - 1)
 
 
 class GenerationResponse(BaseModel):
     world_id: str
     summary: str
     payload: Dict[str, Any]
+    seed: Optional[int] = None
 
 
 class UserRegister(BaseModel):
@@ -590,6 +765,11 @@ class NpcChatRequest(BaseModel):
     message: str = Field(..., min_length=1)
     history: List[Dict[str, str]] = Field(default_factory=list)
     world_summary: Optional[str] = None
+    # Conversation memory key; falls back to user_id, and without either the chat is stateless.
+    session_id: Optional[str] = Field(default=None, max_length=128)
+    user_id: Optional[str] = None
+    # /npc/chat/stream only: answer with this /ai/generate provider instead of the local assistant.
+    provider: Optional[str] = None
 
 
 class NpcChatResponse(BaseModel):
@@ -609,6 +789,17 @@ class GameSaveRequest(BaseModel):
 class GameSaveResponse(BaseModel):
     save_id: str
     message: str
+    # Pass back as base_version to PATCH /saves/{save_id} with only what changed.
+    version: Optional[int] = None
+
+
+class GameSavePatch(BaseModel):
+    base_version: int = Field(ge=1)
+    # RFC 6902 operations (add, remove, replace) on {"game_state": ..., "player_stats": ...}.
+    patch: List[Dict[str, Any]] = Field(default_factory=list)
+    slot_name: Optional[str] = None
+    progress_percentage: Optional[float] = Field(default=None, ge=0.0, le=100.0)
+    play_time: Optional[int] = Field(default=None, ge=0)
 
 
 class AchievementResponse(BaseModel):
@@ -751,6 +942,26 @@ def health() -> Dict[str, str]:
     return {"status": "ok", "timestamp": now_iso()}
 
 
+@app.get("/health/db")
+def db_health() -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "mode": DB_MODE,
+        "pool": db_pool.stats(),
+        "writer": db_writer.stats() if db_writer is not None else None,
+    }
+
+
+@app.get("/health/counters")
+def counters_health() -> Dict[str, Any]:
+    return {"status": "ok", "counters": counter_service.stats()}
+
+
+@app.get("/health/cache")
+def cache_health() -> Dict[str, Any]:
+    return {"status": "ok", "generation": world_cache.stats()}
+
+
 @app.get("/")
 def root() -> Dict[str, str]:
     return {
@@ -851,91 +1062,398 @@ def sample_payload() -> Dict[str, Any]:
     }
 
 
+def _prepare_generation(request: GenerationRequest) -> Tuple[int, str, str]:
+    """Return (seed, recipe, cache key) for a request"""
+    fields = request.model_dump()
+    seed = request.seed if request.seed is not None else generation_cache.derive_seed(fields)
+    world_recipe = generation_cache.recipe(fields, seed)
+    return seed, world_recipe, generation_cache.recipe_key(world_recipe)
+
+
 @app.post("/generate", response_model=GenerationResponse)
-def generate_world(request: GenerationRequest) -> GenerationResponse:
-    research = historical_research.gather_context(request.prompt, request.theme)
-    base_world = models_integration.generate_world(
-        prompt=request.prompt,
-        research_context=research,
-        platforms=request.platforms,
-        enable_ar_vr=request.enable_ar_vr,
+async def generate_world(request: GenerationRequest, response: Response, http_request: Request) -> GenerationResponse:
+    seed, world_recipe, cache_key = _prepare_generation(request)
+    cached, source = await run_in_threadpool(world_cache.get, cache_key)
+    response.headers["X-Generation-Cache"] = source
+    if cached is not None:
+        merged_payload = json.loads(cached)
+    else:
+        recipe_fields, _ = generation_cache.recipe_fields(world_recipe)
+        try:
+            results, timings = await _unless_disconnected(
+                http_request, generation_graph.run({"fields": recipe_fields, "seed": seed})
+            )
+        except StageError as exc:
+            raise HTTPException(status_code=504 if exc.timed_out else 500, detail=str(exc))
+        response.headers["Server-Timing"] = server_timing(timings)
+        merged_payload = generation_pipeline.assemble_payload(results)
+
+    world_id, summary = await run_in_threadpool(
+        _store_generated_world, request, seed, world_recipe, merged_payload, None if cached is not None else cache_key
     )
-    simulations = simulation_module.simulate_systems(base_world)
-    story = collaborative_story_module.build_story(base_world)
-    tutorial = learning_guide_module.create_tutorial(base_world, request.player_skill_level)
-    physics_profile = physics_module.optimize_physics(base_world, request.platforms)
-    multiplayer = multiplayer_module.configure_multiplayer(base_world, request.multiplayer_mode)
-
-    merged_payload: Dict[str, Any] = {
-        "world": base_world,
-        "research": research,
-        "simulations": simulations,
-        "story": story,
-        "tutorial": tutorial,
-        "physics": physics_profile,
-        "multiplayer": multiplayer,
-    }
+    return GenerationResponse(world_id=world_id, summary=summary, payload=merged_payload, seed=seed)
+
+
+@app.post("/generate/stream")
+async def generate_world_stream(request: GenerationRequest, http_request: Request) -> StreamingResponse:
+    """Like /generate, but streams sections as NDJSON (or SSE with Accept: text/event-stream) as stages finish"""
+    sse = streaming.wants_sse(http_request.headers.get("accept"))
+    seed, world_recipe, cache_key = _prepare_generation(request)
+    cached, source = await run_in_threadpool(world_cache.get, cache_key)
+
+    async def events() -> AsyncIterator[str]:
+        yield streaming.encode_event("start", {"seed": seed, "cache": source}, sse)
+        timings: Dict[str, float] = {}
+        if cached is not None:
+            results = json.loads(cached)
+            for stage in generation_pipeline.PAYLOAD_ORDER:
+                for section, value in generation_pipeline.stage_sections(stage, results[stage]):
+                    yield streaming.encode_event("section", {"section": section, "data": value}, sse)
+        else:
+            finished: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+            recipe_fields, _ = generation_cache.recipe_fields(world_recipe)
+            run = asyncio.ensure_future(
+                generation_graph.run(
+                    {"fields": recipe_fields, "seed": seed},
+                    on_stage=lambda name, result: finished.put_nowait((name, result)),
+                )
+            )
+            try:
+                while not (run.done() and finished.empty()):
+                    getter = asyncio.ensure_future(finished.get())
+                    await asyncio.wait({getter, run}, return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        continue
+                    stage, result = getter.result()
+                    for section, value in generation_pipeline.stage_sections(stage, result):
+                        yield streaming.encode_event("section", {"section": section, "data": value}, sse)
+                results, timings = run.result()
+            except StageError as exc:
+                yield streaming.encode_event("error", {"detail": str(exc), "stage": exc.stage}, sse)
+                return
+            finally:
+                # Client went away or a stage failed: stop the remaining stages.
+                run.cancel()
+
+        merged_payload = generation_pipeline.assemble_payload(results)
+        world_id, summary = await run_in_threadpool(
+            _store_generated_world, request, seed, world_recipe, merged_payload, None if cached is not None else cache_key
+        )
+        yield streaming.encode_event("done", {"world_id": world_id, "summary": summary, "timings": timings}, sse)
 
-    corrections = error_correction_module.validate_world(merged_payload)
-    merged_payload["corrections"] = corrections
-    merged_payload["mods"] = mods_module.generate_mods(merged_payload)
+    return StreamingResponse(
+        events(),
+        media_type=streaming.SSE if sse else streaming.NDJSON,
+        headers={**streaming.STREAM_HEADERS, "X-Generation-Cache": source},
+    )
 
-    summary = merged_payload["world"]["summary"]
-    world_id = f"{safe_slug(summary)}-{uuid4().hex[:8]}"
 
-    with _get_connection() as conn:
-        conn.execute(
-            "INSERT INTO worlds (id, prompt, summary, payload, created_at, user_id) VALUES (?, ?, ?, ?, ?, ?)",
-            (
-                world_id,
-                request.prompt,
-                summary,
-                json.dumps(merged_payload),
-                now_iso(),
-                request.user_id,
-            ),
+# ============ GENERATION JOB ENDPOINTS ============
+
+class GenerationJobRequest(GenerationRequest):
+    priority: int = Field(default=0, ge=-10, le=10)
+    # Must resolve to a public address; checked again before each delivery.
+    webhook_url: Optional[AnyHttpUrl] = None
+
+
+async def _run_generation_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Job body for the background queue: the /generate logic without an HTTP response"""
+    request = GenerationRequest(**payload)
+    seed, world_recipe, cache_key = _prepare_generation(request)
+    cached, _ = await run_in_threadpool(world_cache.get, cache_key)
+    if cached is not None:
+        merged_payload = json.loads(cached)
+    else:
+        recipe_fields, _ = generation_cache.recipe_fields(world_recipe)
+        results, _ = await generation_graph.run({"fields": recipe_fields, "seed": seed})
+        merged_payload = generation_pipeline.assemble_payload(results)
+
+    world_id, summary = await run_in_threadpool(
+        _store_generated_world, request, seed, world_recipe, merged_payload, None if cached is not None else cache_key
+    )
+    return {"world_id": world_id, "summary": summary, "seed": seed}
+
+
+job_queue = generation_jobs.JobQueue(
+    db_pool.connection,
+    _write,
+    _run_generation_job,
+    workers=int(os.getenv("DATASHARK_JOB_WORKERS", str(generation_jobs.DEFAULT_WORKERS))),
+    max_pending=int(os.getenv("DATASHARK_JOB_QUEUE_LIMIT", str(generation_jobs.DEFAULT_QUEUE_LIMIT))),
+    max_attempts=int(os.getenv("DATASHARK_JOB_MAX_ATTEMPTS", str(generation_jobs.DEFAULT_MAX_ATTEMPTS))),
+    follow_webhook_redirects=os.getenv("DATASHARK_WEBHOOK_FOLLOW_REDIRECTS", "0") == "1",
+)
+
+
+@app.post("/generate/jobs", status_code=202)
+def create_generation_job(job: GenerationJobRequest) -> Dict[str, Any]:
+    """Queue a world generation; poll /generate/jobs/{job_id} or wait for the webhook"""
+    request = job.model_dump(exclude={"priority", "webhook_url"})
+    webhook_url = str(job.webhook_url) if job.webhook_url is not None else None
+    try:
+        job_id = job_queue.submit(request, priority=job.priority, webhook_url=webhook_url)
+    except QueueFull as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return {"job_id": job_id, "status": generation_jobs.QUEUED, "status_url": f"/generate/jobs/{job_id}"}
+
+
+@app.get("/generate/jobs/{job_id}")
+def get_generation_job(job_id: str) -> Dict[str, Any]:
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/generate/jobs/{job_id}/cancel")
+def cancel_generation_job(job_id: str) -> Dict[str, Any]:
+    status = job_queue.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, "status": status}
+
+
+@app.get("/health/jobs")
+def jobs_health() -> Dict[str, Any]:
+    return {"status": "ok", "jobs": job_queue.stats()}
+
+
+# ============ BATCH GENERATION ENDPOINT ============
+
+BATCH_LIMIT = int(os.getenv("DATASHARK_BATCH_LIMIT", str(generation_batch.DEFAULT_BATCH_LIMIT)))
+# Worker processes for /generate/batch; 0 generates on the request thread.
+batch_generator = generation_batch.BatchGenerator(
+    int(os.environ["DATASHARK_BATCH_WORKERS"]) if "DATASHARK_BATCH_WORKERS" in os.environ else None
+)
+
+
+class GenerationBatchRequest(BaseModel):
+    # Items are validated one by one so a bad item does not reject the whole batch.
+    requests: List[Dict[str, Any]] = Field(..., min_length=1, max_length=BATCH_LIMIT)
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" if error["loc"] else error["msg"]
+        for error in exc.errors()
+    )
+
+
+@app.post("/generate/batch")
+async def generate_world_batch(batch: GenerationBatchRequest) -> Dict[str, Any]:
+    """Generate many worlds in one call; results are reported per item in request order"""
+    items: List[Dict[str, Any]] = [{"index": index} for index in range(len(batch.requests))]
+    prepared: List[Tuple[int, GenerationRequest, int, str, str]] = []
+    for index, raw in enumerate(batch.requests):
+        try:
+            request = GenerationRequest.model_validate(raw)
+        except ValidationError as exc:
+            items[index]["error"] = _validation_message(exc)
+            continue
+        prepared.append((index, request, *_prepare_generation(request)))
+
+    # Equal requests in one batch are generated once.
+    keys = list(dict.fromkeys(key for *_, key in prepared))
+    lookups = await run_in_threadpool(lambda: [world_cache.get(key)[0] for key in keys])
+    payloads: Dict[str, Dict[str, Any]] = {key: json.loads(body) for key, body in zip(keys, lookups) if body is not None}
+    cache_hits = len(payloads)
+    recipes = {key: world_recipe for *_, world_recipe, key in prepared}
+    misses = [key for key in keys if key not in payloads]
+    errors: Dict[str, str] = {}
+    for key, (payload, error) in zip(misses, await run_in_threadpool(batch_generator.run, [recipes[key] for key in misses])):
+        if payload is None:
+            errors[key] = error or "Generation failed"
+        else:
+            payloads[key] = payload
+
+    to_store = []
+    stored_items = []
+    fresh = set(misses)
+    for index, request, seed, world_recipe, key in prepared:
+        if key in errors:
+            items[index]["error"] = errors[key]
+            continue
+        # Only the first copy of a freshly generated payload goes into the cache.
+        to_store.append((request, seed, world_recipe, payloads[key], key if key in fresh else None))
+        stored_items.append((items[index], seed))
+        fresh.discard(key)
+    stored = await run_in_threadpool(_store_generated_worlds, to_store)
+    for (item, seed), (world_id, summary) in zip(stored_items, stored):
+        item.update(world_id=world_id, summary=summary, seed=seed)
+
+    return {
+        "count": len(items),
+        "succeeded": len(stored),
+        "failed": len(items) - len(stored),
+        "cache_hits": cache_hits,
+        "items": items,
+    }
+
+
+async def _unless_disconnected(http_request: Request, work: Awaitable[T], poll: float = 0.25) -> T:
+    """Await work, cancelling it if the client goes away first"""
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        task.cancel()
+
+
+def _store_generated_world(
+    request: GenerationRequest,
+    seed: int,
+    world_recipe: str,
+    merged_payload: Dict[str, Any],
+    cache_key: Optional[str],
+) -> Tuple[str, str]:
+    """Insert a generated world; with a cache_key the payload is also cached"""
+    return _store_generated_worlds([(request, seed, world_recipe, merged_payload, cache_key)])[0]
+
+
+def _store_generated_worlds(
+    worlds: List[Tuple[GenerationRequest, int, str, Dict[str, Any], Optional[str]]],
+) -> List[Tuple[str, str]]:
+    """Insert generated worlds in one transaction; returns (world_id, summary) per world"""
+    created_at = now_iso()
+    stored: List[Tuple[str, str]] = []
+    rows = []
+    sections = []
+    cached: List[Tuple[str, str]] = []
+    for request, seed, world_recipe, merged_payload, cache_key in worlds:
+        summary = merged_payload["world"]["summary"]
+        world_id = f"{safe_slug(summary)}-{uuid4().hex[:8]}"
+        stored.append((world_id, summary))
+        rows.append((world_id, request.prompt, summary, "", created_at, request.user_id, seed, world_recipe))
+        sections.append((world_id, merged_payload))
+        if cache_key is not None:
+            cached.append((cache_key, json.dumps(merged_payload)))
+    if not rows:
+        return stored
+
+    def _insert(conn: sqlite3.Connection) -> None:
+        conn.executemany(
+            """INSERT INTO worlds (id, prompt, summary, payload, created_at, user_id, seed, recipe)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows,
         )
-        conn.commit()
+        if WORLD_STORAGE != "recipe":
+            world_store.save_sections_many(conn, sections)
+        if cached:
+            world_cache.store_disk_many(conn, cached)
+
+    _write(_insert)
+
+    for cache_key, cached_body in cached:
+        world_cache.put(cache_key, cached_body)
+    return stored
 
-    return GenerationResponse(world_id=world_id, summary=summary, payload=merged_payload)
+
+def _run_generation(world_recipe: str) -> Dict[str, Any]:
+    """Run the generation stages one after another on this thread.
+
+    The result depends only on the recipe, so a stored recipe regenerates
+    the same payload.
+    """
+    fields, seed = generation_cache.recipe_fields(world_recipe)
+    results, _ = generation_graph.run_sync({"fields": fields, "seed": seed})
+    return generation_pipeline.assemble_payload(results)
+
+
+def _materialize_world(conn: sqlite3.Connection, world_id: str) -> Optional[Dict[str, Any]]:
+    """Regenerate a world stored as a recipe (DATASHARK_WORLD_STORAGE=recipe)"""
+    row = conn.execute("SELECT recipe FROM worlds WHERE id = ?", (world_id,)).fetchone()
+    if not row or not row["recipe"]:
+        return None
+    cache_key = generation_cache.recipe_key(row["recipe"])
+    cached, _ = world_cache.get(cache_key)
+    if cached is not None:
+        return json.loads(cached)
+    payload = _run_generation(row["recipe"])
+    world_cache.put(cache_key, json.dumps(payload))
+    return payload
+
+
+def _raw_json(body: str) -> Response:
+    return Response(content=body, media_type="application/json")
+
+
+def _gzip_json(body: bytes) -> Response:
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+    )
 
 
 @app.get("/worlds/{world_id}")
-def get_world(world_id: str) -> Dict[str, Any]:
+def get_world(world_id: str, request: Request, sections: Optional[str] = None) -> Response:
+    """Return a world payload, or only the sections listed in ?sections=world.zones,story"""
+    selectors = world_store.parse_selectors(sections)
     with _get_connection() as conn:
-        row = conn.execute("SELECT payload FROM worlds WHERE id = ?", (world_id,)).fetchone()
+        if compression.accepts_gzip(request.headers.get("accept-encoding")):
+            body = world_store.load_payload_gzip(conn, world_id, selectors=selectors)
+            if body is not None:
+                return _gzip_json(body)
+        payload = world_store.load_payload_json(conn, world_id, selectors, _materialize_world)
 
-    if not row:
-        return {"error": "World not found"}
+    if payload is None:
+        return JSONResponse({"error": "World not found"})
+
+    return _raw_json(payload)
+
+
+@app.get("/worlds/{world_id}/sections")
+def list_world_sections(world_id: str) -> Dict[str, Any]:
+    """List the separately loadable sections of a world and their sizes"""
+    with _get_connection() as conn:
+        sections = world_store.list_sections(conn, world_id)
 
-    return json.loads(row["payload"])
+    return {"world_id": world_id, "sections": sections}
 
 
 @app.get("/worlds")
-def list_worlds(user_id: Optional[str] = None) -> Dict[str, Any]:
+def list_worlds(
+    user_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+) -> Dict[str, Any]:
+    page_size = limit or (DEFAULT_PAGE_SIZE if user_id else 20)
+    seek, order, params = _keyset(f"worlds:{user_id or ''}", ["created_at", "id"], cursor, page_size)
+
     with _get_connection() as conn:
-        if user_id:
-            rows = conn.execute(
-                "SELECT id, summary, created_at FROM worlds WHERE user_id = ? ORDER BY created_at DESC",
-                (user_id,),
-            ).fetchall()
-        else:
-            rows = conn.execute(
-                "SELECT id, summary, created_at FROM worlds ORDER BY created_at DESC LIMIT 20"
-            ).fetchall()
+        rows = conn.execute(
+            route_queries.worlds_page_sql(bool(user_id), seek, order),
+            ([user_id] if user_id else []) + params,
+        ).fetchall()
 
-    return {"worlds": [dict(row) for row in rows]}
+    worlds, next_cursor = split_page(
+        f"worlds:{user_id or ''}", [dict(row) for row in rows], ["created_at", "id"], page_size
+    )
+    return {"worlds": worlds, "next_cursor": next_cursor}
 
 
 @app.get("/worlds/{world_id}/export")
-def export_world(world_id: str) -> Dict[str, Any]:
+def export_world(world_id: str, request: Request) -> Response:
     with _get_connection() as conn:
-        row = conn.execute("SELECT payload FROM worlds WHERE id = ?", (world_id,)).fetchone()
+        if compression.accepts_gzip(request.headers.get("accept-encoding")):
+            body = world_store.load_payload_gzip(conn, world_id, "export", "}")
+            if body is not None:
+                return _gzip_json(body)
+        payload = world_store.load_payload_json(conn, world_id, materialize=_materialize_world)
 
-    if not row:
-        return {"error": "World not found"}
+    if payload is None:
+        return JSONResponse({"error": "World not found"})
 
-    return {"format": "json", "payload": json.loads(row["payload"])}
+    return _raw_json(f'{{"format": "json", "payload": {payload}}}')
 
 
 @app.get("/worlds/{world_id}/versions")
@@ -967,30 +1485,56 @@ def lobby_create(payload: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+# Cursor keys of each ordering; they match browse_rankings.ORDERINGS.
+BROWSE_ORDERINGS = {
+    "popular": ["play_count", "likes", "id"],
+    "recent": ["created_at", "id"],
+    "likes": ["likes", "id"],
+}
+
+
+def _world_details(ids: List[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+    with _get_connection() as conn:
+        return browse_rankings.fetch_details(conn, ids)
+
+
 @app.get("/browse")
-def browse_public_worlds(sort: str = "popular") -> Dict[str, Any]:
+def browse_public_worlds(
+    sort: str = "popular",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+) -> Dict[str, Any]:
     """Browse public worlds created by other users"""
-    with _get_connection() as conn:
-        if sort == "popular":
-            rows = conn.execute(
-                """SELECT w.id, w.summary, w.created_at, w.play_count, w.likes, u.username 
-                   FROM worlds w LEFT JOIN users u ON w.user_id = u.id 
-                   WHERE w.is_public = 1 ORDER BY w.play_count DESC, w.likes DESC LIMIT 50"""
-            ).fetchall()
-        elif sort == "recent":
-            rows = conn.execute(
-                """SELECT w.id, w.summary, w.created_at, w.play_count, w.likes, u.username 
-                   FROM worlds w LEFT JOIN users u ON w.user_id = u.id 
-                   WHERE w.is_public = 1 ORDER BY w.created_at DESC LIMIT 50"""
-            ).fetchall()
-        else:
-            rows = conn.execute(
-                """SELECT w.id, w.summary, w.created_at, w.play_count, w.likes, u.username 
-                   FROM worlds w LEFT JOIN users u ON w.user_id = u.id 
-                   WHERE w.is_public = 1 ORDER BY w.likes DESC LIMIT 50"""
-            ).fetchall()
-    
-    return {"worlds": [dict(row) for row in rows]}
+    if sort not in ("popular", "recent"):
+        sort = "likes"
+    keys = BROWSE_ORDERINGS[sort]
+    scope = f"browse:{sort}"
+    try:
+        after = decode_cursor(scope, cursor, len(keys), browse_rankings.KEY_TYPES[sort]) if cursor else None
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    def load() -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        rows = world_rankings.page(sort, after, limit + 1, _world_details)
+        return split_page(scope, rows, keys, limit)
+
+    # Ordering and cursors use the stored counts; the counts shown include unflushed increments.
+    worlds, next_cursor = counter_service.read(
+        load, lambda page: (counter_service.merge_rows("worlds", page[0], ("play_count", "likes")), page[1])
+    )
+    return {"worlds": worlds, "next_cursor": next_cursor}
+
+
+@app.post("/browse/rebuild")
+def rebuild_browse_rankings() -> Dict[str, Any]:
+    """Reload the /browse rankings from the worlds table"""
+    public_worlds = _rebuild_rankings()
+    return {"success": True, "public_worlds": public_worlds, "rebuild_ms": world_rankings.stats()["last_rebuild_ms"]}
+
+
+@app.get("/health/browse")
+def browse_health() -> Dict[str, Any]:
+    return {"status": "ok", "rankings": world_rankings.stats()}
 
 
 @app.post("/worlds/{world_id}/publish")
@@ -1005,9 +1549,16 @@ def publish_world(world_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         
         if row["user_id"] != user_id:
             return {"error": "Unauthorized"}
-        
-        conn.execute("UPDATE worlds SET is_public = 1 WHERE id = ?", (world_id,))
-        conn.commit()
+    
+    # Flushes wait so the counts read here are the ones the rankings start from.
+    with counter_service.quiesced():
+        row = _write(
+            lambda conn: conn.execute(
+                "UPDATE worlds SET is_public = 1 WHERE id = ? RETURNING created_at, play_count, likes", (world_id,)
+            ).fetchone()
+        )
+        if row is not None:
+            world_rankings.publish(world_id, row["created_at"], row["play_count"], row["likes"])
     
     return {"success": True, "message": "World published successfully"}
 
@@ -1024,74 +1575,175 @@ def unpublish_world(world_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         
         if row["user_id"] != user_id:
             return {"error": "Unauthorized"}
-        
-        conn.execute("UPDATE worlds SET is_public = 0 WHERE id = ?", (world_id,))
-        conn.commit()
+    
+    _write(lambda conn: conn.execute("UPDATE worlds SET is_public = 0 WHERE id = ?", (world_id,)))
+    world_rankings.unpublish(world_id)
     
     return {"success": True, "message": "World unpublished"}
 
 
 @app.post("/worlds/{world_id}/play")
-def play_world(world_id: str) -> Dict[str, Any]:
+def play_world(world_id: str, request: Request) -> Response:
     """Increment play count and return world data"""
     with _get_connection() as conn:
-        conn.execute("UPDATE worlds SET play_count = play_count + 1 WHERE id = ?", (world_id,))
-        conn.commit()
-        
-        row = conn.execute("SELECT payload, play_count FROM worlds WHERE id = ?", (world_id,)).fetchone()
-        if not row:
-            return {"error": "World not found"}
-    
-    return {"payload": json.loads(row["payload"]), "play_count": row["play_count"]}
+        play_count = _counted(conn, "worlds", "play_count", world_id)
+        if play_count is None:
+            return JSONResponse({"error": "World not found"})
+        # Counted only once the world is known to exist, so unknown ids never
+        # reach the pending buffer.
+        counter_service.increment("worlds", "play_count", world_id)
+        play_count += 1
+        if compression.accepts_gzip(request.headers.get("accept-encoding")):
+            body = world_store.load_payload_gzip(conn, world_id, "play", f', "play_count": {play_count}}}')
+            if body is not None:
+                return _gzip_json(body)
+        payload = world_store.load_payload_json(conn, world_id, materialize=_materialize_world)
+    
+    return _raw_json(f'{{"payload": {payload}, "play_count": {play_count}}}')
 
 
 @app.post("/worlds/{world_id}/like")
 def like_world(world_id: str) -> Dict[str, Any]:
     """Like a world"""
     with _get_connection() as conn:
-        conn.execute("UPDATE worlds SET likes = likes + 1 WHERE id = ?", (world_id,))
-        conn.commit()
-        
-        row = conn.execute("SELECT likes FROM worlds WHERE id = ?", (world_id,)).fetchone()
-        if not row:
+        likes = _counted(conn, "worlds", "likes", world_id)
+        if likes is None:
             return {"error": "World not found"}
+    counter_service.increment("worlds", "likes", world_id)
+    likes += 1
     
-    return {"success": True, "likes": row["likes"]}
+    return {"success": True, "likes": likes}
 
 
 @app.get("/worlds/{world_id}/leaderboard")
-def get_leaderboard(world_id: str) -> Dict[str, Any]:
-    """Get leaderboard for a specific world"""
-    with _get_connection() as conn:
-        rows = conn.execute(
-            """SELECT username, score, completed_missions, play_time, created_at 
-               FROM leaderboard WHERE world_id = ? ORDER BY score DESC LIMIT 10""",
-            (world_id,)
-        ).fetchall()
-    
-    return {"leaderboard": [dict(row) for row in rows]}
+def get_leaderboard(
+    world_id: str,
+    period: str = Query("all", pattern="^(all|daily|weekly)$"),
+    limit: int = Query(leaderboards.DEFAULT_TOP, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+) -> Dict[str, Any]:
+    """Get leaderboard for a specific world: each player's best score, all-time or for today / this week"""
+    total, rows = leaderboard_engine.top(world_id, period, limit, offset)
+    return {"leaderboard": rows, "period": period, "board": leaderboards.board_name(period), "total": total}
+
+
+@app.get("/worlds/{world_id}/leaderboard/{user_id}")
+def get_leaderboard_rank(
+    world_id: str,
+    user_id: str,
+    period: str = Query("all", pattern="^(all|daily|weekly)$"),
+    radius: int = Query(leaderboards.DEFAULT_RADIUS, ge=0, le=50),
+) -> Dict[str, Any]:
+    """A player's rank plus the players just above and below"""
+    ranked = leaderboard_engine.around(world_id, user_id, period, radius)
+    if ranked is None:
+        raise HTTPException(status_code=404, detail="Player has no score on this leaderboard")
+    return {"period": period, "board": leaderboards.board_name(period), **ranked}
+
+
+@app.get("/health/leaderboards")
+def leaderboards_health() -> Dict[str, Any]:
+    return {"status": "ok", "leaderboards": leaderboard_engine.stats()}
+
+
+class ScoreSubmission(BaseModel):
+    user_id: str = Field(..., min_length=1)
+    username: str = "Anonymous"
+    score: int = 0
+    completed_missions: int = Field(default=0, ge=0)
+    play_time: int = Field(default=0, ge=0)
+
+
+class ScoreBatchItem(ScoreSubmission):
+    world_id: str = Field(..., min_length=1)
+
+
+SCORE_BATCH_LIMIT = int(os.getenv("DATASHARK_SCORE_BATCH_LIMIT", str(leaderboards.DEFAULT_BATCH_LIMIT)))
+
+
+# Items arrive as sent and are validated one by one in the handler, so a bad
+# item is reported on its own instead of rejecting the whole batch; the
+# schema still documents them as ScoreBatchItem.
+_SCORE_ITEM = TypeAdapter(ScoreBatchItem)
+ScoreBatchEntry = Annotated[Any, WithJsonSchema(ScoreBatchItem.model_json_schema())]
+
+
+class ScoreBatchRequest(BaseModel):
+    scores: List[ScoreBatchEntry] = Field(..., min_length=1, max_length=SCORE_BATCH_LIMIT)
 
 
 @app.post("/worlds/{world_id}/leaderboard")
-def submit_score(world_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    """Submit a score to the leaderboard"""
-    user_id = payload.get("user_id")
-    username = payload.get("username", "Anonymous")
-    score = payload.get("score", 0)
-    completed_missions = payload.get("completed_missions", 0)
-    play_time = payload.get("play_time", 0)
-    
-    entry_id = f"{world_id}-{user_id}-{uuid4().hex[:8]}"
+def submit_score(world_id: str, submission: ScoreSubmission) -> Dict[str, Any]:
+    """Submit a score to the leaderboard; only a player's best per board is kept"""
+    boards = leaderboard_engine.submit(
+        world_id,
+        submission.user_id,
+        submission.username,
+        submission.score,
+        submission.completed_missions,
+        submission.play_time,
+    )
     
-    with _get_connection() as conn:
-        conn.execute(
-            """INSERT INTO leaderboard (id, world_id, user_id, username, score, completed_missions, play_time, created_at) 
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (entry_id, world_id, user_id, username, score, completed_missions, play_time, now_iso())
+    return {"success": True, "entry_id": f"{world_id}-{submission.user_id}", "boards": boards}
+
+
+@app.post("/leaderboards/scores")
+def submit_scores(batch: ScoreBatchRequest) -> Dict[str, Any]:
+    """Submit scores for any number of worlds at once; the bests this batch improved are written in one transaction and results are reported per item in request order"""
+    items: List[Dict[str, Any]] = [{"index": index} for index in range(len(batch.scores))]
+    valid: List[Tuple[int, ScoreBatchItem]] = []
+    for index, raw in enumerate(batch.scores):
+        try:
+            valid.append((index, _SCORE_ITEM.validate_python(raw)))
+        except ValidationError as exc:
+            items[index]["error"] = _validation_message(exc)
+
+    world_ids = list({item.world_id for _, item in valid})
+    known: set = set()
+    if world_ids:
+        placeholders = ", ".join("?" for _ in world_ids)
+        with _get_connection() as conn:
+            known = {row[0] for row in conn.execute(f"SELECT id FROM worlds WHERE id IN ({placeholders})", world_ids)}
+    accepted: List[Tuple[int, ScoreBatchItem]] = []
+    for index, item in valid:
+        if item.world_id in known:
+            accepted.append((index, item))
+        else:
+            items[index]["error"] = "World not found"
+
+    submitted_at = datetime.utcnow()
+    results = leaderboard_engine.submit_many(
+        [
+            (item.world_id, item.user_id, item.username, item.score, item.completed_missions, item.play_time)
+            for _, item in accepted
+        ],
+        submitted_at,
+    )
+    improved = []
+    for (index, item), boards in zip(accepted, results):
+        items[index].update(world_id=item.world_id, user_id=item.user_id, boards=boards)
+        improved.extend(
+            (item.world_id, leaderboards.board_name(period, submitted_at), item.user_id)
+            for period, board in boards.items()
+            if board["improved"]
         )
-        conn.commit()
-    
-    return {"success": True, "entry_id": entry_id}
+
+    # Write this batch's bests now rather than on the next background flush;
+    # other callers' pending bests are left to that flush.
+    try:
+        persisted = leaderboard_engine.flush(improved) if improved else 0
+    except Exception as exc:
+        # Still ranked in memory and retried by the background flush; resending
+        # the batch is harmless because only a higher score replaces a best.
+        raise HTTPException(status_code=503, detail=f"Scores recorded but not yet saved: {exc}")
+
+    return {
+        "count": len(items),
+        "succeeded": len(accepted),
+        "failed": len(items) - len(accepted),
+        "persisted_rows": persisted,
+        "items": items,
+    }
 
 
 @app.post("/auth/register", response_model=AuthResponse)
@@ -1102,12 +1754,12 @@ def register(user: UserRegister) -> AuthResponse:
     password_hash = hashlib.sha256(user.password.encode()).hexdigest()
 
     try:
-        with _get_connection() as conn:
-            conn.execute(
+        _write(
+            lambda conn: conn.execute(
                 "INSERT INTO users (id, username, password_hash, created_at) VALUES (?, ?, ?, ?)",
                 (user_id, user.username, password_hash, now_iso()),
             )
-            conn.commit()
+        )
     except Exception:
         return AuthResponse(id=user_id, username=user.username, token="")
 
@@ -1136,109 +1788,161 @@ def login(user: UserLogin) -> AuthResponse:
 
 # ============ GAME SAVES ENDPOINTS ============
 
-@app.post("/saves/save", response_model=GameSaveResponse)
-def save_game(save_data: GameSaveRequest, user_id: str) -> GameSaveResponse:
-    """Save game progress for a specific world and slot"""
-    save_id = str(uuid4())
-    
-    with _get_connection() as conn:
-        # Check if save slot exists
-        existing = conn.execute(
-            "SELECT id FROM game_saves WHERE user_id = ? AND world_id = ? AND slot_number = ?",
-            (user_id, save_data.world_id, save_data.slot_number)
-        ).fetchone()
-        
-        if existing:
-            # Update existing save
-            conn.execute(
-                """UPDATE game_saves SET 
-                   slot_name = ?, game_state = ?, player_stats = ?, 
-                   progress_percentage = ?, play_time = ?, updated_at = ?
-                   WHERE id = ?""",
-                (save_data.slot_name, json.dumps(save_data.game_state), 
-                 json.dumps(save_data.player_stats), save_data.progress_percentage,
-                 save_data.play_time, now_iso(), existing["id"])
-            )
-            save_id = existing["id"]
+def _negotiated(request: Request, payload: Dict[str, Any]) -> Response:
+    """MessagePack when the client's Accept prefers it, JSON otherwise"""
+    headers = {"Vary": "Accept"}
+    if msgpack_codec.accepts_msgpack(request.headers.get("accept")):
+        return Response(msgpack_codec.packb(payload), media_type=msgpack_codec.MEDIA_TYPE, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
+
+@app.post(
+    "/saves/save",
+    response_model=GameSaveResponse,
+    # The body is parsed by hand to accept MessagePack as well as JSON.
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                media_type: {"schema": GameSaveRequest.model_json_schema()}
+                for media_type in ("application/json", msgpack_codec.MEDIA_TYPE)
+            },
+        }
+    },
+)
+async def save_game(request: Request, user_id: str) -> Response:
+    """Save game progress for a specific world and slot; only the changes since the last save are written.
+    The body may be JSON or MessagePack (Content-Type: application/msgpack), which also stores the slot as MessagePack"""
+    body = await request.body()
+    binary = msgpack_codec.is_msgpack(request.headers.get("content-type"))
+    try:
+        if binary:
+            save_data = GameSaveRequest.model_validate(msgpack_codec.unpackb(body, json_only=True))
         else:
-            # Create new save
-            conn.execute(
-                """INSERT INTO game_saves 
-                   (id, user_id, world_id, slot_name, slot_number, game_state, player_stats, 
-                    progress_percentage, play_time, created_at, updated_at)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (save_id, user_id, save_data.world_id, save_data.slot_name, save_data.slot_number,
-                 json.dumps(save_data.game_state), json.dumps(save_data.player_stats),
-                 save_data.progress_percentage, save_data.play_time, now_iso(), now_iso())
+            save_data = GameSaveRequest.model_validate_json(body)
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors())
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    saved = await run_in_threadpool(
+        _write,
+        lambda conn: save_store.save(
+            conn,
+            user_id,
+            save_data.world_id,
+            save_data.slot_number,
+            save_data.slot_name,
+            save_data.game_state,
+            save_data.player_stats,
+            save_data.progress_percentage,
+            save_data.play_time,
+            str(uuid4()),
+            binary,
+        ),
+    )
+    
+    response = GameSaveResponse(save_id=saved.save_id, message="Game saved successfully", version=saved.version)
+    return _negotiated(request, response.model_dump())
+
+
+@app.patch("/saves/{save_id}", response_model=GameSaveResponse)
+def patch_save(save_id: str, user_id: str, update: GameSavePatch) -> GameSaveResponse:
+    """Autosave by sending a JSON patch against the version the client last saved or loaded"""
+    try:
+        saved = _write(
+            lambda conn: save_store.patch(
+                conn,
+                save_id,
+                user_id,
+                update.base_version,
+                update.patch,
+                update.slot_name,
+                update.progress_percentage,
+                update.play_time,
             )
-        conn.commit()
+        )
+    except save_deltas.VersionConflict as exc:
+        # The client must reload (or send a full /saves/save) before patching again.
+        raise HTTPException(status_code=409, detail={"message": str(exc), "version": exc.version})
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=f"Invalid patch: {exc}")
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Save not found")
     
-    return GameSaveResponse(save_id=save_id, message="Game saved successfully")
+    return GameSaveResponse(save_id=saved.save_id, message="Game saved successfully", version=saved.version)
+
+
+@app.get("/health/saves")
+def saves_health() -> Dict[str, Any]:
+    return {"status": "ok", "saves": save_store.stats()}
 
 
 @app.get("/saves/list/{user_id}")
 def list_saves(user_id: str) -> List[Dict[str, Any]]:
     """List all save slots for a user"""
     with _get_connection() as conn:
-        rows = conn.execute(
-            """SELECT gs.*, w.summary as world_name 
-               FROM game_saves gs 
-               LEFT JOIN worlds w ON gs.world_id = w.id
-               WHERE gs.user_id = ? 
-               ORDER BY gs.updated_at DESC""",
-            (user_id,)
-        ).fetchall()
-    
-    return [
-        {
-            "save_id": row["id"],
-            "world_id": row["world_id"],
-            "world_name": row["world_name"],
-            "slot_name": row["slot_name"],
-            "slot_number": row["slot_number"],
-            "progress_percentage": row["progress_percentage"],
-            "play_time": row["play_time"],
-            "created_at": row["created_at"],
-            "updated_at": row["updated_at"]
-        }
-        for row in rows
-    ]
+        return save_deltas.list_slots(conn, user_id)
 
 
 @app.get("/saves/load/{save_id}")
-def load_save(save_id: str) -> Dict[str, Any]:
-    """Load a specific save"""
-    with _get_connection() as conn:
+def load_save(save_id: str, request: Request, background_tasks: BackgroundTasks) -> Response:
+    """Load a specific save, as MessagePack when the Accept header asks for application/msgpack"""
+    binary = msgpack_codec.accepts_msgpack(request.headers.get("accept"))
+    # Head, snapshot and patches from one snapshot of the database, so a
+    # compaction committed meanwhile cannot mix versions.
+    with _get_connection() as conn, read_transaction(conn):
         row = conn.execute(
-            "SELECT * FROM game_saves WHERE id = ?",
+            f"SELECT {save_deltas.HEAD_COLUMNS}, updated_at FROM game_saves WHERE id = ?",
             (save_id,)
         ).fetchone()
     
-    if not row:
-        raise HTTPException(status_code=404, detail="Save not found")
+        if not row:
+            raise HTTPException(status_code=404, detail="Save not found")
+        
+        # A MessagePack snapshot with no patches on top is sent as stored, without decoding it.
+        stored = save_store.stored_msgpack(conn, row) if binary else None
+        if stored is not None:
+            game_state: Any = msgpack_codec.Raw(stored[0])
+            player_stats: Any = msgpack_codec.Raw(stored[1])
+        else:
+            state = save_store.state(conn, row)
+            game_state, player_stats = state["game_state"], state["player_stats"]
     
-    return {
-        "save_id": row["id"],
-        "world_id": row["world_id"],
-        "slot_name": row["slot_name"],
-        "slot_number": row["slot_number"],
-        "game_state": json.loads(row["game_state"]),
-        "player_stats": json.loads(row["player_stats"]),
-        "progress_percentage": row["progress_percentage"],
-        "play_time": row["play_time"],
-        "updated_at": row["updated_at"]
-    }
+    if binary and row["encoding"] != compression.MSGPACK:
+        # Binary clients read this slot: store it as MessagePack once the response is out.
+        background_tasks.add_task(_write, lambda conn: save_store.convert(conn, save_id))
+    
+    return _negotiated(
+        request,
+        {
+            "save_id": row["id"],
+            "world_id": row["world_id"],
+            "slot_name": row["slot_name"],
+            "slot_number": row["slot_number"],
+            "game_state": game_state,
+            "player_stats": player_stats,
+            "progress_percentage": row["progress_percentage"],
+            "play_time": row["play_time"],
+            "updated_at": row["updated_at"],
+            "version": row["version"]
+        },
+    )
 
 
 @app.delete("/saves/delete/{save_id}")
 def delete_save(save_id: str, user_id: str) -> Dict[str, Any]:
     """Delete a save slot"""
-    with _get_connection() as conn:
-        conn.execute(
+    def _delete(conn: sqlite3.Connection) -> None:
+        deleted = conn.execute(
             "DELETE FROM game_saves WHERE id = ? AND user_id = ?",
             (save_id, user_id)
-        )
-        conn.commit()
+        ).rowcount
+        if deleted:
+            conn.execute("DELETE FROM game_save_deltas WHERE save_id = ?", (save_id,))
+
+    _write(_delete)
+    save_store.forget(save_id)
     
     return {"success": True, "message": "Save deleted"}
 
@@ -1287,13 +1991,14 @@ def unlock_achievement(user_id: str, achievement_id: str) -> Dict[str, Any]:
     unlock_id = str(uuid4())
     
     try:
-        with _get_connection() as conn:
-            conn.execute(
+        _write(
+            lambda conn: conn.execute(
                 "INSERT INTO user_achievements (id, user_id, achievement_id, unlocked_at) VALUES (?, ?, ?, ?)",
                 (unlock_id, user_id, achievement_id, now_iso())
             )
-            conn.commit()
-            
+        )
+        
+        with _get_connection() as conn:
             # Get achievement details
             ach = conn.execute("SELECT * FROM achievements WHERE id = ?", (achievement_id,)).fetchone()
         
@@ -1358,7 +2063,7 @@ def upload_custom_asset(asset: CustomAssetUpload, user_id: str) -> Dict[str, Any
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to save asset: {str(e)}")
     
-    with _get_connection() as conn:
+    def _insert(conn: sqlite3.Connection) -> None:
         conn.execute(
             """INSERT INTO custom_assets 
                (id, user_id, asset_name, asset_type, file_path, file_size, description, is_public, created_at)
@@ -1366,7 +2071,8 @@ def upload_custom_asset(asset: CustomAssetUpload, user_id: str) -> Dict[str, Any
             (asset_id, user_id, asset.asset_name, asset.asset_type, file_path, 
              file_size, asset.description, 1 if asset.is_public else 0, now_iso())
         )
-        conn.commit()
+
+    _write(_insert)
     
     return {
         "success": True,
@@ -1376,48 +2082,75 @@ def upload_custom_asset(asset: CustomAssetUpload, user_id: str) -> Dict[str, Any
     }
 
 
+_ASSET_COUNTERS = ("downloads", "likes")
+
+
 @app.get("/assets/list/{user_id}")
 def list_user_assets(user_id: str) -> List[Dict[str, Any]]:
     """List all assets uploaded by a user"""
-    with _get_connection() as conn:
-        rows = conn.execute(
-            "SELECT * FROM custom_assets WHERE user_id = ? ORDER BY created_at DESC",
-            (user_id,)
-        ).fetchall()
+    def load() -> List[Dict[str, Any]]:
+        with _get_connection() as conn:
+            rows = conn.execute(route_queries.ASSETS_BY_USER_SQL, (user_id,)).fetchall()
+        return [dict(row) for row in rows]
     
-    return [dict(row) for row in rows]
+    return counter_service.read(load, lambda assets: counter_service.merge_rows("custom_assets", assets, _ASSET_COUNTERS))
 
 
 @app.get("/assets/browse")
-def browse_public_assets(asset_type: Optional[str] = None) -> List[Dict[str, Any]]:
+def browse_public_assets(
+    response: Response,
+    asset_type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+) -> List[Dict[str, Any]]:
     """Browse public assets"""
-    with _get_connection() as conn:
-        if asset_type:
-            rows = conn.execute(
-                "SELECT * FROM custom_assets WHERE is_public = 1 AND asset_type = ? ORDER BY downloads DESC, likes DESC",
-                (asset_type,)
-            ).fetchall()
-        else:
+    scope = f"assets:{asset_type or ''}"
+    seek, order, params = _keyset(scope, ["downloads", "likes", "id"], cursor, limit)
+    if asset_type:
+        params = [asset_type] + params
+
+    def load() -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        with _get_connection() as conn:
             rows = conn.execute(
-                "SELECT * FROM custom_assets WHERE is_public = 1 ORDER BY downloads DESC, likes DESC"
+                route_queries.public_assets_page_sql(bool(asset_type), seek, order),
+                params,
             ).fetchall()
+        return split_page(scope, [dict(row) for row in rows], ["downloads", "likes", "id"], limit)
     
-    return [dict(row) for row in rows]
+    # The body stays a bare list for existing clients; the cursor goes in a header.
+    assets, next_cursor = counter_service.read(
+        load, lambda page: (counter_service.merge_rows("custom_assets", page[0], _ASSET_COUNTERS), page[1])
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return assets
 
 
 @app.post("/assets/{asset_id}/like")
 def like_asset(asset_id: str) -> Dict[str, Any]:
     """Like a custom asset"""
     with _get_connection() as conn:
-        conn.execute(
-            "UPDATE custom_assets SET likes = likes + 1 WHERE id = ?",
-            (asset_id,)
-        )
-        conn.commit()
+        if _counted(conn, "custom_assets", "likes", asset_id) is None:
+            return {"error": "Asset not found"}
+    counter_service.increment("custom_assets", "likes", asset_id)
     
     return {"success": True}
 
 
+@app.post("/assets/{asset_id}/download")
+def download_asset(asset_id: str) -> Dict[str, Any]:
+    """Count a download and return the asset"""
+
+    def load() -> List[Dict[str, Any]]:
+        with _get_connection() as conn:
+            return [dict(row) for row in conn.execute("SELECT * FROM custom_assets WHERE id = ?", (asset_id,))]
+
+    if not load():
+        return {"error": "Asset not found"}
+    counter_service.increment("custom_assets", "downloads", asset_id)
+    return counter_service.read(load, lambda rows: counter_service.merge_rows("custom_assets", rows, _ASSET_COUNTERS))[0]
+
+
 # ============ SKILL TREE ENDPOINTS ============
 
 @app.post("/skills/update")
@@ -1425,7 +2158,7 @@ def update_skill_tree(skill_update: SkillTreeUpdate, user_id: str) -> Dict[str,
     """Update player skill tree"""
     skill_id = str(uuid4())
     
-    with _get_connection() as conn:
+    def _upsert(conn: sqlite3.Connection) -> None:
         existing = conn.execute(
             "SELECT id FROM player_skills WHERE user_id = ? AND world_id = ?",
             (user_id, skill_update.world_id)
@@ -1449,7 +2182,8 @@ def update_skill_tree(skill_update: SkillTreeUpdate, user_id: str) -> Dict[str,
                  json.dumps(skill_update.skill_tree), json.dumps([skill_update.skill_id]), 
                  0, now_iso(), now_iso())
             )
-        conn.commit()
+
+    _write(_upsert)
     
     return {"success": True, "message": "Skill tree updated"}
 
@@ -1480,56 +2214,83 @@ def get_skill_tree(user_id: str, world_id: str) -> Dict[str, Any]:
 # ============ MULTI AI PROVIDER ENDPOINT ============
 
 @app.post("/ai/generate")
-def generate_with_ai(request: AIProviderRequest) -> Dict[str, Any]:
+async def generate_with_ai(request: AIProviderRequest, response: Response) -> Dict[str, Any]:
     """Generate content using different AI providers"""
-    
-    if request.provider == "openai":
-        if not openai_client:
-            raise HTTPException(status_code=503, detail="OpenAI not configured")
-        
-        try:
-            response = openai_client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a helpful game design assistant."},
-                    {"role": "user", "content": request.message}
-                ],
-                max_tokens=500
-            )
-            return {
-                "provider": "openai",
-                "response": response.choices[0].message.content,
-                "success": True
-            }
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    elif request.provider == "claude":
-        # Anthropic Claude integration (requires anthropic package)
-        return {
-            "provider": "claude",
-            "response": "Claude integration coming soon. Install: pip install anthropic",
-            "success": False
-        }
-    
-    elif request.provider == "gemini":
-        # Google Gemini integration (requires google-generativeai package)
-        return {
-            "provider": "gemini",
-            "response": "Gemini integration coming soon. Install: pip install google-generativeai",
-            "success": False
-        }
-    
-    elif request.provider == "mistral":
-        # Mistral AI integration
-        return {
-            "provider": "mistral",
-            "response": "Mistral integration coming soon. Install: pip install mistralai",
-            "success": False
-        }
-    
-    else:
+    if request.provider not in provider_gateway.providers:
+        raise HTTPException(status_code=400, detail="Unsupported AI provider")
+
+    try:
+        result = await provider_gateway.generate(request.provider, request.message)
+    except ProviderUnavailable as exc:
+        # Only a keyless OpenAI is a 503; the other providers have always
+        # answered 200 with success: false when they cannot be used.
+        if exc.missing_package or request.provider != "openai":
+            return {"provider": request.provider, "response": str(exc), "success": False}
+        raise HTTPException(status_code=503, detail=str(exc))
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+    response.headers["X-AI-Cache"] = result.cache
+    return {"provider": result.provider, "response": result.text, "success": True}
+
+
+async def _token_events(
+    tokens: AsyncIterator[str], start: Dict[str, Any], sse: bool, on_done: Optional[Callable[[str], None]] = None
+) -> AsyncIterator[str]:
+    """Frame a token stream as start / token* / done events, timing the first and last token"""
+    started = time.perf_counter()
+    yield streaming.encode_event("start", start, sse)
+    pieces: List[str] = []
+    ttft_ms: Optional[float] = None
+    try:
+        async for piece in tokens:
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            pieces.append(piece)
+            yield streaming.encode_event("token", {"text": piece}, sse)
+    except asyncio.TimeoutError:
+        yield streaming.encode_event("error", {"detail": "Provider timed out"}, sse)
+        return
+    except Exception as exc:
+        yield streaming.encode_event("error", {"detail": str(exc)}, sse)
+        return
+    if on_done is not None:
+        on_done("".join(pieces))
+    total_ms = (time.perf_counter() - started) * 1000
+    yield streaming.encode_event(
+        "done", {"tokens": len(pieces), "ttft_ms": round(ttft_ms or total_ms, 2), "total_ms": round(total_ms, 2)}, sse
+    )
+
+
+def _token_response(events: AsyncIterator[str], sse: bool, headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type=streaming.SSE if sse else streaming.NDJSON,
+        headers={**streaming.STREAM_HEADERS, **(headers or {})},
+    )
+
+
+def _open_token_stream(provider: str, prompt: str, system: str) -> ai_gateway.TokenStream:
+    if provider not in provider_gateway.providers:
         raise HTTPException(status_code=400, detail="Unsupported AI provider")
+    try:
+        return provider_gateway.stream(provider, prompt, system)
+    except ProviderUnavailable as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+
+
+@app.post("/ai/generate/stream")
+async def generate_with_ai_stream(request: AIProviderRequest, http_request: Request) -> StreamingResponse:
+    """Like /ai/generate, but streams tokens as SSE (or NDJSON with Accept: application/x-ndjson)"""
+    sse = streaming.NDJSON not in (http_request.headers.get("accept") or "")
+    tokens = _open_token_stream(request.provider, request.message, ai_gateway.DEFAULT_SYSTEM_PROMPT)
+    start = {"provider": tokens.provider, "cache": tokens.cache}
+    return _token_response(_token_events(tokens, start, sse), sse, {"X-AI-Cache": tokens.cache})
+
+
+@app.get("/health/ai")
+def ai_health() -> Dict[str, Any]:
+    return {"status": "ok", "gateway": provider_gateway.stats()}
 
 
 # ============ PHYSICS CONFIG ENDPOINT ============
@@ -1610,48 +2371,6 @@ def get_combat_skills() -> Dict[str, Any]:
     }
 
 
-# ============ GAME SAVES ENDPOINTS ============
-
-@app.post("/saves/save", response_model=GameSaveResponse)
-def save_game(save_data: GameSaveRequest, user_id: str) -> GameSaveResponse:
-    """Save game progress for a specific world and slot"""
-    save_id = str(uuid4())
-    
-    with _get_connection() as conn:
-        # Check if save slot exists
-        existing = conn.execute(
-            "SELECT id FROM game_saves WHERE user_id = ? AND world_id = ? AND slot_number = ?",
-            (user_id, save_data.world_id, save_data.slot_number)
-        ).fetchone()
-        
-        if existing:
-            # Update existing save
-            conn.execute(
-                """UPDATE game_saves SET 
-                   slot_name = ?, game_state = ?, player_stats = ?, 
-                   progress_percentage = ?, play_time = ?, updated_at = ?
-                   WHERE id = ?""",
-                (save_data.slot_name, json.dumps(save_data.game_state), 
-                 json.dumps(save_data.player_stats), save_data.progress_percentage,
-                 save_data.play_time, now_iso(), existing["id"])
-            )
-            save_id = existing["id"]
-        else:
-            # Create new save
-            conn.execute(
-                """INSERT INTO game_saves 
-                   (id, user_id, world_id, slot_name, slot_number, game_state, player_stats, 
-                    progress_percentage, play_time, created_at, updated_at)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (save_id, user_id, save_data.world_id, save_data.slot_name, save_data.slot_number,
-                 json.dumps(save_data.game_state), json.dumps(save_data.player_stats),
-                 save_data.progress_percentage, save_data.play_time, now_iso(), now_iso())
-            )
-        conn.commit()
-    
-    return GameSaveResponse(save_id=save_id, message="Game saved successfully")
-
-
 @app.post("/npc/chat", response_model=NpcChatResponse)
 def npc_chat(payload: NpcChatRequest) -> NpcChatResponse:
     """Chat con asistente local (sin APIs externas)"""
@@ -1662,11 +2381,51 @@ def npc_chat(payload: NpcChatRequest) -> NpcChatResponse:
         context["world_name"] = payload.world_summary
     
     # Obtener respuesta del asistente local
-    reply = local_assistant.get_response(payload.message, context)
+    reply = local_assistant.get_response(payload.message, context, session=payload.session_id or payload.user_id)
     
     return NpcChatResponse(reply=reply)
 
 
+@app.post("/npc/chat/stream")
+async def npc_chat_stream(payload: NpcChatRequest, http_request: Request) -> StreamingResponse:
+    """Chat en streaming (SSE, o NDJSON con Accept: application/x-ndjson); con ``provider`` responde un modelo externo"""
+    sse = streaming.NDJSON not in (http_request.headers.get("accept") or "")
+    session = payload.session_id or payload.user_id
+    if not payload.provider:
+        context = {"world_name": payload.world_summary} if payload.world_summary else {}
+        reply = local_assistant.get_response(payload.message, context, session=session)
+        events = _token_events(_replay(ai_gateway.split_tokens(reply)), {"provider": "local", "cache": "miss"}, sse)
+        return _token_response(events, sse)
+
+    system = NPC_SYSTEM_PROMPT
+    if payload.world_summary:
+        system += f"\nMundo actual: {payload.world_summary}"
+    tokens = _open_token_stream(payload.provider, payload.message, system)
+
+    def remember(reply: str) -> None:
+        if session is not None:
+            local_assistant.memory.record(session, payload.message.lower().strip(), reply, None)
+
+    start = {"provider": tokens.provider, "cache": tokens.cache}
+    return _token_response(_token_events(tokens, start, sse, remember), sse, {"X-AI-Cache": tokens.cache})
+
+
+async def _replay(pieces: List[str]) -> AsyncIterator[str]:
+    for piece in pieces:
+        yield piece
+
+
+@app.delete("/npc/sessions/{session_id}")
+def forget_npc_session(session_id: str) -> Dict[str, Any]:
+    """Olvidar la conversación de una sesión"""
+    return {"session_id": session_id, "forgotten": local_assistant.memory.forget(session_id)}
+
+
+@app.get("/health/npc")
+def npc_health() -> Dict[str, Any]:
+    return {"status": "ok", "memory": local_assistant.memory.stats()}
+
+
 @app.get("/npc/tutorial/{topic}")
 def get_tutorial(topic: str) -> Dict[str, str]:
     """Obtener tutorial específico"""
@@ -1681,6 +2440,13 @@ def get_faq() -> Dict[str, Any]:
     return {"faqs": faqs, "total": len(faqs)}
 
 
+@app.get("/npc/search")
+def search_knowledge(q: str = Query(..., min_length=1), k: int = Query(5, ge=1, le=20)) -> Dict[str, Any]:
+    """Buscar en respuestas, FAQ y tutoriales del asistente local (BM25)"""
+    hits = local_assistant.search(q, k)
+    return {"query": q, "results": [hit._asdict() for hit in hits], "total": len(hits)}
+
+
 # ============ QUESTS SYSTEM ENDPOINTS ============
 
 @app.post("/quests/create")
@@ -1688,7 +2454,7 @@ def create_quest(quest: QuestCreate, user_id: str) -> Dict[str, Any]:
     """Create a new quest for a world"""
     quest_id = str(uuid4())
     
-    with _get_connection() as conn:
+    def _insert(conn: sqlite3.Connection) -> None:
         conn.execute(
             """INSERT INTO quests 
                (id, world_id, title, description, quest_type, requirements, rewards, difficulty, branches, created_at)
@@ -1697,7 +2463,8 @@ def create_quest(quest: QuestCreate, user_id: str) -> Dict[str, Any]:
              json.dumps(quest.requirements), json.dumps(quest.rewards), quest.difficulty,
              json.dumps(quest.branches) if quest.branches else None, now_iso())
         )
-        conn.commit()
+
+    _write(_insert)
     
     return {"quest_id": quest_id, "message": "Quest created successfully"}
 
@@ -1706,10 +2473,7 @@ def create_quest(quest: QuestCreate, user_id: str) -> Dict[str, Any]:
 def get_world_quests(world_id: str) -> Dict[str, Any]:
     """Get all quests for a world"""
     with _get_connection() as conn:
-        rows = conn.execute(
-            "SELECT * FROM quests WHERE world_id = ?",
-            (world_id,)
-        ).fetchall()
+        rows = conn.execute(route_queries.WORLD_QUESTS_SQL, (world_id,)).fetchall()
         
         quests = []
         for row in rows:
@@ -1732,7 +2496,7 @@ def update_quest_progress(progress: QuestProgress, user_id: str) -> Dict[str, An
     """Update user's quest progress"""
     progress_id = str(uuid4())
     
-    with _get_connection() as conn:
+    def _upsert(conn: sqlite3.Connection) -> None:
         existing = conn.execute(
             "SELECT id FROM user_quests WHERE user_id = ? AND quest_id = ?",
             (user_id, progress.quest_id)
@@ -1754,7 +2518,8 @@ def update_quest_progress(progress: QuestProgress, user_id: str) -> Dict[str, An
                  json.dumps(progress.choices_made) if progress.choices_made else None,
                  now_iso() if progress.status == "completed" else None)
             )
-        conn.commit()
+
+    _write(_upsert)
     
     return {"message": "Quest progress updated"}
 
@@ -1762,14 +2527,14 @@ def update_quest_progress(progress: QuestProgress, user_id: str) -> Dict[str, An
 @app.post("/quests/seed")
 def seed_quests(payload: QuestSeed) -> Dict[str, Any]:
     """Seed default quests for a world if none exist"""
-    with _get_connection() as conn:
+    def _seed(conn: sqlite3.Connection) -> int:
         existing = conn.execute(
             "SELECT id FROM quests WHERE world_id = ?",
             (payload.world_id,)
         ).fetchone()
 
         if existing:
-            return {"message": "Quests already exist", "seeded": 0}
+            return 0
 
         defaults = [
             {
@@ -1819,9 +2584,12 @@ def seed_quests(payload: QuestSeed) -> Dict[str, Any]:
                     now_iso(),
                 )
             )
-        conn.commit()
+        return len(defaults)
 
-    return {"message": "Default quests seeded", "seeded": len(defaults)}
+    seeded = _write(_seed)
+    if not seeded:
+        return {"message": "Quests already exist", "seeded": 0}
+    return {"message": "Default quests seeded", "seeded": seeded}
 
 
 # ============ CRAFTING SYSTEM ENDPOINTS ============
@@ -1857,29 +2625,30 @@ def craft_item(craft_request: CraftingRequest, user_id: str = Query(...)) -> Dic
             "SELECT * FROM crafting_recipes WHERE id = ?",
             (craft_request.recipe_id,)
         ).fetchone()
-        
-        if not recipe:
-            raise HTTPException(status_code=404, detail="Recipe not found")
-        
-        # Add crafted item to inventory
-        item_id = str(uuid4())
-        quantity_crafted = recipe["result_quantity"] * craft_request.quantity
-        
-        conn.execute(
+    
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    
+    # Add crafted item to inventory
+    item_id = str(uuid4())
+    quantity_crafted = recipe["result_quantity"] * craft_request.quantity
+    
+    _write(
+        lambda conn: conn.execute(
             """INSERT INTO player_inventory 
                (id, user_id, item_name, item_id, quantity, rarity, type, created_at)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
             (item_id, user_id, recipe["name"], recipe["result_item"], 
              quantity_crafted, "common", recipe["category"], now_iso())
         )
-        conn.commit()
-        
-        return {
-            "success": True,
-            "crafted_item": recipe["result_item"],
-            "quantity": quantity_crafted,
-            "message": f"Crafted {recipe['name']} x{craft_request.quantity}"
-        }
+    )
+    
+    return {
+        "success": True,
+        "crafted_item": recipe["result_item"],
+        "quantity": quantity_crafted,
+        "message": f"Crafted {recipe['name']} x{craft_request.quantity}"
+    }
 
 
 # ============ INVENTORY SYSTEM ENDPOINTS ============
@@ -1906,7 +2675,7 @@ def get_inventory(user_id: str, world_id: str) -> Dict[str, Any]:
 @app.post("/inventory/update")
 def update_inventory(inventory_data: InventoryUpdate, user_id: str) -> Dict[str, Any]:
     """Update player's inventory"""
-    with _get_connection() as conn:
+    def _upsert(conn: sqlite3.Connection) -> None:
         existing = conn.execute(
             "SELECT id FROM player_inventory WHERE user_id = ? AND world_id = ?",
             (user_id, inventory_data.world_id)
@@ -1924,7 +2693,8 @@ def update_inventory(inventory_data: InventoryUpdate, user_id: str) -> Dict[str,
                 (str(uuid4()), user_id, inventory_data.world_id, json.dumps(inventory_data.items),
                  inventory_data.currency, 50, now_iso())
             )
-        conn.commit()
+
+    _write(_upsert)
     
     return {"message": "Inventory updated"}
 
@@ -1954,7 +2724,7 @@ def get_reputation(user_id: str, world_id: str) -> Dict[str, Any]:
 @app.post("/reputation/update")
 def update_reputation(rep_data: ReputationUpdate, user_id: str) -> Dict[str, Any]:
     """Update reputation with a faction"""
-    with _get_connection() as conn:
+    def _upsert(conn: sqlite3.Connection) -> None:
         existing = conn.execute(
             "SELECT * FROM player_reputation WHERE user_id = ? AND world_id = ? AND faction_name = ?",
             (user_id, rep_data.world_id, rep_data.faction_name)
@@ -1975,7 +2745,8 @@ def update_reputation(rep_data: ReputationUpdate, user_id: str) -> Dict[str, Any
                 (str(uuid4()), user_id, rep_data.world_id, rep_data.faction_name, 
                  rep_data.points_change, "neutral", now_iso())
             )
-        conn.commit()
+
+    _write(_upsert)
     
     return {"message": "Reputation updated"}
 
@@ -1987,14 +2758,15 @@ def create_pet(pet_data: PetCreate, user_id: str) -> Dict[str, Any]:
     """Create/adopt a new pet"""
     pet_id = str(uuid4())
     
-    with _get_connection() as conn:
+    def _insert(conn: sqlite3.Connection) -> None:
         conn.execute(
             """INSERT INTO player_pets (id, user_id, world_id, pet_name, pet_type, level, stats, abilities, is_active, created_at)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (pet_id, user_id, pet_data.world_id, pet_data.pet_name, pet_data.pet_type,
              1, json.dumps(pet_data.stats), json.dumps(pet_data.abilities), 0, now_iso())
         )
-        conn.commit()
+
+    _write(_insert)
     
     return {"pet_id": pet_id, "message": f"Pet {pet_data.pet_name} created!"}
 
@@ -2040,7 +2812,7 @@ def select_class(class_data: ClassSelect, user_id: str) -> Dict[str, Any]:
     
     skills = class_skills.get(class_data.class_name.lower(), [])
     
-    with _get_connection() as conn:
+    def _upsert(conn: sqlite3.Connection) -> None:
         existing = conn.execute(
             "SELECT id FROM player_classes WHERE user_id = ? AND world_id = ?",
             (user_id, class_data.world_id)
@@ -2057,7 +2829,8 @@ def select_class(class_data: ClassSelect, user_id: str) -> Dict[str, Any]:
                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
                 (class_id, user_id, class_data.world_id, class_data.class_name, 1, 0, json.dumps(skills), now_iso())
             )
-        conn.commit()
+
+    _write(_upsert)
     
     return {"message": f"Class {class_data.class_name} selected", "skills": skills}
 
@@ -2069,14 +2842,15 @@ def create_world_event(event: WorldEvent, user_id: str) -> Dict[str, Any]:
     """Create a dynamic world event"""
     event_id = str(uuid4())
     
-    with _get_connection() as conn:
+    def _insert(conn: sqlite3.Connection) -> None:
         conn.execute(
             """INSERT INTO world_events (id, world_id, event_type, event_name, description, start_time, end_time, event_data, is_active)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (event_id, event.world_id, event.event_type, event.event_name, event.description,
              now_iso(), None, json.dumps(event.event_data), 1)
         )
-        conn.commit()
+
+    _write(_insert)
     
     return {"event_id": event_id, "message": "World event created"}
 
@@ -2085,10 +2859,7 @@ def create_world_event(event: WorldEvent, user_id: str) -> Dict[str, Any]:
 def get_active_events(world_id: str) -> Dict[str, Any]:
     """Get all active events for a world"""
     with _get_connection() as conn:
-        rows = conn.execute(
-            "SELECT * FROM world_events WHERE world_id = ? AND is_active = 1",
-            (world_id,)
-        ).fetchall()
+        rows = conn.execute(route_queries.ACTIVE_EVENTS_SQL, (world_id,)).fetchall()
         
         events = []
         for row in rows:
@@ -2111,7 +2882,7 @@ def create_clan(clan_data: ClanCreate, user_id: str) -> Dict[str, Any]:
     clan_id = str(uuid4())
     member_id = str(uuid4())
     
-    with _get_connection() as conn:
+    def _insert(conn: sqlite3.Connection) -> None:
         conn.execute(
             "INSERT INTO clans (id, name, description, leader_id, member_count, clan_level, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
             (clan_id, clan_data.name, clan_data.description, user_id, 1, 1, now_iso())
@@ -2121,8 +2892,8 @@ def create_clan(clan_data: ClanCreate, user_id: str) -> Dict[str, Any]:
             "INSERT INTO clan_members (id, clan_id, user_id, rank, joined_at) VALUES (?, ?, ?, ?, ?)",
             (member_id, clan_id, user_id, "leader", now_iso())
         )
-        
-        conn.commit()
+
+    _write(_insert)
     
     return {"clan_id": clan_id, "message": f"Clan {clan_data.name} created"}
 
@@ -2153,28 +2924,33 @@ def create_market_listing(listing: MarketListing, user_id: str) -> Dict[str, Any
     """List an item for sale"""
     listing_id = str(uuid4())
     
-    with _get_connection() as conn:
+    def _insert(conn: sqlite3.Connection) -> None:
         conn.execute(
             """INSERT INTO market_listings (id, seller_id, item_id, item_name, price, quantity, description, is_sold, created_at)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (listing_id, user_id, listing.item_id, listing.item_name, listing.price, 
              listing.quantity, listing.description, 0, now_iso())
         )
-        conn.commit()
+
+    _write(_insert)
     
     return {"listing_id": listing_id, "message": "Item listed for sale"}
 
 
 @app.get("/market/browse")
-def browse_market() -> Dict[str, Any]:
+def browse_market(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+) -> Dict[str, Any]:
     """Browse market listings"""
+    seek, order, params = _keyset("market", ["created_at", "id"], cursor, limit)
+
     with _get_connection() as conn:
-        rows = conn.execute(
-            "SELECT * FROM market_listings WHERE is_sold = 0 ORDER BY created_at DESC LIMIT 50"
-        ).fetchall()
+        rows = conn.execute(route_queries.market_page_sql(seek, order), params).fetchall()
         
+        page, next_cursor = split_page("market", [dict(row) for row in rows], ["created_at", "id"], limit)
         listings = []
-        for row in rows:
+        for row in page:
             listings.append({
                 "id": row["id"],
                 "item_name": row["item_name"],
@@ -2184,13 +2960,14 @@ def browse_market() -> Dict[str, Any]:
                 "seller_id": row["seller_id"]
             })
         
-        return {"listings": listings, "total": len(listings)}
+        return {"listings": listings, "total": len(listings), "next_cursor": next_cursor}
 
 
 @app.post("/market/buy")
 def buy_market_item(purchase: MarketPurchase, user_id: str) -> Dict[str, Any]:
     """Buy a market listing"""
-    with _get_connection() as conn:
+    # Read and update in one write job so two buyers cannot both take the last units.
+    def _buy(conn: sqlite3.Connection) -> Tuple[sqlite3.Row, int]:
         listing = conn.execute(
             "SELECT * FROM market_listings WHERE id = ? AND is_sold = 0",
             (purchase.listing_id,)
@@ -2213,8 +2990,9 @@ def buy_market_item(purchase: MarketPurchase, user_id: str) -> Dict[str, Any]:
                 "UPDATE market_listings SET quantity = ? WHERE id = ?",
                 (remaining, purchase.listing_id),
             )
+        return listing, remaining
 
-        conn.commit()
+    listing, remaining = _write(_buy)
 
     return {
         "message": "Purchase successful",
@@ -2264,7 +3042,7 @@ def get_player_stats(user_id: str) -> Dict[str, Any]:
 @app.post("/stats/update")
 def update_player_stats(user_id: str, stat_updates: Dict[str, Any]) -> Dict[str, Any]:
     """Update player statistics"""
-    with _get_connection() as conn:
+    def _update(conn: sqlite3.Connection) -> None:
         existing = conn.execute(
             "SELECT id FROM player_stats WHERE user_id = ?",
             (user_id,)
@@ -2302,7 +3080,8 @@ def update_player_stats(user_id: str, stat_updates: Dict[str, Any]) -> Dict[str,
                  stat_updates.get("achievements_unlocked", 0),
                  now_iso())
             )
-        conn.commit()
+
+    _write(_update)
     
     return {"message": "Statistics updated"}
 
@@ -2343,7 +3122,7 @@ def get_user_settings(user_id: str) -> Dict[str, Any]:
 @app.post("/settings/update")
 def update_settings(settings_data: SettingsUpdate, user_id: str) -> Dict[str, Any]:
     """Update user settings"""
-    with _get_connection() as conn:
+    def _upsert(conn: sqlite3.Connection) -> None:
         existing = conn.execute(
             "SELECT id FROM user_settings WHERE user_id = ?",
             (user_id,)
@@ -2382,7 +3161,8 @@ def update_settings(settings_data: SettingsUpdate, user_id: str) -> Dict[str, An
                  json.dumps(settings_data.controls_config) if settings_data.controls_config else None,
                  now_iso())
             )
-        conn.commit()
+
+    _write(_upsert)
     
     return {"message": "Settings updated"}
 
@@ -2394,14 +3174,16 @@ def create_template(template: TemplateCreate, user_id: str) -> Dict[str, Any]:
     """Create a world template"""
     template_id = str(uuid4())
     
-    with _get_connection() as conn:
+    def _insert(conn: sqlite3.Connection) -> None:
+        template_data, encoding = compression.encode(conn, compression.TEMPLATES, json.dumps(template.template_data))
         conn.execute(
-            """INSERT INTO world_templates (id, name, description, category, template_data, thumbnail_url, usage_count, created_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            """INSERT INTO world_templates (id, name, description, category, template_data, encoding, thumbnail_url, usage_count, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (template_id, template.name, template.description, template.category,
-             json.dumps(template.template_data), template.thumbnail_url, 0, now_iso())
+             template_data, encoding, template.thumbnail_url, 0, now_iso())
         )
-        conn.commit()
+
+    _write(_insert)
     
     return {"template_id": template_id, "message": "Template created"}
 
@@ -2441,18 +3223,19 @@ def get_template(template_id: str) -> Dict[str, Any]:
             raise HTTPException(status_code=404, detail="Template not found")
         
         # Increment usage count
-        conn.execute(
-            "UPDATE world_templates SET usage_count = usage_count + 1 WHERE id = ?",
-            (template_id,)
+        _write(
+            lambda write_conn: write_conn.execute(
+                "UPDATE world_templates SET usage_count = usage_count + 1 WHERE id = ?",
+                (template_id,)
+            )
         )
-        conn.commit()
         
         return {
             "id": template["id"],
             "name": template["name"],
             "description": template["description"],
             "category": template["category"],
-            "template_data": json.loads(template["template_data"]),
+            "template_data": json.loads(compression.decode(conn, template["template_data"], template["encoding"])),
             "thumbnail_url": template["thumbnail_url"]
         }
 
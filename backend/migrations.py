@@ -0,0 +1,390 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import browse_rankings
+import compression
+import generation_jobs
+import route_queries
+import save_deltas
+import world_store
+from pagination import DEFAULT_PAGE_SIZE, encode_cursor, keyset_page
+from utils import now_iso
+
+Migration = Tuple[int, str, Callable[[sqlite3.Connection], None]]
+
+
+def _add_column_if_missing(conn: sqlite3.Connection, table: str, column: str, ddl: str) -> None:
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def _worlds_social_columns(conn: sqlite3.Connection) -> None:
+    # Databases created before publishing/likes existed lack these columns.
+    _add_column_if_missing(conn, "worlds", "user_id", "TEXT")
+    _add_column_if_missing(conn, "worlds", "is_public", "INTEGER DEFAULT 0")
+    _add_column_if_missing(conn, "worlds", "play_count", "INTEGER DEFAULT 0")
+    _add_column_if_missing(conn, "worlds", "likes", "INTEGER DEFAULT 0")
+
+
+HOT_PATH_INDEXES = [
+    # /worlds?user_id=... (covering: id, summary, created_at)
+    "CREATE INDEX IF NOT EXISTS idx_worlds_user_created ON worlds (user_id, created_at DESC, id, summary)",
+    # /worlds without user_id
+    "CREATE INDEX IF NOT EXISTS idx_worlds_created ON worlds (created_at DESC)",
+    # /browse?sort=popular|recent|likes
+    "CREATE INDEX IF NOT EXISTS idx_worlds_public_popular ON worlds (play_count DESC, likes DESC) WHERE is_public = 1",
+    "CREATE INDEX IF NOT EXISTS idx_worlds_public_recent ON worlds (created_at DESC) WHERE is_public = 1",
+    "CREATE INDEX IF NOT EXISTS idx_worlds_public_likes ON worlds (likes DESC) WHERE is_public = 1",
+    # /worlds/{id}/leaderboard
+    "CREATE INDEX IF NOT EXISTS idx_leaderboard_world_score ON leaderboard (world_id, score DESC)",
+    # /assets/browse, /assets/list/{user_id}
+    "CREATE INDEX IF NOT EXISTS idx_assets_public_downloads ON custom_assets (downloads DESC, likes DESC) WHERE is_public = 1",
+    "CREATE INDEX IF NOT EXISTS idx_assets_public_type_downloads ON custom_assets (asset_type, downloads DESC, likes DESC) WHERE is_public = 1",
+    "CREATE INDEX IF NOT EXISTS idx_assets_user_created ON custom_assets (user_id, created_at DESC)",
+    # /market/browse
+    "CREATE INDEX IF NOT EXISTS idx_market_open_created ON market_listings (created_at DESC) WHERE is_sold = 0",
+    # /events/{world_id}/active
+    "CREATE INDEX IF NOT EXISTS idx_world_events_active ON world_events (world_id) WHERE is_active = 1",
+    # /quests/{world_id}, /quests/seed
+    "CREATE INDEX IF NOT EXISTS idx_quests_world ON quests (world_id)",
+    # /saves/list/{user_id}
+    "CREATE INDEX IF NOT EXISTS idx_game_saves_user_updated ON game_saves (user_id, updated_at DESC)",
+]
+
+
+def _hot_path_indexes(conn: sqlite3.Connection) -> None:
+    for statement in HOT_PATH_INDEXES:
+        conn.execute(statement)
+    conn.execute("ANALYZE")
+
+
+# Keyset pagination orders by the sort columns plus id; the index must end
+# with id as well or SQLite falls back to a temp b-tree for the tiebreak.
+KEYSET_INDEXES = [
+    "CREATE INDEX idx_worlds_user_created ON worlds (user_id, created_at DESC, id DESC, summary)",
+    "CREATE INDEX idx_worlds_created ON worlds (created_at DESC, id DESC)",
+    "CREATE INDEX idx_worlds_public_popular ON worlds (play_count DESC, likes DESC, id DESC) WHERE is_public = 1",
+    "CREATE INDEX idx_worlds_public_recent ON worlds (created_at DESC, id DESC) WHERE is_public = 1",
+    "CREATE INDEX idx_worlds_public_likes ON worlds (likes DESC, id DESC) WHERE is_public = 1",
+    "CREATE INDEX idx_assets_public_downloads ON custom_assets (downloads DESC, likes DESC, id DESC) WHERE is_public = 1",
+    "CREATE INDEX idx_assets_public_type_downloads ON custom_assets (asset_type, downloads DESC, likes DESC, id DESC) WHERE is_public = 1",
+    "CREATE INDEX idx_market_open_created ON market_listings (created_at DESC, id DESC) WHERE is_sold = 0",
+]
+
+
+def _keyset_indexes(conn: sqlite3.Connection) -> None:
+    for statement in KEYSET_INDEXES:
+        name = statement.split()[2]
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.execute(statement)
+    conn.execute("ANALYZE")
+
+
+def _world_sections(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS world_sections (
+            world_id TEXT NOT NULL,
+            section TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            body TEXT NOT NULL,
+            PRIMARY KEY (world_id, section),
+            FOREIGN KEY (world_id) REFERENCES worlds(id)
+        ) WITHOUT ROWID
+        """
+    )
+    # Move existing payload blobs into sections; payload is left empty.
+    rows = conn.execute("SELECT id, payload FROM worlds WHERE payload != ''").fetchall()
+    for world_id, payload in rows:
+        conn.executemany(
+            "INSERT OR REPLACE INTO world_sections (world_id, section, position, body) VALUES (?, ?, ?, ?)",
+            [
+                (world_id, section, position, body)
+                for position, (section, body) in enumerate(world_store.split_payload(json.loads(payload)))
+            ],
+        )
+        conn.execute("UPDATE worlds SET payload = '' WHERE id = ?", (world_id,))
+
+
+def _compressed_storage(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS compression_dictionaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            data BLOB NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+    for table in ("world_sections", "game_saves", "world_templates"):
+        _add_column_if_missing(conn, table, "encoding", "TEXT")
+
+    # Trained from the rows already stored; kinds with too few rows get their
+    # dictionary later from compression.ensure_dictionaries at startup.
+    for kind in (compression.SAVES, compression.TEMPLATES):
+        if compression.train_from_table(conn, kind) is not None:
+            compression.recompress_table(conn, kind)
+
+
+def _generation_cache(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS generation_cache (
+            key TEXT PRIMARY KEY,
+            body BLOB NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_generation_cache_expires ON generation_cache (expires_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_generation_cache_created ON generation_cache (created_at)")
+
+
+def _world_recipes(conn: sqlite3.Connection) -> None:
+    # Normalized request + seed; enough to regenerate worlds created from now on.
+    _add_column_if_missing(conn, "worlds", "seed", "INTEGER")
+    _add_column_if_missing(conn, "worlds", "recipe", "TEXT")
+
+
+def _generation_jobs(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            request TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            webhook_url TEXT,
+            available_at REAL NOT NULL,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT
+        )
+        """
+    )
+    # Worker claim: highest priority queued job that is due.
+    conn.execute(
+        """CREATE INDEX IF NOT EXISTS idx_generation_jobs_queued
+           ON generation_jobs (priority DESC, available_at, id) WHERE status = 'queued'"""
+    )
+    # Backpressure: count of queued + running jobs, ignoring finished history.
+    conn.execute(
+        """CREATE INDEX IF NOT EXISTS idx_generation_jobs_pending
+           ON generation_jobs (status) WHERE status IN ('queued', 'running')"""
+    )
+
+
+def _leaderboard_best(conn: sqlite3.Connection) -> None:
+    # One row per (world, board, player) instead of one per submission; boards
+    # are "all", "daily:YYYY-MM-DD" and "weekly:YYYY-Www" (see leaderboards.py).
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS leaderboard_best (
+            world_id TEXT NOT NULL,
+            board TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            username TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            completed_missions INTEGER DEFAULT 0,
+            play_time INTEGER DEFAULT 0,
+            achieved_at TEXT NOT NULL,
+            PRIMARY KEY (world_id, board, user_id)
+        ) WITHOUT ROWID
+        """
+    )
+    # All-time bests from the old per-submission rows; with a lone MAX() SQLite
+    # takes the other columns from the row holding the maximum.
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO leaderboard_best
+            (world_id, board, user_id, username, score, completed_missions, play_time, achieved_at)
+        SELECT world_id, 'all', user_id, username, MAX(score), completed_missions, play_time, created_at
+        FROM leaderboard GROUP BY world_id, user_id
+        """
+    )
+
+
+def _save_deltas(conn: sqlite3.Connection) -> None:
+    # game_saves keeps the snapshot; versions snapshot_version + 1 .. version are
+    # JSON patches in game_save_deltas (see save_deltas.py).
+    _add_column_if_missing(conn, "game_saves", "version", "INTEGER NOT NULL DEFAULT 1")
+    _add_column_if_missing(conn, "game_saves", "snapshot_version", "INTEGER NOT NULL DEFAULT 1")
+    _add_column_if_missing(conn, "game_saves", "delta_bytes", "INTEGER NOT NULL DEFAULT 0")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS game_save_deltas (
+            save_id TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            patch TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (save_id, version),
+            FOREIGN KEY (save_id) REFERENCES game_saves(id)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def _save_slot_index(conn: sqlite3.Connection) -> None:
+    # Slot listings read only this index: the snapshot blobs sit in the table
+    # rows (and their overflow pages) and are read by /saves/load alone.
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_game_saves_slots ON game_saves ({save_deltas.SLOT_INDEX_COLUMNS})")
+    # Same leading columns; the covering index serves everything it did.
+    conn.execute("DROP INDEX IF EXISTS idx_game_saves_user_updated")
+
+
+def _world_section_segments(conn: sqlite3.Connection) -> None:
+    # Sections become deflate segments that gzip responses are spliced from,
+    # replacing the separate whole-document copy in world_documents.
+    _add_column_if_missing(conn, "world_sections", "size", "INTEGER")
+    _add_column_if_missing(conn, "world_sections", "crc", "INTEGER")
+    rows = conn.execute(
+        "SELECT world_id, section, body, encoding FROM world_sections WHERE encoding IS NOT ?", (compression.DEFLATE,)
+    ).fetchall()
+    updates = []
+    for world_id, section, body, encoding in rows:
+        segment, size, crc = compression.stored_segment(compression.decode(conn, body, encoding).encode())
+        updates.append((segment, compression.DEFLATE, size, crc, world_id, section))
+    conn.executemany(
+        "UPDATE world_sections SET body = ?, encoding = ?, size = ?, crc = ? WHERE world_id = ? AND section = ?",
+        updates,
+    )
+    conn.execute("DROP TABLE IF EXISTS world_documents")
+    conn.execute("DELETE FROM compression_dictionaries WHERE kind = 'world_section'")
+
+
+MIGRATIONS: List[Migration] = [
+    (1, "worlds_social_columns", _worlds_social_columns),
+    (2, "hot_path_indexes", _hot_path_indexes),
+    (3, "keyset_indexes", _keyset_indexes),
+    (4, "world_sections", _world_sections),
+    (5, "compressed_storage", _compressed_storage),
+    (6, "generation_cache", _generation_cache),
+    (7, "world_recipes", _world_recipes),
+    (8, "generation_jobs", _generation_jobs),
+    (9, "leaderboard_best", _leaderboard_best),
+    (10, "save_deltas", _save_deltas),
+    (11, "save_slot_index", _save_slot_index),
+    (12, "world_section_segments", _world_section_segments),
+]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn: sqlite3.Connection) -> List[int]:
+    """Apply pending migrations in order and return the versions applied."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        """
+    )
+    applied = []
+    version = current_version(conn)
+    for number, name, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        migrate(conn)
+        conn.execute(
+            "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+            (number, name, now_iso()),
+        )
+        applied.append(number)
+    return applied
+
+
+def _page(
+    build: Callable[[str, str], str], columns: List[str], last: Optional[List[Any]], *filters: Any
+) -> Tuple[str, tuple]:
+    """A keyset page query as the route builds it: after ``last`` (first page when None)."""
+    cursor = encode_cursor("plan", last) if last is not None else None
+    seek, order, params = keyset_page("plan", columns, cursor, DEFAULT_PAGE_SIZE)
+    return build(seek, order), (*filters, *params)
+
+
+# Each hot route's SQL with representative parameters. The SQL comes from the
+# modules that run it, so the plan check cannot drift from the routes.
+HOT_QUERIES: Dict[str, Tuple[str, tuple]] = {
+    "worlds_by_user": _page(
+        lambda seek, order: route_queries.worlds_page_sql(True, seek, order), ["created_at", "id"], ["2024", "w"], "user"
+    ),
+    "worlds_recent": _page(
+        lambda seek, order: route_queries.worlds_page_sql(False, seek, order), ["created_at", "id"], None
+    ),
+    "browse_details": (browse_rankings.DETAILS_SQL.format(placeholders="?, ?, ?"), ("a", "b", "c")),
+    "assets_public": _page(
+        lambda seek, order: route_queries.public_assets_page_sql(False, seek, order),
+        ["downloads", "likes", "id"],
+        [10, 5, "a"],
+    ),
+    "assets_public_by_type": _page(
+        lambda seek, order: route_queries.public_assets_page_sql(True, seek, order),
+        ["downloads", "likes", "id"],
+        [10, 5, "a"],
+        "model",
+    ),
+    "assets_by_user": (route_queries.ASSETS_BY_USER_SQL, ("user",)),
+    "market_open": _page(route_queries.market_page_sql, ["created_at", "id"], ["2024", "m"]),
+    "world_events_active": (route_queries.ACTIVE_EVENTS_SQL, ("world",)),
+    "quests_by_world": (route_queries.WORLD_QUESTS_SQL, ("world",)),
+    "saves_by_user": (save_deltas.SLOT_LIST_SQL, ("user",)),
+    "save_deltas_replay": (save_deltas.REPLAY_SQL, ("save", 1, 5)),
+    "generation_job_claim": (generation_jobs.CLAIM_SQL, (0.0,)),
+    "generation_jobs_pending": (generation_jobs.PENDING_SQL, ()),
+}
+
+
+# Hot queries that must not read table rows of their main table at all.
+COVERING_QUERIES = {"saves_by_user"}
+
+
+def find_table_scans(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+    """Return the EXPLAIN QUERY PLAN lines of hot queries that scan a table or sort in a temp b-tree,
+    or, for COVERING_QUERIES, that miss a covering index."""
+    offenders: Dict[str, List[str]] = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+        bad = [
+            detail
+            for detail in plan
+            if (detail.startswith("SCAN") and "USING" not in detail) or "TEMP B-TREE" in detail
+        ]
+        if name in COVERING_QUERIES and not any("COVERING INDEX" in detail for detail in plan):
+            bad.extend(plan)
+        if bad:
+            offenders[name] = bad
+    return offenders
+
+
+if __name__ == "__main__":
+    # Query plan regression check: builds a fresh schema and fails if any hot
+    # route falls back to a full table scan or an ORDER BY sort.
+    import os
+    import sys
+    import tempfile
+
+    os.environ["DATASHARK_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "plans.db")
+    import main
+
+    main.init_db()
+    with main._get_connection() as conn:
+        scans = find_table_scans(conn)
+    for query, details in scans.items():
+        print(f"{query}: {'; '.join(details)}")
+    if scans:
+        sys.exit(1)
+    print(f"{len(HOT_QUERIES)} hot queries use indexes")
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import random
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 
 def _pick_biomes(theme: str) -> List[str]:
@@ -48,18 +48,18 @@ def _pick_missions(theme: str) -> List[Dict[str, Any]]:
     ]
 
 
-def _generate_buildings(zone_type: str) -> List[Dict[str, Any]]:
+def _generate_buildings(rng: random.Random, zone_type: str) -> List[Dict[str, Any]]:
     """Generate buildings based on zone type"""
     buildings = []
     if "city" in zone_type.lower() or "neo" in zone_type.lower():
         buildings = [
-            {"type": "skyscraper", "height": random.randint(10, 30), "width": random.randint(4, 8), "depth": random.randint(4, 8), "color": "steel"},
-            {"type": "tower", "height": random.randint(15, 25), "width": 3, "depth": 3, "color": "glass"},
+            {"type": "skyscraper", "height": rng.randint(10, 30), "width": rng.randint(4, 8), "depth": rng.randint(4, 8), "color": "steel"},
+            {"type": "tower", "height": rng.randint(15, 25), "width": 3, "depth": 3, "color": "glass"},
             {"type": "plaza", "height": 2, "width": 10, "depth": 10, "color": "concrete"},
         ]
     elif "forest" in zone_type.lower():
         buildings = [
-            {"type": "tree", "height": random.randint(8, 15), "width": 2, "depth": 2, "color": "green"},
+            {"type": "tree", "height": rng.randint(8, 15), "width": 2, "depth": 2, "color": "green"},
             {"type": "ancient_stone", "height": 5, "width": 3, "depth": 3, "color": "stone"},
             {"type": "treehouse", "height": 10, "width": 4, "depth": 4, "color": "wood"},
         ]
@@ -71,37 +71,37 @@ def _generate_buildings(zone_type: str) -> List[Dict[str, Any]]:
         ]
     else:
         buildings = [
-            {"type": "house", "height": random.randint(3, 6), "width": random.randint(3, 5), "depth": random.randint(3, 5), "color": "brick"},
+            {"type": "house", "height": rng.randint(3, 6), "width": rng.randint(3, 5), "depth": rng.randint(3, 5), "color": "brick"},
             {"type": "shop", "height": 4, "width": 5, "depth": 4, "color": "wood"},
         ]
     
     return buildings
 
 
-def _generate_items(count: int = 10) -> List[Dict[str, Any]]:
+def _generate_items(rng: random.Random, count: int = 10) -> List[Dict[str, Any]]:
     """Generate collectible items"""
     item_types = ["health_potion", "mana_potion", "coin", "gem", "key", "scroll", "weapon", "armor", "food", "tool"]
     items = []
     for i in range(count):
         items.append({
-            "type": random.choice(item_types),
-            "value": random.randint(10, 100),
-            "rarity": random.choice(["common", "uncommon", "rare", "epic", "legendary"]),
-            "position": {"x": random.uniform(-50, 50), "y": 1, "z": random.uniform(-50, 50)}
+            "type": rng.choice(item_types),
+            "value": rng.randint(10, 100),
+            "rarity": rng.choice(["common", "uncommon", "rare", "epic", "legendary"]),
+            "position": {"x": rng.uniform(-50, 50), "y": 1, "z": rng.uniform(-50, 50)}
         })
     return items
 
 
-def _generate_obstacles(count: int = 15) -> List[Dict[str, Any]]:
+def _generate_obstacles(rng: random.Random, count: int = 15) -> List[Dict[str, Any]]:
     """Generate obstacles and environmental objects"""
     obstacle_types = ["rock", "wall", "barrier", "crate", "barrel", "fence", "bush", "debris"]
     obstacles = []
     for i in range(count):
         obstacles.append({
-            "type": random.choice(obstacle_types),
-            "size": random.choice(["small", "medium", "large"]),
-            "destructible": random.choice([True, False]),
-            "position": {"x": random.uniform(-60, 60), "y": 0, "z": random.uniform(-60, 60)}
+            "type": rng.choice(obstacle_types),
+            "size": rng.choice(["small", "medium", "large"]),
+            "destructible": rng.choice([True, False]),
+            "position": {"x": rng.uniform(-60, 60), "y": 0, "z": rng.uniform(-60, 60)}
         })
     return obstacles
 
@@ -111,7 +111,14 @@ def generate_world(
     research_context: Dict[str, Any],
     platforms: List[str],
     enable_ar_vr: bool,
+    seed: Optional[int] = None,
 ) -> Dict[str, Any]:
+    """Build the base world; the same seed and inputs always give the same world.
+
+    Without a seed the world is random. All randomness comes from one
+    per-call ``random.Random`` so concurrent requests never share state.
+    """
+    rng = random.Random(seed)
     summary = f"{prompt.strip().capitalize()}"
     theme = research_context.get("focus") or "general"
     biomes = _pick_biomes(theme)
@@ -125,11 +132,11 @@ def generate_world(
             "name": biome,
             "threat": threat_level,
             "landmark": f"Zone {i+1} Landmark",
-            "buildings": _generate_buildings(biome),
+            "buildings": _generate_buildings(rng, biome),
             "environment": {
-                "weather": random.choice(["clear", "rainy", "foggy", "stormy", "snowy"]),
-                "temperature": random.randint(-10, 40),
-                "time": random.choice(["dawn", "day", "dusk", "night"])
+                "weather": rng.choice(["clear", "rainy", "foggy", "stormy", "snowy"]),
+                "temperature": rng.randint(-10, 40),
+                "time": rng.choice(["dawn", "day", "dusk", "night"])
             }
         })
 
@@ -138,8 +145,8 @@ def generate_world(
         {
             "name": "Kai",
             "role": "Guide",
-            "level": random.randint(5, 10),
-            "health": random.randint(80, 120),
+            "level": rng.randint(5, 10),
+            "health": rng.randint(80, 120),
             "memory": ["Player is new", "Knows the city layout"],
             "behavior": "Adaptive support",
             "dialogue": ["Welcome, traveler!", "I can show you around.", "Stay safe out there."],
@@ -149,7 +156,7 @@ def generate_world(
         {
             "name": "Nyx",
             "role": "Merchant",
-            "level": random.randint(3, 8),
+            "level": rng.randint(3, 8),
             "health": 100,
             "memory": ["Tracks player reputation"],
             "behavior": "Trades and reacts to alliances",
@@ -160,8 +167,8 @@ def generate_world(
         {
             "name": "Rex",
             "role": "Warrior",
-            "level": random.randint(10, 15),
-            "health": random.randint(150, 200),
+            "level": rng.randint(10, 15),
+            "health": rng.randint(150, 200),
             "memory": ["Veteran fighter"],
             "behavior": "Aggressive defender",
             "dialogue": ["I'll fight by your side!", "No enemy stands a chance!"],
@@ -170,8 +177,8 @@ def generate_world(
         {
             "name": "Luna",
             "role": "Healer",
-            "level": random.randint(8, 12),
-            "health": random.randint(70, 100),
+            "level": rng.randint(8, 12),
+            "health": rng.randint(70, 100),
             "memory": ["Compassionate medic"],
             "behavior": "Support and heal",
             "dialogue": ["Let me heal you.", "Stay strong!", "I'm here to help."],
@@ -189,8 +196,8 @@ def generate_world(
     ]
 
     # Generate items and obstacles
-    items = _generate_items(15)
-    obstacles = _generate_obstacles(20)
+    items = _generate_items(rng, 15)
+    obstacles = _generate_obstacles(rng, 20)
 
     # Enhanced props with interaction
     props = [
@@ -260,11 +267,11 @@ def generate_world(
             "progression": "experience-based"
         },
         "lighting": {
-            "time_of_day": random.choice(["dawn", "day", "dusk", "night"]),
-            "fog_density": random.uniform(0.01, 0.05),
-            "color_grade": random.choice(["neon-cool", "warm-sunset", "cold-blue", "dramatic-red"]),
-            "ambient": {"r": random.uniform(0.1, 0.3), "g": random.uniform(0.1, 0.3), "b": random.uniform(0.1, 0.3)},
-            "directional": {"intensity": random.uniform(0.5, 1.5), "angle": random.randint(0, 360)}
+            "time_of_day": rng.choice(["dawn", "day", "dusk", "night"]),
+            "fog_density": rng.uniform(0.01, 0.05),
+            "color_grade": rng.choice(["neon-cool", "warm-sunset", "cold-blue", "dramatic-red"]),
+            "ambient": {"r": rng.uniform(0.1, 0.3), "g": rng.uniform(0.1, 0.3), "b": rng.uniform(0.1, 0.3)},
+            "directional": {"intensity": rng.uniform(0.5, 1.5), "angle": rng.randint(0, 360)}
         },
         "audio": {
             "bgm": f"{theme.lower()}_theme.mp3",
@@ -273,7 +280,7 @@ def generate_world(
         },
         "weather_system": {
             "enabled": True,
-            "current": random.choice(["clear", "cloudy", "rainy", "stormy"]),
+            "current": rng.choice(["clear", "cloudy", "rainy", "stormy"]),
             "dynamic": True
         }
     }
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import struct
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+MEDIA_TYPE = "application/msgpack"
+# Some clients still send the older x- form.
+MEDIA_TYPES = (MEDIA_TYPE, "application/x-msgpack")
+
+_UINT8 = struct.Struct(">B")
+_UINT16 = struct.Struct(">H")
+_UINT32 = struct.Struct(">I")
+_UINT64 = struct.Struct(">Q")
+_INT8 = struct.Struct(">b")
+_INT16 = struct.Struct(">h")
+_INT32 = struct.Struct(">i")
+_INT64 = struct.Struct(">q")
+_FLOAT32 = struct.Struct(">f")
+_FLOAT64 = struct.Struct(">d")
+
+# Deepest array/map nesting unpackb accepts; deeper input is rejected rather
+# than recursing until the interpreter's stack limit.
+MAX_DEPTH = 256
+
+
+class Raw(NamedTuple):
+    """Bytes that are already one packed MessagePack value; :func:`packb` copies them as they are."""
+
+    data: bytes
+
+
+def _pack(obj: Any, out: bytearray) -> None:
+    if obj is None:
+        out.append(0xC0)
+    elif obj is True:
+        out.append(0xC3)
+    elif obj is False:
+        out.append(0xC2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -0x20 <= obj < 0:
+            out.append(obj & 0xFF)
+        elif obj >= 0:
+            if obj <= 0xFF:
+                out += b"\xcc" + _UINT8.pack(obj)
+            elif obj <= 0xFFFF:
+                out += b"\xcd" + _UINT16.pack(obj)
+            elif obj <= 0xFFFFFFFF:
+                out += b"\xce" + _UINT32.pack(obj)
+            elif obj <= 0xFFFFFFFFFFFFFFFF:
+                out += b"\xcf" + _UINT64.pack(obj)
+            else:
+                raise ValueError(f"Integer too large for MessagePack: {obj}")
+        elif obj >= -0x80:
+            out += b"\xd0" + _INT8.pack(obj)
+        elif obj >= -0x8000:
+            out += b"\xd1" + _INT16.pack(obj)
+        elif obj >= -0x80000000:
+            out += b"\xd2" + _INT32.pack(obj)
+        elif obj >= -0x8000000000000000:
+            out += b"\xd3" + _INT64.pack(obj)
+        else:
+            raise ValueError(f"Integer too small for MessagePack: {obj}")
+    elif isinstance(obj, float):
+        out += b"\xcb" + _FLOAT64.pack(obj)
+    elif isinstance(obj, str):
+        data = obj.encode()
+        size = len(data)
+        if size < 0x20:
+            out.append(0xA0 | size)
+        elif size <= 0xFF:
+            out += b"\xd9" + _UINT8.pack(size)
+        elif size <= 0xFFFF:
+            out += b"\xda" + _UINT16.pack(size)
+        else:
+            out += b"\xdb" + _UINT32.pack(size)
+        out += data
+    elif isinstance(obj, dict):
+        size = len(obj)
+        if size < 0x10:
+            out.append(0x80 | size)
+        elif size <= 0xFFFF:
+            out += b"\xde" + _UINT16.pack(size)
+        else:
+            out += b"\xdf" + _UINT32.pack(size)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    elif isinstance(obj, (list, tuple)):
+        if isinstance(obj, Raw):
+            out += obj.data
+            return
+        size = len(obj)
+        if size < 0x10:
+            out.append(0x90 | size)
+        elif size <= 0xFFFF:
+            out += b"\xdc" + _UINT16.pack(size)
+        else:
+            out += b"\xdd" + _UINT32.pack(size)
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        data = bytes(obj)
+        size = len(data)
+        if size <= 0xFF:
+            out += b"\xc4" + _UINT8.pack(size)
+        elif size <= 0xFFFF:
+            out += b"\xc5" + _UINT16.pack(size)
+        else:
+            out += b"\xc6" + _UINT32.pack(size)
+        out += data
+    else:
+        raise TypeError(f"Cannot pack {type(obj).__name__} as MessagePack")
+
+
+def packb(obj: Any) -> bytes:
+    """MessagePack encoding of JSON-like data (plus bytes); :class:`Raw` values are spliced in unchanged."""
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+# Fixed-width scalars: first byte -> (struct, size).
+_SCALARS: Dict[int, Tuple[struct.Struct, int]] = {
+    0xCA: (_FLOAT32, 4),
+    0xCB: (_FLOAT64, 8),
+    0xCC: (_UINT8, 1),
+    0xCD: (_UINT16, 2),
+    0xCE: (_UINT32, 4),
+    0xCF: (_UINT64, 8),
+    0xD0: (_INT8, 1),
+    0xD1: (_INT16, 2),
+    0xD2: (_INT32, 4),
+    0xD3: (_INT64, 8),
+}
+# Variable-length values: first byte -> (kind, struct of the length).
+_SIZED: Dict[int, Tuple[str, struct.Struct]] = {
+    0xC4: ("bin", _UINT8),
+    0xC5: ("bin", _UINT16),
+    0xC6: ("bin", _UINT32),
+    0xD9: ("str", _UINT8),
+    0xDA: ("str", _UINT16),
+    0xDB: ("str", _UINT32),
+    0xDC: ("array", _UINT16),
+    0xDD: ("array", _UINT32),
+    0xDE: ("map", _UINT16),
+    0xDF: ("map", _UINT32),
+}
+
+
+def _unpack(data: bytes, position: int, json_only: bool, depth: int = 0) -> Tuple[Any, int]:
+    first = data[position]
+    position += 1
+    if first < 0x80:
+        return first, position
+    if first >= 0xE0:
+        return first - 0x100, position
+    if 0xA0 <= first <= 0xBF:
+        end = position + (first & 0x1F)
+        return data[position:end].decode(), end
+    if 0x90 <= first <= 0x9F:
+        kind, size = "array", first & 0x0F
+    elif 0x80 <= first <= 0x8F:
+        kind, size = "map", first & 0x0F
+    elif first == 0xC0:
+        return None, position
+    elif first == 0xC2:
+        return False, position
+    elif first == 0xC3:
+        return True, position
+    elif first in _SCALARS:
+        scalar, width = _SCALARS[first]
+        return scalar.unpack_from(data, position)[0], position + width
+    elif first in _SIZED:
+        kind, length = _SIZED[first]
+        size = length.unpack_from(data, position)[0]
+        position += length.size
+    else:
+        raise ValueError(f"Unsupported MessagePack type byte 0x{first:02x}")
+    if kind in ("array", "map"):
+        depth += 1
+        if depth > MAX_DEPTH:
+            raise ValueError(f"Invalid MessagePack data: nested deeper than {MAX_DEPTH} levels")
+
+    if kind == "str":
+        return data[position : position + size].decode(), position + size
+    if kind == "bin":
+        if json_only:
+            raise ValueError("Invalid MessagePack data: binary values have no JSON equivalent")
+        return bytes(data[position : position + size]), position + size
+    if kind == "array":
+        items: List[Any] = []
+        for _ in range(size):
+            item, position = _unpack(data, position, json_only, depth)
+            items.append(item)
+        return items, position
+    mapping: Dict[Any, Any] = {}
+    for _ in range(size):
+        key, position = _unpack(data, position, json_only, depth)
+        if json_only and not isinstance(key, str):
+            raise ValueError("Invalid MessagePack data: map keys must be strings")
+        value, position = _unpack(data, position, json_only, depth)
+        mapping[key] = value
+    return mapping, position
+
+
+def unpackb(data: bytes, json_only: bool = False) -> Any:
+    """Decode one MessagePack value; raises ValueError on truncated, trailing, too deeply nested or unsupported data.
+
+    With ``json_only``, binary values and non-string map keys are rejected
+    too, so the result round-trips through JSON unchanged.
+    """
+    try:
+        value, position = _unpack(data, 0, json_only)
+    except (IndexError, struct.error, UnicodeDecodeError, TypeError) as exc:
+        raise ValueError(f"Invalid MessagePack data: {exc}") from exc
+    if position != len(data):
+        raise ValueError(f"Invalid MessagePack data: {'truncated' if position > len(data) else 'trailing bytes'}")
+    return value
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return (content_type or "").split(";", 1)[0].strip().lower() in MEDIA_TYPES
+
+
+def accepts_msgpack(accept: Optional[str]) -> bool:
+    """Whether ``accept`` prefers MessagePack over JSON (ties go to JSON)."""
+    best: Dict[str, float] = {"msgpack": 0.0, "json": 0.0}
+    for part in (accept or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        params = params.strip()
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        kind = "msgpack" if name in MEDIA_TYPES else "json" if name in ("application/json", "*/*", "application/*") else None
+        if kind is not None:
+            best[kind] = max(best[kind], quality)
+    return best["msgpack"] > best["json"]
+
+
+if __name__ == "__main__":
+    # An open-world save (position arrays, inventory, explored map) as JSON
+    # text versus MessagePack: size raw and deflated, encode and decode time.
+    import json
+    import random
+    import sys
+    import time
+    import zlib
+
+    positions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rounds = 20
+    random.seed(3)
+    state = {
+        "player": {"position": [512.25, 33.5, -1024.75], "rotation": [0.0, 1.5707963, 0.0], "hp": 87, "mana": 40},
+        "entities": [
+            {
+                "id": f"npc-{i}",
+                "position": [random.uniform(-4096, 4096), random.uniform(0, 256), random.uniform(-4096, 4096)],
+                "velocity": [random.uniform(-5, 5), 0.0, random.uniform(-5, 5)],
+                "state": random.choice(["idle", "patrol", "combat"]),
+            }
+            for i in range(positions)
+        ],
+        "inventory": [
+            {"id": f"item-{i}", "qty": random.randrange(1, 99), "durability": random.randrange(100), "equipped": i < 6}
+            for i in range(400)
+        ],
+        "explored": [random.random() < 0.3 for _ in range(4096)],
+    }
+
+    def _timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            result = fn()
+        return result, (time.perf_counter() - started) / rounds * 1000
+
+    text, json_encode = _timed(lambda: json.dumps(state).encode())
+    _, json_decode = _timed(lambda: json.loads(text))
+    packed, pack_time = _timed(lambda: packb(state))
+    unpacked, unpack_time = _timed(lambda: unpackb(packed))
+    assert unpacked == json.loads(text)
+
+    print(f"save state with {positions} entities")
+    print(f"  json    : {len(text):9d} bytes {len(zlib.compress(text)):9d} deflated "
+          f"encode {json_encode:7.2f} ms decode {json_decode:7.2f} ms")
+    print(f"  msgpack : {len(packed):9d} bytes {len(zlib.compress(packed)):9d} deflated "
+          f"encode {pack_time:7.2f} ms decode {unpack_time:7.2f} ms")
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(scope: str, values: Sequence[Any]) -> str:
+    """Opaque continuation token holding the sort key of the last row served."""
+    raw = json.dumps({"s": scope, "k": list(values)}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(scope: str, token: str, width: int, kinds: Optional[Sequence[type]] = None) -> List[Any]:
+    """Sort key stored in ``token``; raises InvalidCursor unless it is ``width`` scalars of this ``scope``.
+
+    With ``kinds``, each value must also be of the matching type, for keys
+    that are compared in Python rather than bound into SQL.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor("Malformed cursor") from exc
+    if not isinstance(data, dict) or data.get("s") != scope:
+        raise InvalidCursor("Cursor does not belong to this listing")
+    values = data.get("k")
+    if not isinstance(values, list) or len(values) != width:
+        raise InvalidCursor("Malformed cursor")
+    for position, value in enumerate(values):
+        kind = kinds[position] if kinds is not None else (str, int, float)
+        if isinstance(value, bool) or not isinstance(value, kind):
+            raise InvalidCursor("Malformed cursor")
+    return values
+
+
+def keyset_page(
+    scope: str,
+    columns: Sequence[str],
+    cursor: Optional[str],
+    limit: int,
+) -> Tuple[str, str, List[Any]]:
+    """Build the seek predicate, ORDER BY and LIMIT for a descending keyset page.
+
+    ``columns`` are the sort columns, most significant first, ending with a
+    unique tiebreaker. Returns ``(where, order_by, params)``; ``where`` is an
+    empty string on the first page. One extra row is requested so the caller
+    can tell whether another page exists.
+    """
+    order_by = ", ".join(f"{column} DESC" for column in columns)
+    if not cursor:
+        return "", f"ORDER BY {order_by} LIMIT ?", [limit + 1]
+    values = decode_cursor(scope, cursor, len(columns))
+    placeholders = ", ".join("?" for _ in columns)
+    where = f"({', '.join(columns)}) < ({placeholders})"
+    return where, f"ORDER BY {order_by} LIMIT ?", [*values, limit + 1]
+
+
+def split_page(
+    scope: str,
+    rows: List[Dict[str, Any]],
+    keys: Sequence[str],
+    limit: int,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Trim the look-ahead row and return ``(page, next_cursor)``."""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(scope, [last[key] for key in keys])
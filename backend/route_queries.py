@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+# SQL of the hot read routes in main.py. migrations.HOT_QUERIES builds its
+# plan checks from the same strings, so a route cannot drift from its check.
+# ``seek`` and ``order`` are the pieces returned by pagination.keyset_page.
+
+ASSETS_BY_USER_SQL = "SELECT * FROM custom_assets WHERE user_id = ? ORDER BY created_at DESC"
+ACTIVE_EVENTS_SQL = "SELECT * FROM world_events WHERE world_id = ? AND is_active = 1"
+WORLD_QUESTS_SQL = "SELECT * FROM quests WHERE world_id = ?"
+
+
+def worlds_page_sql(by_user: bool, seek: str, order: str) -> str:
+    """/worlds page; binds the user id first when ``by_user``."""
+    filters = ["user_id = ?"] if by_user else []
+    if seek:
+        filters.append(seek)
+    where = f"WHERE {' AND '.join(filters)} " if filters else ""
+    return f"SELECT id, summary, created_at FROM worlds {where}{order}"
+
+
+def public_assets_page_sql(by_type: bool, seek: str, order: str) -> str:
+    """/assets/browse page; binds the asset type first when ``by_type``."""
+    filters = ["is_public = 1"]
+    if by_type:
+        filters.append("asset_type = ?")
+    if seek:
+        filters.append(seek)
+    return f"SELECT * FROM custom_assets WHERE {' AND '.join(filters)} {order}"
+
+
+def market_page_sql(seek: str, order: str) -> str:
+    return f"SELECT * FROM market_listings WHERE is_sold = 0 {'AND ' + seek if seek else ''} {order}"
@@ -0,0 +1,635 @@
+from __future__ import annotations
+
+import copy
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import compression
+import msgpack_codec
+from utils import now_iso
+
+# Deltas after which the next save writes a fresh snapshot instead.
+DEFAULT_COMPACT_EVERY = 32
+# ... or once the chain's patches outweigh this share of the snapshot.
+DEFAULT_COMPACT_RATIO = 0.5
+# Reconstructed save states kept in memory, by save id.
+DEFAULT_MAX_CACHED = 256
+
+Patch = List[Dict[str, Any]]
+
+# Row columns needed to decide how to write the next version; no snapshot bytes.
+HEAD_COLUMNS = """id, user_id, world_id, slot_name, slot_number, version, snapshot_version, delta_bytes,
+    length(game_state) + length(player_stats) AS snapshot_bytes, encoding, progress_percentage, play_time"""
+
+# idx_game_saves_slots: every game_saves column a slot listing needs, so
+# listing never touches the rows holding the snapshots.
+SLOT_INDEX_COLUMNS = (
+    "user_id, updated_at DESC, id, world_id, slot_name, slot_number, progress_percentage, play_time, created_at"
+)
+
+SLOT_LIST_SQL = """
+    SELECT gs.id, gs.world_id, w.summary AS world_name, gs.slot_name, gs.slot_number,
+           gs.progress_percentage, gs.play_time, gs.created_at, gs.updated_at
+    FROM game_saves gs
+    LEFT JOIN worlds w ON gs.world_id = w.id
+    WHERE gs.user_id = ?
+    ORDER BY gs.updated_at DESC
+"""
+
+# Patches to replay onto the snapshot: (save_id, snapshot_version, version).
+REPLAY_SQL = "SELECT patch FROM game_save_deltas WHERE save_id = ? AND version > ? AND version <= ? ORDER BY version"
+
+UPSERT_SNAPSHOT_SQL = """
+    INSERT INTO game_saves
+        (id, user_id, world_id, slot_name, slot_number, game_state, player_stats, encoding,
+         progress_percentage, play_time, created_at, updated_at, version, snapshot_version, delta_bytes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 1, 0)
+    ON CONFLICT (user_id, world_id, slot_number) DO UPDATE SET
+        slot_name = excluded.slot_name,
+        game_state = excluded.game_state,
+        player_stats = excluded.player_stats,
+        encoding = excluded.encoding,
+        progress_percentage = excluded.progress_percentage,
+        play_time = excluded.play_time,
+        updated_at = excluded.updated_at,
+        version = game_saves.version + 1,
+        snapshot_version = game_saves.version + 1,
+        delta_bytes = 0
+    RETURNING id, version
+"""
+
+
+class VersionConflict(Exception):
+    def __init__(self, version: int) -> None:
+        super().__init__(f"Save is at version {version}")
+        self.version = version
+
+
+class Saved(NamedTuple):
+    save_id: str
+    version: int
+    # "snapshot", "delta" or "unchanged"
+    kind: str
+    # State bytes written by this save (snapshot columns or one patch).
+    bytes_written: int
+
+
+class _State(NamedTuple):
+    version: int
+    # Deltas stored on top of the snapshot.
+    chain: int
+    delta_bytes: int
+    snapshot_bytes: int
+    doc: Dict[str, Any]
+
+
+# ---- JSON patch (RFC 6902 add / remove / replace) ----------------------
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _tokens(pointer: str) -> List[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _index(container: List[Any], token: str, allow_end: bool) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise ValueError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise ValueError(f"Array index out of range: {index}")
+    return index
+
+
+def diff(old: Any, new: Any, path: str = "") -> Patch:
+    """Patch turning ``old`` into ``new``: objects are compared key by key, lists
+    element-wise when only their tail grew or their length is unchanged, and
+    anything else is replaced whole."""
+    if type(old) is not type(new):
+        return [{"op": "replace", "path": path, "value": new}]
+    if isinstance(old, dict):
+        ops: Patch = [{"op": "remove", "path": f"{path}/{_escape(key)}"} for key in old if key not in new]
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key in old:
+                ops.extend(diff(old[key], value, child))
+            else:
+                ops.append({"op": "add", "path": child, "value": value})
+        return ops
+    if isinstance(old, list):
+        if len(old) == len(new):
+            ops = []
+            for index, (before, after) in enumerate(zip(old, new)):
+                ops.extend(diff(before, after, f"{path}/{index}"))
+            return ops
+        if len(new) > len(old) and not diff(old, new[: len(old)]):
+            return [{"op": "add", "path": f"{path}/-", "value": value} for value in new[len(old) :]]
+        return [{"op": "replace", "path": path, "value": new}]
+    if old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def apply_patch(doc: Any, patch: Patch) -> Any:
+    """Apply ``patch`` to ``doc`` in place and return the result; raises ValueError on a bad operation."""
+    for operation in patch:
+        if not isinstance(operation, dict):
+            raise ValueError("Patch operations must be objects")
+        op = operation.get("op")
+        if op not in ("add", "remove", "replace"):
+            raise ValueError(f"Unsupported patch operation: {op!r}")
+        if op != "remove" and "value" not in operation:
+            raise ValueError(f"{op} needs a value")
+        tokens = _tokens(operation.get("path", ""))
+        if not tokens:
+            if op == "remove":
+                raise ValueError("Cannot remove the whole document")
+            doc = operation["value"]
+            continue
+        parent = doc
+        for token in tokens[:-1]:
+            if isinstance(parent, dict) and token in parent:
+                parent = parent[token]
+            elif isinstance(parent, list):
+                parent = parent[_index(parent, token, False)]
+            else:
+                raise ValueError(f"Path not found: {operation['path']}")
+        last = tokens[-1]
+        if isinstance(parent, dict):
+            if op != "add" and last not in parent:
+                raise ValueError(f"Path not found: {operation['path']}")
+            if op == "remove":
+                del parent[last]
+            else:
+                parent[last] = operation["value"]
+        elif isinstance(parent, list):
+            index = _index(parent, last, op == "add")
+            if op == "add":
+                parent.insert(index, operation["value"])
+            elif op == "remove":
+                del parent[index]
+            else:
+                parent[index] = operation["value"]
+        else:
+            raise ValueError(f"Path not found: {operation['path']}")
+    return doc
+
+
+# ---- storage -------------------------------------------------------------
+
+
+class SaveStore:
+    """Game saves stored as a snapshot plus a chain of JSON-patch deltas.
+
+    A save's state is ``{"game_state": ..., "player_stats": ...}``. Each
+    autosave that changes it appends the patch from the previous version to
+    ``game_save_deltas`` and bumps ``game_saves.version``; the snapshot
+    columns are only rewritten by the ON CONFLICT upsert on the first save
+    of a slot and on compaction, once the chain reaches ``compact_every``
+    deltas or its patches outweigh ``compact_ratio`` of the snapshot.
+    Reconstructed states are cached by save id and checked against the
+    row's version, so loading the slot just saved reads no patches at all.
+
+    Snapshots are JSON text (dictionary-compressed once trained) or, for
+    slots saved by binary clients, MessagePack with ``encoding`` set to
+    ``compression.MSGPACK``. A slot turns binary on its first MessagePack
+    save or through :meth:`convert`, and stays binary; patches are JSON
+    either way.
+
+    Writes must run on the single writer (:func:`main._write`), which keeps
+    the version read and the version written in one transaction.
+    """
+
+    def __init__(
+        self,
+        compact_every: int = DEFAULT_COMPACT_EVERY,
+        compact_ratio: float = DEFAULT_COMPACT_RATIO,
+        max_cached: int = DEFAULT_MAX_CACHED,
+    ) -> None:
+        self.compact_every = compact_every
+        self.compact_ratio = compact_ratio
+        self.max_cached = max_cached
+        self._states: "OrderedDict[str, _State]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._snapshots = 0
+        self._deltas = 0
+        self._unchanged = 0
+        self._bytes_written = 0
+        # What rewriting the snapshot on every save would have cost.
+        self._full_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._deltas_replayed = 0
+        self._conversions = 0
+
+    def save(
+        self,
+        conn: sqlite3.Connection,
+        user_id: str,
+        world_id: str,
+        slot_number: int,
+        slot_name: str,
+        game_state: Dict[str, Any],
+        player_stats: Dict[str, Any],
+        progress_percentage: float,
+        play_time: int,
+        new_id: str,
+        binary: bool = False,
+    ) -> Saved:
+        """Store a full state for a slot, as a delta on the slot's current version when there is one.
+
+        ``binary`` marks a MessagePack upload: the slot's snapshot is stored as
+        MessagePack from now on, rewritten right away if it is still JSON.
+        """
+        head = conn.execute(
+            f"SELECT {HEAD_COLUMNS} FROM game_saves WHERE user_id = ? AND world_id = ? AND slot_number = ?",
+            (user_id, world_id, slot_number),
+        ).fetchone()
+        doc = {"game_state": game_state, "player_stats": player_stats}
+        meta = (slot_name, progress_percentage, play_time)
+        if head is None:
+            return self._snapshot(conn, (new_id, user_id, world_id, slot_number), doc, meta, binary)
+        if binary and head["encoding"] != compression.MSGPACK:
+            return self._snapshot(conn, (head["id"], user_id, world_id, slot_number), doc, meta, True)
+        return self._advance(conn, head, self._load(conn, head), doc, meta)
+
+    def patch(
+        self,
+        conn: sqlite3.Connection,
+        save_id: str,
+        user_id: str,
+        base_version: int,
+        patch: Patch,
+        slot_name: Optional[str] = None,
+        progress_percentage: Optional[float] = None,
+        play_time: Optional[int] = None,
+    ) -> Optional[Saved]:
+        """Apply a client patch made against ``base_version``; None when the save does not exist.
+
+        Raises VersionConflict when the save has moved past ``base_version``
+        and ValueError when the patch does not apply.
+        """
+        head = conn.execute(
+            f"SELECT {HEAD_COLUMNS} FROM game_saves WHERE id = ? AND user_id = ?", (save_id, user_id)
+        ).fetchone()
+        if head is None:
+            return None
+        if head["version"] != base_version:
+            raise VersionConflict(head["version"])
+        state = self._load(conn, head)
+        doc = apply_patch(copy.deepcopy(state.doc), patch)
+        if not isinstance(doc, dict) or set(doc) != {"game_state", "player_stats"}:
+            raise ValueError("A save holds exactly game_state and player_stats")
+        meta = (
+            head["slot_name"] if slot_name is None else slot_name,
+            head["progress_percentage"] if progress_percentage is None else progress_percentage,
+            head["play_time"] if play_time is None else play_time,
+        )
+        return self._advance(conn, head, state, doc, meta)
+
+    def state(self, conn: sqlite3.Connection, head: sqlite3.Row) -> Dict[str, Any]:
+        """Current ``{"game_state", "player_stats"}`` of a save row; the result must not be mutated.
+
+        ``head`` must come from the same read transaction as this call.
+        """
+        return self._load(conn, head).doc
+
+    def stored_msgpack(self, conn: sqlite3.Connection, head: sqlite3.Row) -> Optional[Tuple[bytes, bytes]]:
+        """The stored (game_state, player_stats) MessagePack values when they are the current state as is.
+
+        None unless the snapshot is MessagePack and no patches sit on top of it.
+        """
+        if head["encoding"] != compression.MSGPACK or head["version"] != head["snapshot_version"]:
+            return None
+        row = conn.execute(
+            "SELECT game_state, player_stats FROM game_saves WHERE id = ? AND version = ? AND encoding = ?",
+            (head["id"], head["version"], compression.MSGPACK),
+        ).fetchone()
+        if row is None:
+            return None
+        return bytes(row["game_state"]), bytes(row["player_stats"])
+
+    def convert(self, conn: sqlite3.Connection, save_id: str) -> bool:
+        """Re-encode a JSON snapshot as MessagePack in place (same version, chain untouched); False if already binary."""
+        row = conn.execute(
+            "SELECT game_state, player_stats, encoding FROM game_saves WHERE id = ?", (save_id,)
+        ).fetchone()
+        if row is None or row["encoding"] == compression.MSGPACK:
+            return False
+        game_state, player_stats = self._decode_snapshot(conn, row)
+        conn.execute(
+            "UPDATE game_saves SET game_state = ?, player_stats = ?, encoding = ? WHERE id = ?",
+            (msgpack_codec.packb(game_state), msgpack_codec.packb(player_stats), compression.MSGPACK, save_id),
+        )
+        with self._lock:
+            self._conversions += 1
+        return True
+
+    def forget(self, save_id: str) -> None:
+        with self._lock:
+            self._states.pop(save_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            saves = self._snapshots + self._deltas + self._unchanged
+            return {
+                "saves": saves,
+                "snapshots": self._snapshots,
+                "deltas": self._deltas,
+                "unchanged": self._unchanged,
+                "bytes_written": self._bytes_written,
+                "full_save_bytes": self._full_bytes,
+                # Share of full-rewrite bytes that deltas avoided.
+                "bytes_saved_ratio": (1 - self._bytes_written / self._full_bytes) if self._full_bytes else 0.0,
+                "compact_every": self.compact_every,
+                "cached_states": len(self._states),
+                "cache_hit_ratio": (self._hits / (self._hits + self._misses)) if self._misses else 1.0,
+                "deltas_replayed": self._deltas_replayed,
+                "msgpack_conversions": self._conversions,
+            }
+
+    def _load(self, conn: sqlite3.Connection, head: sqlite3.Row) -> _State:
+        # ``head`` must have been read in the same transaction as the reads
+        # below (the writer's, or db_pool.read_transaction): a compaction
+        # committed in between would leave a snapshot newer than ``head`` and
+        # its patches deleted, and the wrong state would be cached.
+        save_id = head["id"]
+        with self._lock:
+            cached = self._states.get(save_id)
+            if cached is not None and cached.version == head["version"]:
+                self._states.move_to_end(save_id)
+                self._hits += 1
+                return cached
+            self._misses += 1
+        row = conn.execute(
+            "SELECT game_state, player_stats, encoding FROM game_saves WHERE id = ?", (save_id,)
+        ).fetchone()
+        game_state, player_stats = self._decode_snapshot(conn, row)
+        doc = {"game_state": game_state, "player_stats": player_stats}
+        patches = conn.execute(
+            REPLAY_SQL,
+            (save_id, head["snapshot_version"], head["version"]),
+        ).fetchall()
+        for (patch,) in patches:
+            doc = apply_patch(doc, json.loads(patch))
+        state = _State(head["version"], len(patches), head["delta_bytes"], head["snapshot_bytes"], doc)
+        with self._lock:
+            self._deltas_replayed += len(patches)
+        self._remember(save_id, state)
+        return state
+
+    def _decode_snapshot(self, conn: sqlite3.Connection, row: sqlite3.Row) -> Tuple[Any, Any]:
+        if row["encoding"] == compression.MSGPACK:
+            return (
+                msgpack_codec.unpackb(bytes(row["game_state"])),
+                msgpack_codec.unpackb(bytes(row["player_stats"])),
+            )
+        return (
+            json.loads(compression.decode(conn, row["game_state"], row["encoding"])),
+            json.loads(compression.decode(conn, row["player_stats"], row["encoding"])),
+        )
+
+    def _advance(
+        self,
+        conn: sqlite3.Connection,
+        head: sqlite3.Row,
+        state: _State,
+        doc: Dict[str, Any],
+        meta: Tuple[str, float, int],
+    ) -> Saved:
+        """Write ``doc`` as the version after ``head``: nothing, one patch, or a compacted snapshot."""
+        save_id = head["id"]
+        ops = diff(state.doc, doc)
+        # A full rewrite would have cost about one more snapshot.
+        full_bytes = state.snapshot_bytes
+        if not ops:
+            conn.execute(
+                "UPDATE game_saves SET slot_name = ?, progress_percentage = ?, play_time = ?, updated_at = ? WHERE id = ?",
+                (*meta, now_iso(), save_id),
+            )
+            self._count("unchanged", 0, full_bytes)
+            return Saved(save_id, state.version, "unchanged", 0)
+
+        patch = json.dumps(ops, separators=(",", ":"))
+        if (
+            state.chain + 1 >= self.compact_every
+            or state.delta_bytes + len(patch) > self.compact_ratio * state.snapshot_bytes
+        ):
+            slot = (save_id, head["user_id"], head["world_id"], head["slot_number"])
+            return self._snapshot(conn, slot, doc, meta, head["encoding"] == compression.MSGPACK)
+
+        version = state.version + 1
+        conn.execute(
+            """UPDATE game_saves SET slot_name = ?, progress_percentage = ?, play_time = ?, updated_at = ?,
+               version = ?, delta_bytes = delta_bytes + ? WHERE id = ?""",
+            (*meta, now_iso(), version, len(patch), save_id),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO game_save_deltas (save_id, version, patch, created_at) VALUES (?, ?, ?, ?)",
+            (save_id, version, patch, now_iso()),
+        )
+        self._remember(
+            save_id, _State(version, state.chain + 1, state.delta_bytes + len(patch), state.snapshot_bytes, doc)
+        )
+        self._count("delta", len(patch), full_bytes)
+        return Saved(save_id, version, "delta", len(patch))
+
+    def _snapshot(
+        self,
+        conn: sqlite3.Connection,
+        slot: Tuple[str, str, str, int],
+        doc: Dict[str, Any],
+        meta: Tuple[str, float, int],
+        binary: bool = False,
+    ) -> Saved:
+        """Upsert ``doc`` as the slot's snapshot and drop the chain it replaces."""
+        save_id, user_id, world_id, slot_number = slot
+        game_state: Any
+        player_stats: Any
+        if binary:
+            game_state = msgpack_codec.packb(doc["game_state"])
+            player_stats = msgpack_codec.packb(doc["player_stats"])
+            encoding: Optional[str] = compression.MSGPACK
+        else:
+            game_state, encoding = compression.encode(conn, compression.SAVES, json.dumps(doc["game_state"]))
+            player_stats, _ = compression.encode(conn, compression.SAVES, json.dumps(doc["player_stats"]))
+        slot_name, progress_percentage, play_time = meta
+        now = now_iso()
+        save_id, version = conn.execute(
+            UPSERT_SNAPSHOT_SQL,
+            (save_id, user_id, world_id, slot_name, slot_number, game_state, player_stats, encoding,
+             progress_percentage, play_time, now, now),
+        ).fetchone()
+        conn.execute("DELETE FROM game_save_deltas WHERE save_id = ?", (save_id,))
+        written = len(game_state) + len(player_stats)
+        self._remember(save_id, _State(version, 0, 0, written, doc))
+        self._count("snapshot", written, written)
+        return Saved(save_id, version, "snapshot", written)
+
+    def _remember(self, save_id: str, state: _State) -> None:
+        with self._lock:
+            cached = self._states.get(save_id)
+            # A concurrent reader may bring back an older version; keep the newest.
+            if cached is None or cached.version <= state.version:
+                self._states[save_id] = state
+                self._states.move_to_end(save_id)
+            while len(self._states) > self.max_cached:
+                self._states.popitem(last=False)
+
+    def _count(self, kind: str, written: int, full_bytes: int) -> None:
+        with self._lock:
+            if kind == "snapshot":
+                self._snapshots += 1
+            elif kind == "delta":
+                self._deltas += 1
+            else:
+                self._unchanged += 1
+            self._bytes_written += written
+            self._full_bytes += full_bytes
+
+
+def list_slots(conn: sqlite3.Connection, user_id: str) -> List[Dict[str, Any]]:
+    """A user's save slots, most recently saved first; reads idx_game_saves_slots, never the snapshots."""
+    return [
+        {
+            "save_id": row[0],
+            "world_id": row[1],
+            "world_name": row[2],
+            "slot_name": row[3],
+            "slot_number": row[4],
+            "progress_percentage": row[5],
+            "play_time": row[6],
+            "created_at": row[7],
+            "updated_at": row[8],
+        }
+        for row in conn.execute(SLOT_LIST_SQL, (user_id,))
+    ]
+
+
+if __name__ == "__main__":
+    # N autosaves of one slot whose state changes a little each time: bytes
+    # written and time per save for full rewrites versus deltas, then the
+    # cost of rebuilding the state from snapshot + chain on a cold load.
+    import os
+    import random
+    import sys
+    import tempfile
+    import time
+
+    saves = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    random.seed(5)
+
+    def _state() -> Dict[str, Any]:
+        return {
+            "position": [0.0, 0.0, 0.0],
+            "inventory": [{"id": f"item-{i}", "name": f"Objeto {i}", "qty": 1, "durability": 100} for i in range(400)],
+            "explored": {f"tile-{x}-{y}": False for x in range(40) for y in range(40)},
+            "quests": {f"quest-{i}": {"status": "active", "progress": 0} for i in range(50)},
+        }
+
+    def _autosave_step(doc: Dict[str, Any], step: int) -> None:
+        game_state = doc["game_state"]
+        game_state["position"] = [step * 0.5, 0.0, step * 0.25]
+        for _ in range(3):
+            game_state["inventory"][random.randrange(400)]["durability"] -= 1
+        game_state["explored"][f"tile-{random.randrange(40)}-{random.randrange(40)}"] = True
+        doc["player_stats"]["xp"] += 10
+        if step % 25 == 0:
+            game_state["inventory"].append({"id": f"loot-{step}", "name": "Botín", "qty": 1, "durability": 100})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "saves.db"), isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(
+            "CREATE TABLE compression_dictionaries (id INTEGER PRIMARY KEY, kind TEXT, data BLOB, created_at TEXT)"
+        )
+        conn.execute(
+            """CREATE TABLE game_saves (id TEXT PRIMARY KEY, user_id TEXT, world_id TEXT, slot_name TEXT,
+               slot_number INTEGER, game_state TEXT, player_stats TEXT, encoding TEXT, progress_percentage REAL,
+               play_time INTEGER, created_at TEXT, updated_at TEXT, version INTEGER NOT NULL DEFAULT 1,
+               snapshot_version INTEGER NOT NULL DEFAULT 1, delta_bytes INTEGER NOT NULL DEFAULT 0,
+               UNIQUE (user_id, world_id, slot_number))"""
+        )
+        conn.execute(
+            """CREATE TABLE game_save_deltas (save_id TEXT, version INTEGER, patch TEXT, created_at TEXT,
+               PRIMARY KEY (save_id, version)) WITHOUT ROWID"""
+        )
+
+        def _run(store: SaveStore) -> Tuple[float, int]:
+            doc = {"game_state": _state(), "player_stats": {"xp": 0, "level": 1}}
+            written = 0
+            elapsed = 0.0
+            for step in range(saves):
+                _autosave_step(doc, step)
+                started = time.perf_counter()
+                conn.execute("BEGIN")
+                saved = store.save(
+                    conn, "user", "world", 1, "Auto", doc["game_state"], doc["player_stats"], 0.0, step, "save"
+                )
+                conn.execute("COMMIT")
+                elapsed += time.perf_counter() - started
+                written += saved.bytes_written
+                # The request body is a fresh object on every real save.
+                doc = copy.deepcopy(doc)
+            return elapsed, written
+
+        full_time, full_bytes = _run(SaveStore(compact_every=1))
+        conn.execute("DELETE FROM game_saves")
+        delta_store = SaveStore()
+        delta_time, delta_bytes = _run(delta_store)
+        head = conn.execute(f"SELECT {HEAD_COLUMNS} FROM game_saves").fetchone()
+        print(f"{saves} autosaves of a {head['snapshot_bytes']} byte state")
+        print(f"  full rewrite : {full_bytes / saves:10.0f} bytes/save {full_time / saves * 1000:8.2f} ms/save")
+        print(f"  deltas       : {delta_bytes / saves:10.0f} bytes/save {delta_time / saves * 1000:8.2f} ms/save")
+        print(f"  snapshots    : {delta_store.stats()['snapshots']} (chain now {head['version'] - head['snapshot_version']})")
+
+        for label, store in (("cached load", delta_store), ("cold load", None)):
+            started = time.perf_counter()
+            for _ in range(50):
+                (store or SaveStore()).state(conn, head)
+            print(f"  {label:13s}: {(time.perf_counter() - started) / 50 * 1000:10.2f} ms")
+
+        # Listing 10 slots of one user out of 200, as saves grow: every
+        # column off the table rows versus the covering slot index.
+        conn.execute("CREATE TABLE worlds (id TEXT PRIMARY KEY, summary TEXT)")
+        conn.execute("INSERT INTO worlds VALUES ('world', 'Mundo')")
+        conn.execute(f"CREATE INDEX idx_game_saves_slots ON game_saves ({SLOT_INDEX_COLUMNS})")
+        old_sql = """SELECT gs.*, w.summary AS world_name FROM game_saves gs LEFT JOIN worlds w ON gs.world_id = w.id
+            WHERE gs.user_id = ? ORDER BY gs.updated_at DESC"""
+        print("slot listing (10 slots)")
+        for size in (1_000, 100_000, 1_000_000):
+            conn.execute("DELETE FROM game_saves")
+            blob = "x" * size
+            conn.execute("BEGIN")
+            conn.executemany(
+                """INSERT INTO game_saves (id, user_id, world_id, slot_name, slot_number, game_state, player_stats,
+                   progress_percentage, play_time, created_at, updated_at)
+                   VALUES (?, ?, 'world', 'Slot', ?, ?, '{}', 0, 0, ?, ?)""",
+                (
+                    (f"save-{user}-{slot}", f"user-{user}", slot, blob, now_iso(), now_iso())
+                    for user in range(200)
+                    for slot in range(10)
+                ),
+            )
+            conn.execute("COMMIT")
+            timings = []
+            for sql in (old_sql, SLOT_LIST_SQL):
+                started = time.perf_counter()
+                for user in range(200):
+                    conn.execute(sql, (f"user-{user}",)).fetchall()
+                timings.append((time.perf_counter() - started) / 200 * 1000)
+            print(f"  {size:>9d} byte saves: SELECT gs.* {timings[0]:8.3f} ms   slot index {timings[1]:8.3f} ms")
+        conn.close()
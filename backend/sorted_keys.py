@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+# Keys per bucket; a bucket is split in two when it grows past twice this.
+DEFAULT_LOAD = 1000
+
+Key = Tuple[Any, ...]
+
+
+class SortedKeys:
+    """Sorted list of unique keys, stored as a list of bounded buckets.
+
+    Adding or removing a key costs a bisect over the bucket maxima plus a
+    shift inside one bucket, instead of shifting a list of every key.
+    Positional queries (:meth:`rank`, :meth:`at`, :meth:`ascending` from a
+    position) go through a Fenwick tree of bucket sizes, so they are
+    O(log n) as well; the tree is rebuilt only when buckets split or vanish.
+    """
+
+    def __init__(self, keys: Iterable[Key] = (), load: int = DEFAULT_LOAD) -> None:
+        self.load = load
+        ordered = sorted(keys)
+        self._buckets: List[List[Key]] = [ordered[i : i + load] for i in range(0, len(ordered), load)]
+        self._maxes: List[Key] = [bucket[-1] for bucket in self._buckets]
+        self._len = len(ordered)
+        # 1-based Fenwick tree over len(bucket); None until a positional query needs it.
+        self._tree: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __contains__(self, key: Key) -> bool:
+        index = bisect_left(self._maxes, key)
+        if index == len(self._buckets):
+            return False
+        bucket = self._buckets[index]
+        position = bisect_left(bucket, key)
+        return position < len(bucket) and bucket[position] == key
+
+    def add(self, key: Key) -> None:
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            self._tree = None
+            return
+        index = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[index]
+        insort(bucket, key)
+        self._maxes[index] = bucket[-1]
+        self._len += 1
+        if len(bucket) > 2 * self.load:
+            upper = bucket[self.load :]
+            del bucket[self.load :]
+            self._buckets.insert(index + 1, upper)
+            self._maxes[index] = bucket[-1]
+            self._maxes.insert(index + 1, upper[-1])
+            self._tree = None
+        elif self._tree is not None:
+            self._tree_add(index, 1)
+
+    def remove(self, key: Key) -> None:
+        index = bisect_left(self._maxes, key)
+        if index == len(self._buckets):
+            raise KeyError(key)
+        bucket = self._buckets[index]
+        position = bisect_left(bucket, key)
+        if position == len(bucket) or bucket[position] != key:
+            raise KeyError(key)
+        del bucket[position]
+        self._len -= 1
+        if bucket:
+            self._maxes[index] = bucket[-1]
+            if self._tree is not None:
+                self._tree_add(index, -1)
+        else:
+            del self._buckets[index]
+            del self._maxes[index]
+            self._tree = None
+
+    def rank(self, key: Key) -> int:
+        """Number of keys smaller than ``key``."""
+        index = bisect_left(self._maxes, key)
+        if index == len(self._buckets):
+            return self._len
+        return self._prefix(index) + bisect_left(self._buckets[index], key)
+
+    def count_below_or_equal(self, key: Key) -> int:
+        """Number of keys smaller than or equal to ``key``."""
+        index = bisect_right(self._maxes, key)
+        if index == len(self._buckets):
+            return self._len
+        return self._prefix(index) + bisect_right(self._buckets[index], key)
+
+    def at(self, position: int) -> Key:
+        """Key at ``position`` in ascending order (0-based)."""
+        if not 0 <= position < self._len:
+            raise IndexError(position)
+        index, offset = self._locate(position)
+        return self._buckets[index][offset]
+
+    def ascending(self, start: int = 0) -> Iterator[Key]:
+        """Keys from position ``start`` upwards."""
+        if start >= self._len:
+            return
+        index, offset = self._locate(max(0, start))
+        while index < len(self._buckets):
+            bucket = self._buckets[index]
+            for position in range(offset, len(bucket)):
+                yield bucket[position]
+            index += 1
+            offset = 0
+
+    def descending(self, before: Optional[Key] = None) -> Iterator[Key]:
+        """Keys from the largest down, starting below ``before`` when given."""
+        if not self._buckets:
+            return
+        index = len(self._buckets) if before is None else bisect_left(self._maxes, before)
+        if index == len(self._buckets):
+            # Everything is below ``before``: start from the very end.
+            index -= 1
+            position = len(self._buckets[index])
+        else:
+            position = bisect_left(self._buckets[index], before)
+        while index >= 0:
+            bucket = self._buckets[index]
+            for offset in range(position - 1, -1, -1):
+                yield bucket[offset]
+            index -= 1
+            position = len(self._buckets[index]) if index >= 0 else 0
+
+    def _build_tree(self) -> List[int]:
+        tree = [0] * (len(self._buckets) + 1)
+        for index, bucket in enumerate(self._buckets, 1):
+            tree[index] += len(bucket)
+            parent = index + (index & -index)
+            if parent < len(tree):
+                tree[parent] += tree[index]
+        self._tree = tree
+        return tree
+
+    def _tree_add(self, index: int, delta: int) -> None:
+        tree = self._tree
+        assert tree is not None
+        index += 1
+        while index < len(tree):
+            tree[index] += delta
+            index += index & -index
+
+    def _prefix(self, index: int) -> int:
+        """Number of keys in the buckets before ``index``."""
+        tree = self._tree if self._tree is not None else self._build_tree()
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """(bucket index, offset) of the key at ``position``."""
+        tree = self._tree if self._tree is not None else self._build_tree()
+        index = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            candidate = index + step
+            if candidate < len(tree) and tree[candidate] <= position:
+                index = candidate
+                position -= tree[candidate]
+            step >>= 1
+        return index, position
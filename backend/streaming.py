@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Optional
+
+NDJSON = "application/x-ndjson"
+SSE = "text/event-stream"
+
+# Keep proxies (nginx) from buffering the stream.
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def wants_sse(accept: Optional[str]) -> bool:
+    """True when the client asked for Server-Sent Events rather than NDJSON."""
+    return SSE in (accept or "")
+
+
+def encode_event(event: str, data: Dict[str, Any], sse: bool) -> str:
+    """Frame one event as an SSE message or an NDJSON line ({"event": ..., **data})."""
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": event, **data}, ensure_ascii=False) + "\n"
@@ -0,0 +1,22 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# Tests import the backend modules the same way main.py does: as top-level modules.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="module")
+def main_module(tmp_path_factory):
+    """``main`` imported fresh on a scratch database (it opens its pool at import time)."""
+    mp = pytest.MonkeyPatch()
+    mp.setenv("DATASHARK_DB_PATH", str(tmp_path_factory.mktemp("main") / "datashark.db"))
+    sys.modules.pop("main", None)
+    main = importlib.import_module("main")
+    main.init_db()
+    yield main
+    main.db_pool.close_all()
+    sys.modules.pop("main", None)
+    mp.undo()
@@ -0,0 +1,204 @@
+import asyncio
+
+import pytest
+
+import ai_gateway
+from ai_gateway import Provider, ProviderGateway, ProviderUnavailable, StubProvider, build_provider
+
+
+class FlakyProvider(Provider):
+    """Fails the first ``failures`` calls, then echoes."""
+
+    name = "flaky"
+
+    def __init__(self, failures=1):
+        super().__init__("flaky")
+        self.failures = failures
+        self.calls = 0
+
+    async def complete(self, prompt, system, max_tokens):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.calls <= self.failures:
+            raise RuntimeError("upstream 500")
+        return f"ok {prompt}"
+
+
+class CountingProvider(Provider):
+    """Records the most calls running at once."""
+
+    name = "counting"
+
+    def __init__(self, max_concurrency):
+        super().__init__("counting", max_concurrency)
+        self.running = 0
+        self.peak = 0
+
+    async def complete(self, prompt, system, max_tokens):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.02)
+        self.running -= 1
+        return prompt
+
+
+def test_provider_is_abstract():
+    with pytest.raises(TypeError):
+        Provider()
+
+
+def test_exact_and_normalized_cache_hits():
+    async def run():
+        stub = StubProvider()
+        gateway = ProviderGateway({"stub": stub})
+        first = await gateway.generate("stub", "¿Qué es un bioma?")
+        exact = await gateway.generate("stub", "¿Qué es un bioma?")
+        normalized = await gateway.generate("stub", "  que ES un   bioma ")
+        other = await gateway.generate("stub", "que es un desierto")
+        return stub, gateway, first, exact, normalized, other
+
+    stub, gateway, first, exact, normalized, other = asyncio.run(run())
+    assert (first.cache, exact.cache, normalized.cache, other.cache) == ("miss", "exact", "normalized", "miss")
+    assert exact.text == normalized.text == first.text == "[stub] ¿Qué es un bioma?"
+    assert stub.calls == 2
+    stats = gateway.stats()
+    assert (stats["exact_hits"], stats["normalized_hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_cache_key_includes_system_prompt_and_max_tokens():
+    async def run():
+        stub = StubProvider()
+        gateway = ProviderGateway({"stub": stub})
+        await gateway.generate("stub", "hola", system="a")
+        await gateway.generate("stub", "hola", system="b")
+        await gateway.generate("stub", "hola", system="a", max_tokens=10)
+        return stub
+
+    assert asyncio.run(run()).calls == 3
+
+
+def test_in_flight_calls_are_coalesced():
+    async def run():
+        stub = StubProvider(latency=0.05)
+        gateway = ProviderGateway({"stub": stub})
+        prompts = ["Qué es un bioma", "que es un bioma", "QUE ES UN BIOMA?"] * 4
+        results = await asyncio.gather(*(gateway.generate("stub", prompt) for prompt in prompts))
+        return stub, gateway, results
+
+    stub, gateway, results = asyncio.run(run())
+    assert stub.calls == 1
+    assert sorted(result.cache for result in results) == ["coalesced"] * 11 + ["miss"]
+    assert len({result.text for result in results}) == 1
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    async def run():
+        stub = StubProvider(latency=0.05)
+        gateway = ProviderGateway({"stub": stub})
+        leaving = asyncio.ensure_future(gateway.generate("stub", "hola"))
+        staying = asyncio.ensure_future(gateway.generate("stub", "hola"))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        return stub, await staying
+
+    stub, result = asyncio.run(run())
+    assert result.text == "[stub] hola"
+    assert stub.calls == 1
+
+
+def test_failures_are_not_cached():
+    async def run():
+        flaky = FlakyProvider(failures=1)
+        gateway = ProviderGateway({"flaky": flaky})
+        waiting = [gateway.generate("flaky", "hola") for _ in range(3)]
+        failed = await asyncio.gather(*waiting, return_exceptions=True)
+        retried = await gateway.generate("flaky", "hola")
+        cached = await gateway.generate("flaky", "hola")
+        return flaky, gateway, failed, retried, cached
+
+    flaky, gateway, failed, retried, cached = asyncio.run(run())
+    # Coalesced callers share the failure, then the next call goes to the provider again.
+    assert all(isinstance(result, RuntimeError) for result in failed)
+    assert (retried.cache, retried.text) == ("miss", "ok hola")
+    assert cached.cache == "exact"
+    assert flaky.calls == 2
+    assert gateway.stats()["errors"] == 1
+
+
+def test_timeout_is_not_cached():
+    async def run():
+        stub = StubProvider(latency=0.2)
+        gateway = ProviderGateway({"stub": stub}, timeout=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await gateway.generate("stub", "hola")
+        stub.latency = 0
+        return await gateway.generate("stub", "hola")
+
+    assert asyncio.run(run()).cache == "miss"
+
+
+def test_semaphore_bounds_concurrent_calls_per_provider():
+    async def run():
+        limited = CountingProvider(max_concurrency=2)
+        other = CountingProvider(max_concurrency=5)
+        other.name = "other"
+        gateway = ProviderGateway({"counting": limited, "other": other})
+        await asyncio.gather(
+            *(gateway.generate("counting", f"prompt {i}") for i in range(8)),
+            *(gateway.generate("other", f"prompt {i}") for i in range(8)),
+        )
+        return limited, other
+
+    limited, other = asyncio.run(run())
+    assert limited.peak == 2
+    assert other.peak == 5
+
+
+def test_cache_ttl_and_size():
+    async def run():
+        stub = StubProvider()
+        gateway = ProviderGateway({"stub": stub}, cache_size=2, cache_ttl=60)
+        for prompt in ("one", "two", "three"):
+            await gateway.generate("stub", prompt)
+        # Two keys per answer (exact and normalized) but only two entries fit.
+        assert gateway.stats()["cache_entries"] == 2
+        assert (await gateway.generate("stub", "three")).cache == "exact"
+        assert (await gateway.generate("stub", "one")).cache == "miss"
+
+        gateway.cache_ttl = 0
+        await gateway.generate("stub", "four")
+        assert (await gateway.generate("stub", "four")).cache == "miss"
+        return stub
+
+    assert asyncio.run(run()).calls == 6
+
+
+def test_unavailable_provider_is_not_an_error():
+    async def run():
+        gateway = ProviderGateway({"claude": build_provider("claude", {})})
+        with pytest.raises(ProviderUnavailable) as raised:
+            await gateway.generate("claude", "hola")
+        return gateway, raised.value
+
+    gateway, exc = asyncio.run(run())
+    assert (exc.provider, exc.missing_package, str(exc)) == ("claude", False, "Claude not configured")
+    assert gateway.stats()["errors"] == 0
+    assert not gateway.stats()["providers"]["claude"]["available"]
+
+
+@pytest.mark.parametrize(
+    "prompt, expected",
+    [
+        ("¿Qué es un BIOMA?", "que es un bioma"),
+        ("  hola\t mundo!! ", "hola mundo"),
+        ("Привет, мир", "привет, мир"),
+    ],
+)
+def test_normalize_prompt(prompt, expected):
+    assert ai_gateway.normalize_prompt(prompt) == expected
+
+
+def test_split_tokens_join_back():
+    for text in ("", "one", " two  words ", "a\nb\tc"):
+        assert "".join(ai_gateway.split_tokens(text)) == text
@@ -0,0 +1,159 @@
+import asyncio
+import json
+
+import pytest
+
+from ai_gateway import ProviderGateway, ProviderUnavailable, StubProvider, build_provider
+
+
+class BrokenStreamProvider(StubProvider):
+    """Streams one word, then fails."""
+
+    name = "broken"
+
+    async def stream(self, prompt, system, max_tokens):
+        yield "first "
+        raise RuntimeError("connection reset")
+
+
+async def _collect(stream):
+    return [piece async for piece in stream]
+
+
+def test_stream_yields_tokens_and_caches_the_answer():
+    async def run():
+        stub = StubProvider()
+        gateway = ProviderGateway({"stub": stub})
+        stream = gateway.stream("stub", "hola mundo feliz")
+        pieces = await _collect(stream)
+        again = gateway.stream("stub", "Hola mundo feliz!")
+        cached = await _collect(again)
+        return stub, gateway, stream, pieces, again, cached
+
+    stub, gateway, stream, pieces, again, cached = asyncio.run(run())
+    assert pieces == ["[stub] ", "hola ", "mundo ", "feliz"]
+    assert (stream.cache, stream.tokens) == ("miss", 4)
+    assert stream.ttft_ms is not None and stream.total_ms >= stream.ttft_ms
+    # A finished stream is cached, and a cached answer arrives in one piece.
+    assert (again.cache, cached) == ("normalized", ["[stub] hola mundo feliz"])
+    assert stub.calls == 1
+    stats = gateway.stats()
+    assert (stats["streams"], stats["errors"]) == (1, 0)
+
+
+def test_consumer_closing_the_stream_is_not_a_provider_error():
+    async def run():
+        stub = StubProvider(token_latency=0.01)
+        gateway = ProviderGateway({"stub": stub})
+        pieces = gateway.stream("stub", "one two three four").__aiter__()
+        first = await pieces.__anext__()
+        await pieces.aclose()
+        return gateway, first
+
+    gateway, first = asyncio.run(run())
+    assert first == "[stub] "
+    stats = gateway.stats()
+    assert (stats["streams"], stats["errors"], stats["cache_entries"]) == (1, 0, 0)
+
+
+def test_cancelled_consumer_is_not_a_provider_error():
+    async def run():
+        stub = StubProvider(token_latency=0.5)
+        gateway = ProviderGateway({"stub": stub})
+        reader = asyncio.ensure_future(_collect(gateway.stream("stub", "one two three")))
+        await asyncio.sleep(0.05)
+        reader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await reader
+        return gateway
+
+    stats = asyncio.run(run()).stats()
+    assert (stats["streams"], stats["errors"]) == (1, 0)
+
+
+def test_provider_failure_mid_stream_is_an_error_and_not_cached():
+    async def run():
+        gateway = ProviderGateway({"broken": BrokenStreamProvider()})
+        pieces = []
+        with pytest.raises(RuntimeError):
+            async for piece in gateway.stream("broken", "hola"):
+                pieces.append(piece)
+        return gateway, pieces
+
+    gateway, pieces = asyncio.run(run())
+    assert pieces == ["first "]
+    stats = gateway.stats()
+    assert (stats["errors"], stats["cache_entries"]) == (1, 0)
+
+
+def test_unavailable_provider_raises_before_streaming():
+    gateway = ProviderGateway({"gemini": build_provider("gemini", {})})
+    with pytest.raises(ProviderUnavailable):
+        gateway.stream("gemini", "hola")
+
+
+# ---- routes -------------------------------------------------------------
+
+
+def _sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture(scope="module")
+def client(main_module):
+    from fastapi.testclient import TestClient
+
+    with TestClient(main_module.app) as test_client:
+        yield test_client
+
+
+def test_generate_stream_sse(client):
+    message = "describe un bosque encantado"
+    response = client.post("/ai/generate/stream", json={"provider": "stub", "message": message})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["x-ai-cache"] == "miss"
+    events = _sse_events(response.text)
+    assert events[0] == ("start", {"provider": "stub", "cache": "miss"})
+    assert [name for name, _ in events[1:-1]] == ["token"] * (len(events) - 2)
+    assert "".join(data["text"] for _, data in events[1:-1]) == f"[stub] {message}"
+    name, done = events[-1]
+    assert name == "done" and done["tokens"] == len(events) - 2
+
+    again = client.post("/ai/generate/stream", json={"provider": "stub", "message": message})
+    assert again.headers["x-ai-cache"] == "exact"
+    assert [name for name, _ in _sse_events(again.text)] == ["start", "token", "done"]
+
+
+def test_generate_stream_ndjson(client):
+    response = client.post(
+        "/ai/generate/stream",
+        json={"provider": "stub", "message": "un río de lava"},
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["event"] for event in events][::len(events) - 1] == ["start", "done"]
+    assert "".join(event["text"] for event in events if event["event"] == "token") == "[stub] un río de lava"
+
+
+def test_generate_stream_errors(client):
+    assert client.post("/ai/generate/stream", json={"provider": "nope", "message": "hola"}).status_code == 400
+    response = client.post("/ai/generate/stream", json={"provider": "mistral", "message": "hola"})
+    assert response.status_code == 503
+
+
+def test_npc_chat_stream_with_provider(client):
+    response = client.post(
+        "/npc/chat/stream",
+        json={"user_id": "u1", "message": "¿Dónde está la forja?", "provider": "stub"},
+    )
+    assert response.status_code == 200
+    events = _sse_events(response.text)
+    assert (events[0][0], events[-1][0]) == ("start", "done")
+    assert events[0][1]["provider"] == "stub"
+    assert "¿Dónde está la forja?" in "".join(data["text"] for name, data in events if name == "token")
@@ -0,0 +1,182 @@
+import random
+import sqlite3
+
+import pytest
+
+import browse_rankings
+from browse_rankings import BrowseRankings, fetch_details, load_public_worlds
+from counters import CounterService, apply_deltas
+
+# /browse keyset columns per ordering, as in main.BROWSE_ORDERINGS.
+COLUMNS = {
+    "popular": ["play_count", "likes", "id"],
+    "recent": ["created_at", "id"],
+    "likes": ["likes", "id"],
+}
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE users (id TEXT PRIMARY KEY, username TEXT)")
+    conn.execute(
+        """CREATE TABLE worlds (id TEXT PRIMARY KEY, user_id TEXT, summary TEXT, created_at TEXT,
+           is_public INTEGER, play_count INTEGER DEFAULT 0, likes INTEGER DEFAULT 0)"""
+    )
+    conn.executemany("INSERT INTO users VALUES (?, ?)", [(f"u{i}", f"user{i}") for i in range(5)])
+    rng = random.Random(11)
+    conn.executemany(
+        "INSERT INTO worlds VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                f"w{i:03d}",
+                f"u{i % 6}",  # u5 does not exist: username is NULL
+                f"World {i}",
+                f"2024-01-0{1 + i % 3}T00:00:00",  # ties on created_at
+                int(rng.random() < 0.8),
+                rng.randrange(5),  # ties on the counts
+                rng.randrange(3),
+            )
+            for i in range(120)
+        ],
+    )
+    yield conn
+    conn.close()
+
+
+def _sql_ids(conn, sort):
+    order = ", ".join(f"{column} DESC" for column in COLUMNS[sort])
+    return [row[0] for row in conn.execute(f"SELECT id FROM worlds WHERE is_public = 1 ORDER BY {order}")]
+
+
+def _walk(rankings, conn, sort, limit):
+    """Every /browse page of ``sort``, each continuing after the last row's keyset key."""
+    ids = []
+    after = None
+    while True:
+        rows = rankings.page(sort, after, limit, lambda ids: fetch_details(conn, ids))
+        ids.extend(row["id"] for row in rows)
+        if len(rows) < limit:
+            return ids
+        after = [rows[-1][column] for column in COLUMNS[sort]]
+
+
+def _assert_matches_sql(rankings, conn):
+    for sort in COLUMNS:
+        for limit in (1, 7, 50):
+            assert _walk(rankings, conn, sort, limit) == _sql_ids(conn, sort), (sort, limit)
+
+
+def test_pages_match_sql_keyset_order(conn):
+    rankings = BrowseRankings(load=4)
+    assert rankings.rebuild(load_public_worlds(conn)) == len(_sql_ids(conn, "recent"))
+    _assert_matches_sql(rankings, conn)
+
+
+def test_page_rows_carry_details(conn):
+    rankings = BrowseRankings(load=4)
+    rankings.rebuild(load_public_worlds(conn))
+    rows = rankings.page("recent", None, 200, lambda ids: fetch_details(conn, ids))
+    expected = conn.execute(
+        """SELECT w.id, w.summary, w.created_at, w.play_count, w.likes, u.username
+           FROM worlds w LEFT JOIN users u ON w.user_id = u.id WHERE w.is_public = 1
+           ORDER BY w.created_at DESC, w.id DESC"""
+    ).fetchall()
+    assert [tuple(row.values()) for row in rows] == expected
+
+
+def test_publish_and_unpublish(conn):
+    rankings = BrowseRankings(load=4)
+    rankings.rebuild(load_public_worlds(conn))
+    private = [row[0] for row in conn.execute("SELECT id FROM worlds WHERE is_public = 0")]
+    public = _sql_ids(conn, "popular")
+
+    for world_id in private[:5]:
+        conn.execute("UPDATE worlds SET is_public = 1 WHERE id = ?", (world_id,))
+        created_at, play_count, likes = conn.execute(
+            "SELECT created_at, play_count, likes FROM worlds WHERE id = ?", (world_id,)
+        ).fetchone()
+        rankings.publish(world_id, created_at, play_count, likes)
+    for world_id in public[::4]:
+        conn.execute("UPDATE worlds SET is_public = 0 WHERE id = ?", (world_id,))
+        assert rankings.unpublish(world_id)
+    assert not rankings.unpublish(public[0])
+    assert len(rankings) == len(_sql_ids(conn, "popular"))
+    _assert_matches_sql(rankings, conn)
+
+    # Publishing again replaces the old keys instead of adding a second entry.
+    world_id = private[0]
+    rankings.publish(world_id, "2030-01-01T00:00:00", 99, 0)
+    assert rankings.page("recent", None, 1, lambda ids: fetch_details(conn, ids))[0]["id"] == world_id
+    assert len(rankings) == len(_sql_ids(conn, "popular"))
+
+
+def test_add_counts_moves_worlds(conn):
+    rankings = BrowseRankings(load=4)
+    rankings.rebuild(load_public_worlds(conn))
+    rng = random.Random(5)
+    ids = [row[0] for row in conn.execute("SELECT id FROM worlds")]
+    for _ in range(20):
+        deltas = {}
+        for world_id in rng.sample(ids, 10):
+            deltas[world_id] = (rng.randrange(4), rng.randrange(3))
+        apply_deltas(
+            conn,
+            {
+                **{("worlds", "play_count", world_id): plays for world_id, (plays, _) in deltas.items()},
+                **{("worlds", "likes", world_id): likes for world_id, (_, likes) in deltas.items()},
+            },
+        )
+        public = set(_sql_ids(conn, "likes"))
+        assert rankings.add_counts(deltas) == len(public & set(deltas))
+    _assert_matches_sql(rankings, conn)
+
+
+def test_counter_flush_moves_world_to_the_top(conn):
+    rankings = BrowseRankings(load=4)
+    rankings.rebuild(load_public_worlds(conn))
+    last = _sql_ids(conn, "popular")[-1]
+
+    def flush(deltas):
+        # What main._flush_counters does: commit, then move the worlds.
+        apply_deltas(conn, deltas)
+        rankings.add_counts(
+            {row_id: (delta, 0) for (table, column, row_id), delta in deltas.items() if column == "play_count"}
+        )
+
+    service = CounterService(flush)
+    for _ in range(10):
+        service.increment("worlds", "play_count", last)
+    assert rankings.page("popular", None, 1, lambda ids: fetch_details(conn, ids))[0]["id"] != last
+    service.flush()
+    assert rankings.page("popular", None, 1, lambda ids: fetch_details(conn, ids))[0]["id"] == last
+    _assert_matches_sql(rankings, conn)
+
+
+def test_detail_cache_and_deleted_worlds(conn):
+    rankings = BrowseRankings(load=4, max_details=5)
+    rankings.rebuild(load_public_worlds(conn))
+    fetched = []
+
+    def fetch(ids):
+        fetched.append(list(ids))
+        return fetch_details(conn, ids)
+
+    first = rankings.page("popular", None, 5, fetch)
+    assert rankings.page("popular", None, 5, fetch) == first
+    assert len(fetched) == 1
+    assert rankings.stats()["cached_details"] == 5
+
+    # Deleted after the rankings were built and not cached: skipped rather than served.
+    uncached = BrowseRankings(load=4, max_details=0)
+    uncached.rebuild(load_public_worlds(conn))
+    conn.execute("DELETE FROM worlds WHERE id = ?", (first[0]["id"],))
+    rows = uncached.page("popular", None, 5, fetch)
+    assert [row["id"] for row in rows] == [row["id"] for row in first[1:]]
+    assert uncached.stats()["cached_details"] == 0
+
+
+def test_key_types_match_orderings():
+    for sort, key in browse_rankings.ORDERINGS.items():
+        values = key("w1", "2024-01-01T00:00:00", 3, 4)
+        assert tuple(type(value) for value in values) == browse_rankings.KEY_TYPES[sort]
@@ -0,0 +1,104 @@
+import pytest
+
+import conversation_memory
+from conversation_memory import MAX_STORED_CHARS, ConversationMemory, _turn_size
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(conversation_memory.time, "time", lambda: now[0])
+    return now
+
+
+def _expected_bytes(memory):
+    """The size estimate recomputed from what is actually held."""
+    return sum(
+        conversation_memory._SESSION_OVERHEAD + sum(_turn_size(turn) for turn in turns)
+        for turns in memory._sessions.values()
+    )
+
+
+def test_ring_buffer_keeps_the_last_turns(clock):
+    memory = ConversationMemory(max_turns=3)
+    for index in range(5):
+        memory.record("s", f"message {index}", f"reply {index}", "combate" if index % 2 else None)
+    assert [turn.message for turn in memory.recent("s")] == ["message 2", "message 3", "message 4"]
+    assert memory.last_matched("s").message == "message 3"
+    assert memory.stats()["bytes_estimate"] == _expected_bytes(memory)
+
+
+def test_long_messages_are_truncated(clock):
+    memory = ConversationMemory()
+    memory.record("s", "x" * (MAX_STORED_CHARS * 2), "reply", None)
+    assert len(memory.recent("s")[0].message) == MAX_STORED_CHARS
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    memory = ConversationMemory(max_sessions=2)
+    memory.record("a", "hola", "hola", None)
+    memory.record("b", "hola", "hola", None)
+    assert memory.recent("a")  # a is now more recently used than b
+    memory.record("c", "hola", "hola", None)
+    assert memory.recent("b") == []
+    assert memory.recent("a") and memory.recent("c")
+    stats = memory.stats()
+    assert (stats["sessions"], stats["evictions"]) == (2, 1)
+    assert stats["bytes_estimate"] == _expected_bytes(memory)
+
+
+def test_byte_cap_evicts_oldest_sessions(clock):
+    probe = ConversationMemory()
+    probe.record("p", "m" * 100, "r" * 100, None)
+    one_session = probe.stats()["bytes_estimate"]
+
+    memory = ConversationMemory(max_bytes=one_session * 3)
+    for index in range(10):
+        clock[0] += 1
+        memory.record(f"s{index}", "m" * 100, "r" * 100, None)
+        assert memory.stats()["bytes_estimate"] <= memory.max_bytes
+        assert memory.stats()["bytes_estimate"] == _expected_bytes(memory)
+    assert list(memory._sessions) == ["s7", "s8", "s9"]
+    assert memory.stats()["evictions"] == 7
+
+
+def test_idle_sessions_expire(clock):
+    memory = ConversationMemory(idle_ttl=60)
+    memory.record("old", "hola", "hola", None)
+    clock[0] += 30
+    memory.record("new", "hola", "hola", None)
+    clock[0] += 31
+    # Lookups drop an expired session ...
+    assert memory.recent("old") == []
+    assert memory.stats()["expirations"] == 1
+    # ... and so does recording in any other session.
+    memory.record("other", "hola", "hola", None)
+    clock[0] += 59
+    memory.record("other", "again", "again", None)
+    assert list(memory._sessions) == ["other"]
+    assert memory.stats()["expirations"] == 2
+    assert memory.stats()["bytes_estimate"] == _expected_bytes(memory)
+
+
+def test_forget_and_byte_accounting_return_to_zero(clock):
+    memory = ConversationMemory(max_turns=2)
+    for index in range(6):
+        memory.record(f"s{index % 3}", f"message {index}" * index, "reply", None)
+    assert memory.stats()["bytes_estimate"] == _expected_bytes(memory)
+    for index in range(3):
+        assert memory.forget(f"s{index}")
+    assert not memory.forget("s0")
+    assert memory.stats()["bytes_estimate"] == 0
+    assert memory.stats()["sessions"] == 0
+
+
+def test_stays_bounded_under_many_sessions(clock):
+    memory = ConversationMemory(max_turns=4, max_sessions=500, max_bytes=200 * 1024)
+    for index in range(20000):
+        session = f"user-{index % 2000}"
+        memory.record(session, f"como funciona el combate {index}", "Sistema de combate disponible...", "combate")
+        memory.last_matched(session)
+    stats = memory.stats()
+    assert stats["sessions"] <= 500
+    assert stats["bytes_estimate"] <= 200 * 1024
+    assert stats["bytes_estimate"] == _expected_bytes(memory)
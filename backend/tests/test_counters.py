@@ -0,0 +1,171 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from counters import CounterService, apply_deltas
+
+
+class Store:
+    """Stored counts behind a CounterService; ``fail`` makes the next flushes raise."""
+
+    def __init__(self):
+        self.counts = {}
+        self.fail = False
+        self.flushed = []
+
+    def flush(self, deltas):
+        if self.fail:
+            raise RuntimeError("disk full")
+        self.flushed.append(dict(deltas))
+        for key, delta in deltas.items():
+            self.counts[key] = self.counts.get(key, 0) + delta
+
+    def read(self, service, row_id, column="likes"):
+        key = ("worlds", column, row_id)
+        return service.read(
+            lambda: self.counts.get(key, 0), lambda stored: stored + service.pending("worlds", column, row_id)
+        )
+
+
+def test_pending_deltas_merge_into_reads():
+    store = Store()
+    service = CounterService(store.flush, shards=4)
+    for _ in range(3):
+        service.increment("worlds", "likes", "w1")
+    service.increment("worlds", "play_count", "w1", delta=5)
+    assert store.counts == {}
+    assert store.read(service, "w1") == 3
+    assert store.read(service, "w1", "play_count") == 5
+    assert store.read(service, "w2") == 0
+
+    assert service.flush() == 2
+    assert store.counts == {("worlds", "likes", "w1"): 3, ("worlds", "play_count", "w1"): 5}
+    assert service.pending("worlds", "likes", "w1") == 0
+    assert store.read(service, "w1") == 3
+    assert service.flush() == 0
+
+
+def test_merge_rows_adds_pending_deltas():
+    service = CounterService(Store().flush)
+    service.increment("custom_assets", "likes", "a1", delta=2)
+    rows = [{"id": "a1", "likes": 4, "downloads": None}, {"id": "a2", "likes": 1, "downloads": 0}]
+    merged = service.merge_rows("custom_assets", rows, ["likes", "downloads"])
+    assert merged == [{"id": "a1", "likes": 6, "downloads": None}, {"id": "a2", "likes": 1, "downloads": 0}]
+
+
+def test_rejects_columns_that_are_not_counters():
+    service = CounterService(Store().flush)
+    with pytest.raises(ValueError):
+        service.increment("worlds", "summary", "w1")
+
+
+def test_failed_flush_keeps_its_deltas():
+    store = Store()
+    service = CounterService(store.flush)
+    service.increment("worlds", "likes", "w1", delta=2)
+    store.fail = True
+    with pytest.raises(RuntimeError):
+        service.flush()
+    assert store.counts == {}
+    assert service.pending("worlds", "likes", "w1") == 2
+    assert store.read(service, "w1") == 2
+    stats = service.stats()
+    assert (stats["failed_flushes"], stats["pending_rows"], stats["last_error"]) == (1, 1, "disk full")
+
+    service.increment("worlds", "likes", "w1")
+    store.fail = False
+    assert service.flush() == 1
+    assert store.counts == {("worlds", "likes", "w1"): 3}
+    assert service.pending("worlds", "likes", "w1") == 0
+
+
+def test_read_retries_when_a_flush_commits_between_load_and_merge():
+    store = Store()
+    service = CounterService(store.flush)
+    service.increment("worlds", "likes", "w1", delta=4)
+    loads = []
+
+    def load():
+        stored = store.counts.get(("worlds", "likes", "w1"), 0)
+        if not loads:
+            # The deltas are committed after this stored value was read, so
+            # merging the (now empty) pending deltas into it would lose them.
+            service.flush()
+        loads.append(stored)
+        return stored
+
+    assert service.read(load, lambda stored: stored + service.pending("worlds", "likes", "w1")) == 4
+    assert loads == [0, 4]
+
+
+def test_read_waits_while_a_flush_is_committing():
+    committing = threading.Event()
+    release = threading.Event()
+    store = Store()
+
+    def slow_flush(deltas):
+        store.flush(deltas)
+        committing.set()
+        release.wait(5)
+
+    service = CounterService(slow_flush)
+    service.increment("worlds", "likes", "w1", delta=3)
+    flusher = threading.Thread(target=service.flush)
+    flusher.start()
+    assert committing.wait(5)
+    # Stored and flushing both hold the deltas right now; the read must not
+    # count them twice.
+    results = []
+    reader = threading.Thread(target=lambda: results.append(store.read(service, "w1")))
+    reader.start()
+    time.sleep(0.05)
+    assert results == []
+    release.set()
+    flusher.join(5)
+    reader.join(5)
+    assert results == [3]
+
+
+def test_stop_writes_everything_out():
+    store = Store()
+    service = CounterService(store.flush, interval=60)
+    service.start()
+    assert service.stats()["running"]
+    for index in range(50):
+        service.increment("worlds", "likes", f"w{index % 5}")
+    service.stop()
+    assert not service.stats()["running"]
+    assert store.counts == {("worlds", "likes", f"w{index}"): 10 for index in range(5)}
+    assert service.stats()["pending_rows"] == 0
+
+
+def test_full_buffer_flushes_before_the_interval():
+    store = Store()
+    service = CounterService(store.flush, shards=1, interval=60, max_pending=3)
+    service.start()
+    try:
+        for index in range(3):
+            service.increment("worlds", "likes", f"w{index}")
+        deadline = time.monotonic() + 5
+        while not store.flushed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.flushed
+    finally:
+        service.stop()
+    assert sum(store.counts.values()) == 3
+
+
+def test_apply_deltas_updates_each_counter_column():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE worlds (id TEXT PRIMARY KEY, play_count INTEGER DEFAULT 0, likes INTEGER DEFAULT 0)")
+    conn.executemany("INSERT INTO worlds (id) VALUES (?)", [("w1",), ("w2",)])
+    touched = apply_deltas(
+        conn, {("worlds", "likes", "w1"): 2, ("worlds", "play_count", "w1"): 7, ("worlds", "likes", "w2"): 1}
+    )
+    assert touched == 3
+    assert conn.execute("SELECT id, play_count, likes FROM worlds ORDER BY id").fetchall() == [
+        ("w1", 7, 2),
+        ("w2", 0, 1),
+    ]
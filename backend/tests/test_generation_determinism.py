@@ -0,0 +1,114 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import generation_batch
+import generation_cache
+import historical_research
+import models_integration
+
+FIELDS = {
+    "prompt": "Una ciudad flotante sobre un mar de nubes",
+    "theme": "fantasía",
+    "platforms": ["Windows", "Linux"],
+    "enable_ar_vr": True,
+    "multiplayer_mode": "coop",
+    "player_skill_level": None,
+    "user_id": "u1",
+    "seed": None,
+}
+
+
+def _payload(fields, seed):
+    world_recipe = generation_cache.recipe(fields, seed)
+    [(payload, error)] = generation_batch.BatchGenerator(workers=0).run([world_recipe])
+    assert error is None
+    return json.dumps(payload, sort_keys=True)
+
+
+def test_derive_seed_is_stable_and_ignores_what_does_not_shape_the_world():
+    seed = generation_cache.derive_seed(FIELDS)
+    assert seed == generation_cache.derive_seed(dict(FIELDS))
+    assert 0 <= seed < 2**63
+    respaced = {**FIELDS, "prompt": "  Una ciudad   flotante sobre un mar de nubes ", "user_id": "someone else"}
+    assert generation_cache.derive_seed(respaced) == seed
+    assert generation_cache.derive_seed({**FIELDS, "platforms": ["Windows", "Linux", "Windows"]}) == seed
+    assert generation_cache.derive_seed({**FIELDS, "prompt": "Otra ciudad"}) != seed
+    assert generation_cache.derive_seed({**FIELDS, "enable_ar_vr": False}) != seed
+
+
+def test_recipe_round_trip():
+    world_recipe = generation_cache.recipe(FIELDS, 42)
+    fields, seed = generation_cache.recipe_fields(world_recipe)
+    assert seed == 42
+    assert generation_cache.recipe(fields, seed) == world_recipe
+
+
+def test_base_world_depends_only_on_inputs_and_seed():
+    research = historical_research.gather_context(FIELDS["prompt"], FIELDS["theme"])
+    args = (FIELDS["prompt"], research, FIELDS["platforms"], True)
+    first = models_integration.generate_world(*args, seed=7)
+    assert models_integration.generate_world(*args, seed=7) == first
+    assert models_integration.generate_world(*args, seed=8) != first
+
+
+def test_same_recipe_gives_identical_payload():
+    seed = generation_cache.derive_seed(FIELDS)
+    first = _payload(FIELDS, seed)
+    assert _payload(FIELDS, seed) == first
+    assert _payload({**FIELDS, "user_id": "u2"}, seed) == first
+    assert _payload(FIELDS, seed + 1) != first
+
+
+def test_payload_does_not_depend_on_the_process():
+    # Recipe storage regenerates worlds in other processes (and after
+    # restarts), so nothing may depend on str hash randomization.
+    script = (
+        "import json, sys\n"
+        "sys.path.insert(0, sys.argv[1])\n"
+        "import generation_batch, generation_cache\n"
+        "recipe = sys.argv[2]\n"
+        "[(payload, error)] = generation_batch.BatchGenerator(workers=0).run([recipe])\n"
+        "print(json.dumps(payload, sort_keys=True))\n"
+    )
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    world_recipe = generation_cache.recipe(FIELDS, 1234)
+    outputs = {
+        subprocess.run(
+            [sys.executable, "-c", script, backend, world_recipe],
+            env={**os.environ, "PYTHONHASHSEED": hash_seed},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for hash_seed in ("1", "2", "3")
+    }
+    assert len(outputs) == 1
+    assert json.loads(outputs.pop()) == json.loads(_payload(FIELDS, 1234))
+
+
+@pytest.fixture(scope="module")
+def client(main_module):
+    from fastapi.testclient import TestClient
+
+    with TestClient(main_module.app) as test_client:
+        yield test_client
+
+
+def test_recipe_storage_regenerates_the_same_world(client, main_module, monkeypatch):
+    monkeypatch.setattr(main_module, "WORLD_STORAGE", "recipe")
+    request = {"prompt": "Un archipiélago volcánico", "theme": "fantasía", "seed": 99}
+    generated = client.post("/generate", json=request).json()
+
+    # Drop every cached copy so the read has to rebuild the world from its recipe.
+    main_module.world_cache.invalidate()
+    main_module._write(lambda conn: conn.execute("DELETE FROM generation_cache"))
+    with main_module._get_connection() as conn:
+        sections = conn.execute("SELECT COUNT(*) FROM world_sections WHERE world_id = ?", (generated["world_id"],))
+        assert sections.fetchone()[0] == 0
+        assert conn.execute("SELECT seed FROM worlds WHERE id = ?", (generated["world_id"],)).fetchone()[0] == 99
+
+    assert client.get(f"/worlds/{generated['world_id']}").json() == generated["payload"]
@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+import generation_jobs
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "http://127.0.0.1/hook",
+        "http://10.1.2.3/hook",
+        "http://192.168.0.10:8080/hook",
+        "http://169.254.169.254/latest/meta-data",
+        "http://[::1]/hook",
+        "http://[fe80::1]/hook",
+        "http://[::ffff:10.0.0.1]/hook",
+        "http://0.0.0.0/hook",
+        "ftp://93.184.216.34/hook",
+        "/relative/hook",
+    ],
+)
+def test_check_webhook_url_rejects_non_public_targets(url):
+    with pytest.raises(ValueError):
+        generation_jobs.check_webhook_url(url)
+
+
+def test_check_webhook_url_accepts_public_address():
+    generation_jobs.check_webhook_url("https://93.184.216.34/hook")
+
+
+def test_post_webhook_drops_private_target_without_connecting(monkeypatch):
+    def _connect(*args, **kwargs):
+        raise AssertionError("connected to a private address")
+
+    monkeypatch.setattr(generation_jobs.socket, "create_connection", _connect)
+    generation_jobs._post_webhook("http://127.0.0.1:9/hook", {"job_id": "x"})
+
+
+def test_idle_workers_do_not_take_the_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(generation_jobs, "POLL_INTERVAL", 0.01)
+    path = tmp_path / "jobs.db"
+    with sqlite3.connect(path) as setup:
+        setup.execute(
+            """CREATE TABLE generation_jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL DEFAULT 0,
+               request TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, webhook_url TEXT,
+               available_at REAL NOT NULL, created_at TEXT NOT NULL, started_at TEXT, finished_at TEXT)"""
+        )
+
+    @contextmanager
+    def connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    writes = []
+
+    def write(job):
+        writes.append(job)
+        with connect() as conn:
+            return job(conn)
+
+    async def run_job(request):
+        return {"echo": request}
+
+    async def run():
+        queue = generation_jobs.JobQueue(connect, write, run_job, workers=3)
+        await queue.start()
+        await asyncio.sleep(0.2)
+        idle_writes = len(writes)
+        job_id = queue.submit({"prompt": "hola"})
+        for _ in range(200):
+            job = queue.get(job_id)
+            if job["status"] == generation_jobs.SUCCEEDED:
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return idle_writes, job
+
+    idle_writes, job = asyncio.run(run())
+    # Only start()'s requeue of jobs left running went through the writer.
+    assert idle_writes == 1
+    assert job["status"] == generation_jobs.SUCCEEDED
@@ -0,0 +1,198 @@
+import json
+import struct
+
+import pytest
+
+import msgpack_codec
+from msgpack_codec import Raw, accepts_msgpack, is_msgpack, packb, unpackb
+
+
+@pytest.mark.parametrize(
+    "value, prefix",
+    [
+        (0, b"\x00"),
+        (0x7F, b"\x7f"),
+        (-1, b"\xff"),
+        (-0x20, b"\xe0"),
+        (0x80, b"\xcc"),
+        (0xFF, b"\xcc"),
+        (0x100, b"\xcd"),
+        (0xFFFF, b"\xcd"),
+        (0x10000, b"\xce"),
+        (0xFFFFFFFF, b"\xce"),
+        (0x100000000, b"\xcf"),
+        (0xFFFFFFFFFFFFFFFF, b"\xcf"),
+        (-0x21, b"\xd0"),
+        (-0x80, b"\xd0"),
+        (-0x81, b"\xd1"),
+        (-0x8000, b"\xd1"),
+        (-0x8001, b"\xd2"),
+        (-0x80000000, b"\xd2"),
+        (-0x80000001, b"\xd3"),
+        (-0x8000000000000000, b"\xd3"),
+    ],
+)
+def test_int_widths_round_trip(value, prefix):
+    packed = packb(value)
+    assert packed.startswith(prefix)
+    assert unpackb(packed) == value
+
+
+@pytest.mark.parametrize("value", [0x10000000000000000, -0x8000000000000001])
+def test_int_out_of_range(value):
+    with pytest.raises(ValueError):
+        packb(value)
+
+
+@pytest.mark.parametrize(
+    "size, prefix", [(0, 0xA0), (31, 0xBF), (32, 0xD9), (0xFF, 0xD9), (0x100, 0xDA), (0xFFFF, 0xDA), (0x10000, 0xDB)]
+)
+def test_str_widths_round_trip(size, prefix):
+    value = "x" * size
+    packed = packb(value)
+    assert packed[0] == prefix
+    assert unpackb(packed, json_only=True) == value
+
+
+def test_str_is_utf8():
+    assert unpackb(packb("ñandú ✓")) == "ñandú ✓"
+
+
+@pytest.mark.parametrize("size, prefix", [(0, 0xC4), (0xFF, 0xC4), (0x100, 0xC5), (0xFFFF, 0xC5), (0x10000, 0xC6)])
+def test_bin_widths_round_trip(size, prefix):
+    value = bytes(range(256)) * (size // 256) + bytes(size % 256)
+    packed = packb(value)
+    assert packed[0] == prefix
+    assert unpackb(packed) == value
+
+
+@pytest.mark.parametrize("size, prefix", [(0, 0x90), (15, 0x9F), (16, 0xDC), (0xFFFF, 0xDC), (0x10000, 0xDD)])
+def test_array_widths_round_trip(size, prefix):
+    value = list(range(size))
+    packed = packb(value)
+    assert packed[0] == prefix
+    assert unpackb(packed) == value
+
+
+@pytest.mark.parametrize("size, prefix", [(0, 0x80), (15, 0x8F), (16, 0xDE), (0xFFFF, 0xDE), (0x10000, 0xDF)])
+def test_map_widths_round_trip(size, prefix):
+    value = {str(i): i for i in range(size)}
+    packed = packb(value)
+    assert packed[0] == prefix
+    assert unpackb(packed) == value
+
+
+def test_scalars_and_tuples():
+    assert unpackb(packb([None, True, False, 1.5, (1, 2)])) == [None, True, False, 1.5, [1, 2]]
+    assert unpackb(b"\xca" + struct.pack(">f", 0.25)) == 0.25
+
+
+def test_nested_document_matches_json():
+    doc = {"player": {"pos": [1.5, -2.0, 3.25], "hp": 87}, "flags": [True, False, None], "name": "Ana"}
+    assert unpackb(packb(doc), json_only=True) == json.loads(json.dumps(doc))
+
+
+def test_cannot_pack_unknown_type():
+    with pytest.raises(TypeError):
+        packb({1, 2})
+
+
+@pytest.mark.parametrize("value", [300, "x" * 40, b"abc", [1, 2, 3], {"a": 1}, 1.5, 0x100000000])
+def test_truncated_input(value):
+    packed = packb(value)
+    for end in range(len(packed)):
+        with pytest.raises(ValueError):
+            unpackb(packed[:end])
+
+
+def test_trailing_bytes():
+    with pytest.raises(ValueError, match="trailing"):
+        unpackb(packb({"a": 1}) + b"\xc0")
+
+
+def test_unsupported_type_byte():
+    with pytest.raises(ValueError, match="0xc1"):
+        unpackb(b"\xc1")
+
+
+def test_invalid_utf8():
+    with pytest.raises(ValueError):
+        unpackb(b"\xa2\xff\xfe")
+
+
+def test_json_only_rejects_binary():
+    packed = packb({"blob": b"\x00\x01"})
+    assert unpackb(packed) == {"blob": b"\x00\x01"}
+    with pytest.raises(ValueError, match="binary"):
+        unpackb(packed, json_only=True)
+
+
+def test_json_only_rejects_non_string_keys():
+    packed = packb({1: "a"})
+    assert unpackb(packed) == {1: "a"}
+    with pytest.raises(ValueError, match="keys"):
+        unpackb(packed, json_only=True)
+
+
+def test_unhashable_key_is_value_error():
+    with pytest.raises(ValueError):
+        unpackb(b"\x81\x90\x01")
+
+
+def test_depth_limit():
+    depth = msgpack_codec.MAX_DEPTH
+    assert unpackb(b"\x91" * depth + b"\xc0") is not None
+    with pytest.raises(ValueError, match="nested"):
+        unpackb(b"\x91" * (depth + 1) + b"\xc0")
+    with pytest.raises(ValueError, match="nested"):
+        unpackb(b"\x91" * 50000 + b"\xc0")
+    with pytest.raises(ValueError, match="nested"):
+        unpackb(b"\x81\xa1k" * (depth + 1) + b"\xc0")
+
+
+def test_raw_is_spliced_unchanged():
+    inner = packb({"hp": 87, "pos": [1, 2]})
+    packed = packb({"id": "s1", "game_state": Raw(inner)})
+    assert packed.endswith(inner)
+    assert unpackb(packed) == {"id": "s1", "game_state": {"hp": 87, "pos": [1, 2]}}
+    assert packb([Raw(b"\xc0"), Raw(b"\x01")]) == b"\x92\xc0\x01"
+
+
+@pytest.mark.parametrize(
+    "content_type, expected",
+    [
+        ("application/msgpack", True),
+        ("application/x-msgpack; charset=binary", True),
+        ("Application/MsgPack", True),
+        ("application/json", False),
+        (None, False),
+    ],
+)
+def test_is_msgpack(content_type, expected):
+    assert is_msgpack(content_type) is expected
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, False),
+        ("", False),
+        ("application/msgpack", True),
+        ("application/x-msgpack", True),
+        ("application/json", False),
+        ("*/*", False),
+        # Ties go to JSON.
+        ("application/msgpack, application/json", False),
+        ("application/msgpack, */*", False),
+        ("application/msgpack;q=0.5, application/json;q=0.5", False),
+        ("application/msgpack, application/json;q=0.9", True),
+        ("application/msgpack;q=0.8, application/json;q=0.9", False),
+        ("application/json;q=0.1, application/msgpack;q=0.2", True),
+        ("application/msgpack, application/*;q=0.5", True),
+        ("application/msgpack;q=0", False),
+        ("application/msgpack;q=bogus, application/json;q=0.1", False),
+        ("application/msgpack;q=0.3, application/msgpack;q=0.9, application/json;q=0.5", True),
+    ],
+)
+def test_accepts_msgpack(accept, expected):
+    assert accepts_msgpack(accept) is expected
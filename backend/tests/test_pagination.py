@@ -0,0 +1,156 @@
+import base64
+import json
+import sqlite3
+
+import pytest
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page, split_page
+
+
+def _token(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+TAMPERED = [
+    "not base64 at all!",
+    _token([1, 2]),
+    _token({"s": "worlds:"}),
+    _token({"s": "worlds:", "k": ["2024-01-01"]}),
+    _token({"s": "worlds:", "k": [[1], "x"]}),
+    _token({"s": "worlds:", "k": [{"a": 1}, "x"]}),
+    _token({"s": "worlds:", "k": [None, "x"]}),
+    _token({"s": "worlds:", "k": [True, "x"]}),
+]
+
+
+def test_cursor_round_trip():
+    values = ["2024-01-01T00:00:00", "w-1", 3, 2.5]
+    token = encode_cursor("scope", values)
+    assert "=" not in token
+    assert decode_cursor("scope", token, 4) == values
+
+
+def test_cursor_from_another_listing_is_rejected():
+    token = encode_cursor("worlds:u1", ["2024-01-01", "w1"])
+    with pytest.raises(InvalidCursor, match="does not belong"):
+        decode_cursor("worlds:u2", token, 2)
+
+
+@pytest.mark.parametrize("token", TAMPERED)
+def test_tampered_cursor_is_rejected(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor("worlds:", token, 2)
+
+
+def test_cursor_value_kinds():
+    token = encode_cursor("browse:likes", [3, "w1"])
+    assert decode_cursor("browse:likes", token, 2, (int, str)) == [3, "w1"]
+    with pytest.raises(InvalidCursor):
+        decode_cursor("browse:likes", encode_cursor("browse:likes", ["3", "w1"]), 2, (int, str))
+    with pytest.raises(InvalidCursor):
+        decode_cursor("browse:likes", encode_cursor("browse:likes", [True, "w1"]), 2, (int, str))
+
+
+def test_keyset_pages_walk_the_whole_table():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE items (id TEXT PRIMARY KEY, score INTEGER)")
+    conn.executemany("INSERT INTO items VALUES (?, ?)", [(f"i{n:02d}", n % 4) for n in range(23)])
+    expected = [row[0] for row in conn.execute("SELECT id FROM items ORDER BY score DESC, id DESC")]
+
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        where, order, params = keyset_page("items", ["score", "id"], cursor, 5)
+        rows = conn.execute(f"SELECT * FROM items {'WHERE ' + where if where else ''} {order}", params).fetchall()
+        page, cursor = split_page("items", [dict(row) for row in rows], ["score", "id"], 5)
+        seen.extend(row["id"] for row in page)
+        pages += 1
+        if cursor is None:
+            break
+    assert seen == expected
+    assert pages == 5
+
+
+def test_split_page_exact_fit_has_no_next_cursor():
+    rows = [{"id": "a", "score": 2}, {"id": "b", "score": 1}]
+    assert split_page("items", rows, ["score", "id"], 2) == (rows, None)
+    page, cursor = split_page("items", rows, ["score", "id"], 1)
+    assert page == rows[:1]
+    assert decode_cursor("items", cursor, 2) == [2, "a"]
+
+
+# ---- routes -------------------------------------------------------------
+
+
+@pytest.fixture(scope="module")
+def client(main_module):
+    from fastapi.testclient import TestClient
+
+    with main_module._get_connection() as conn:
+        conn.executemany(
+            """INSERT INTO worlds (id, prompt, summary, payload, created_at, user_id, is_public, play_count, likes)
+               VALUES (?, 'p', ?, '{}', ?, ?, ?, ?, ?)""",
+            [
+                (f"w{n:02d}", f"World {n}", f"2024-01-01T00:00:{n % 7:02d}", f"u{n % 2}", n % 3 != 0, n % 5, n % 4)
+                for n in range(25)
+            ],
+        )
+    with TestClient(main_module.app) as test_client:
+        yield test_client
+
+
+def _walk(client, path, key, **params):
+    ids = []
+    cursor = None
+    while True:
+        body = client.get(path, params={**params, **({"cursor": cursor} if cursor else {})}).json()
+        ids.extend(row["id"] for row in body[key])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_worlds_listing_round_trip(client):
+    everything = client.get("/worlds", params={"limit": 200}).json()
+    assert everything["next_cursor"] is None
+    assert len(everything["worlds"]) == 25
+    assert _walk(client, "/worlds", "worlds", limit=4) == [world["id"] for world in everything["worlds"]]
+    mine = _walk(client, "/worlds", "worlds", user_id="u1", limit=3)
+    assert len(mine) == 12
+    assert len(set(mine)) == 12
+
+
+def test_browse_round_trip(client):
+    for sort in ("popular", "recent", "likes"):
+        everything = client.get("/browse", params={"sort": sort, "limit": 200}).json()
+        assert everything["next_cursor"] is None
+        assert len(everything["worlds"]) == 16
+        assert _walk(client, "/browse", "worlds", sort=sort, limit=3) == [world["id"] for world in everything["worlds"]]
+
+
+def test_cursor_from_another_listing_is_a_400(client):
+    cursor = client.get("/worlds", params={"limit": 2}).json()["next_cursor"]
+    response = client.get("/worlds", params={"user_id": "u1", "cursor": cursor})
+    assert response.status_code == 400
+    assert "does not belong" in response.json()["detail"]
+    assert client.get("/market/browse", params={"cursor": cursor}).status_code == 400
+
+
+@pytest.mark.parametrize(
+    "path, scope, width",
+    [
+        ("/worlds", "worlds:", 2),
+        ("/browse", "browse:popular", 3),
+        ("/assets/browse", "assets:", 3),
+        ("/market/browse", "market", 2),
+    ],
+)
+def test_tampered_cursor_is_a_400(client, path, scope, width):
+    for values in ([[1]] * width, [{"a": 1}] * width, [None] * width, ["x"] * (width + 1)):
+        response = client.get(path, params={"cursor": _token({"s": scope, "k": values})})
+        assert response.status_code == 400, (path, values, response.text)
+    if path == "/browse":
+        response = client.get(path, params={"cursor": _token({"s": scope, "k": ["x", "y", "z"]})})
+        assert response.status_code == 400
@@ -0,0 +1,23 @@
+import pytest
+
+import migrations
+
+
+@pytest.fixture(scope="module")
+def conn(main_module):
+    with main_module._get_connection() as connection:
+        yield connection
+
+
+def test_hot_queries_use_indexes(conn):
+    assert migrations.find_table_scans(conn) == {}
+
+
+def test_hot_queries_bind_all_parameters():
+    for name, (sql, params) in migrations.HOT_QUERIES.items():
+        assert sql.count("?") == len(params), name
+
+
+def test_scan_is_reported(conn, monkeypatch):
+    monkeypatch.setitem(migrations.HOT_QUERIES, "unindexed", ("SELECT * FROM quests WHERE title = ?", ("t",)))
+    assert "unindexed" in migrations.find_table_scans(conn)
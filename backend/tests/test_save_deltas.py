@@ -0,0 +1,244 @@
+import copy
+import json
+import random
+import sqlite3
+
+import pytest
+
+import save_deltas
+from db_pool import read_transaction
+from save_deltas import SaveStore, apply_patch, diff
+
+SCHEMA = [
+    "CREATE TABLE compression_dictionaries (id INTEGER PRIMARY KEY, kind TEXT, data BLOB, created_at TEXT)",
+    """CREATE TABLE game_saves (id TEXT PRIMARY KEY, user_id TEXT, world_id TEXT, slot_name TEXT,
+       slot_number INTEGER, game_state TEXT, player_stats TEXT, encoding TEXT, progress_percentage REAL,
+       play_time INTEGER, created_at TEXT, updated_at TEXT, version INTEGER NOT NULL DEFAULT 1,
+       snapshot_version INTEGER NOT NULL DEFAULT 1, delta_bytes INTEGER NOT NULL DEFAULT 0,
+       UNIQUE (user_id, world_id, slot_number))""",
+    """CREATE TABLE game_save_deltas (save_id TEXT, version INTEGER, patch TEXT, created_at TEXT,
+       PRIMARY KEY (save_id, version)) WITHOUT ROWID""",
+]
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ({}, {}),
+        ({"a": 1}, {"a": 2}),
+        ({"a": 1, "b": 2}, {"b": 2}),
+        ({"a": 1}, {"a": 1, "c": [1, 2]}),
+        ({"list": [1, 2]}, {"list": [1, 2, 3, 4]}),
+        ({"list": [1, 2, 3]}, {"list": [1, 9, 3]}),
+        ({"list": [1, 2, 3]}, {"list": [3]}),
+        ({"list": [1, 2]}, {"list": [2, 1, 0]}),
+        ({"x": {"y": {"z": 1}}}, {"x": {"y": {"z": 2, "w": None}}}),
+        ({"x": 1}, {"x": "1"}),
+        ({"x": 1}, {"x": 1.0}),
+        ({"x": True}, {"x": 1}),
+        ({"a": [1]}, {"a": [True, 2]}),
+        ({"a": [0]}, {"a": [0.0, 2]}),
+        ([{"x": 1}], [{"x": 1.0}, 3]),
+        ({"a/b": 1, "c~d": 2, "": 3}, {"a/b": 4, "c~d": 5, "": 6}),
+        ([1, 2], {"a": 1}),
+        ("text", ["list"]),
+    ],
+)
+def test_diff_apply_round_trip(old, new):
+    patch = diff(old, new)
+    # Compared as JSON text: == would let 1, 1.0 and True stand for each other.
+    assert json.dumps(apply_patch(copy.deepcopy(old), copy.deepcopy(patch))) == json.dumps(new)
+    if json.dumps(old) == json.dumps(new):
+        assert patch == []
+
+
+def _random_value(rng, depth=0):
+    kind = rng.randrange(6 if depth < 3 else 3)
+    if kind == 0:
+        return rng.randrange(-5, 5)
+    if kind == 1:
+        return rng.choice(["a", "b", "/", "~", None, True, 1.5])
+    if kind == 2:
+        return rng.random() < 0.5
+    if kind == 3:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {rng.choice(["k", "l", "m/n", "o~p", "q"]): _random_value(rng, depth + 1) for _ in range(rng.randrange(4))}
+
+
+def _mutate(rng, value, depth=0):
+    if isinstance(value, dict) and rng.random() < 0.8:
+        value = dict(value)
+        for key in list(value):
+            roll = rng.random()
+            if roll < 0.2:
+                del value[key]
+            elif roll < 0.6:
+                value[key] = _mutate(rng, value[key], depth + 1)
+        if rng.random() < 0.3:
+            value[rng.choice(["new", "k", "x/y"])] = _random_value(rng, depth + 1)
+        return value
+    if isinstance(value, list) and rng.random() < 0.8:
+        value = [_mutate(rng, item, depth + 1) if rng.random() < 0.3 else item for item in value]
+        if rng.random() < 0.4:
+            value.extend(_random_value(rng, depth + 1) for _ in range(rng.randrange(1, 3)))
+        elif value and rng.random() < 0.2:
+            value.pop(rng.randrange(len(value)))
+        return value
+    return _random_value(rng, depth) if rng.random() < 0.5 else value
+
+
+def test_diff_apply_round_trip_random():
+    rng = random.Random(23)
+    for _ in range(2000):
+        old = {"game_state": _random_value(rng), "player_stats": _random_value(rng)}
+        new = _mutate(rng, copy.deepcopy(old))
+        patch = diff(old, new)
+        assert json.dumps(apply_patch(copy.deepcopy(old), patch)) == json.dumps(new), (old, new, patch)
+
+
+def test_escaped_pointer_tokens():
+    assert save_deltas._tokens("") == []
+    assert save_deltas._tokens("/a~1b/c~0d/~01") == ["a/b", "c~d", "~1"]
+    assert save_deltas._tokens("/") == [""]
+
+
+@pytest.mark.parametrize("pointer", ["a", "a/b", "~0"])
+def test_tokens_reject_relative_pointer(pointer):
+    with pytest.raises(ValueError, match="Invalid JSON pointer"):
+        save_deltas._tokens(pointer)
+
+
+@pytest.mark.parametrize(
+    "token, allow_end, expected",
+    [("0", False, 0), ("2", False, 2), ("3", True, 3), ("-", True, 3)],
+)
+def test_index(token, allow_end, expected):
+    assert save_deltas._index([1, 2, 3], token, allow_end) == expected
+
+
+@pytest.mark.parametrize(
+    "token, allow_end, message",
+    [
+        ("-", False, "Invalid array index"),
+        ("01", False, "Invalid array index"),
+        ("-1", True, "Invalid array index"),
+        ("x", True, "Invalid array index"),
+        ("", True, "Invalid array index"),
+        ("3", False, "out of range"),
+        ("4", True, "out of range"),
+    ],
+)
+def test_index_errors(token, allow_end, message):
+    with pytest.raises(ValueError, match=message):
+        save_deltas._index([1, 2, 3], token, allow_end)
+
+
+@pytest.mark.parametrize(
+    "patch, message",
+    [
+        (["replace"], "must be objects"),
+        ([{"op": "move", "path": "/a", "from": "/b"}], "Unsupported patch operation"),
+        ([{"op": "copy", "path": "/a", "from": "/b"}], "Unsupported patch operation"),
+        ([{"op": "test", "path": "/a", "value": 1}], "Unsupported patch operation"),
+        ([{"path": "/a", "value": 1}], "Unsupported patch operation"),
+        ([{"op": "add", "path": "/a"}], "needs a value"),
+        ([{"op": "replace", "path": "/a"}], "needs a value"),
+        ([{"op": "remove", "path": ""}], "whole document"),
+        ([{"op": "replace", "path": "a", "value": 1}], "Invalid JSON pointer"),
+        ([{"op": "replace", "path": "/missing", "value": 1}], "Path not found"),
+        ([{"op": "remove", "path": "/missing"}], "Path not found"),
+        ([{"op": "add", "path": "/missing/x", "value": 1}], "Path not found"),
+        ([{"op": "add", "path": "/a/x", "value": 1}], "Path not found"),
+        ([{"op": "replace", "path": "/list/3", "value": 1}], "out of range"),
+        ([{"op": "remove", "path": "/list/-"}], "Invalid array index"),
+        ([{"op": "add", "path": "/list/01", "value": 1}], "Invalid array index"),
+        ([{"op": "add", "path": "/list/9/x", "value": 1}], "out of range"),
+    ],
+)
+def test_apply_patch_errors(patch, message):
+    with pytest.raises(ValueError, match=message):
+        apply_patch({"a": 1, "list": [1, 2, 3]}, patch)
+
+
+def test_apply_patch_operations():
+    doc = {"a": 1, "list": [1, 2, 3], "nested": {"k": [{"v": 1}]}}
+    patch = [
+        {"op": "add", "path": "/list/-", "value": 4},
+        {"op": "add", "path": "/list/0", "value": 0},
+        {"op": "remove", "path": "/list/2"},
+        {"op": "replace", "path": "/nested/k/0/v", "value": 2},
+        {"op": "add", "path": "/b", "value": {"c": None}},
+        {"op": "remove", "path": "/a"},
+    ]
+    assert apply_patch(doc, patch) == {"list": [0, 1, 3, 4], "nested": {"k": [{"v": 2}]}, "b": {"c": None}}
+    assert apply_patch({"a": 1}, [{"op": "replace", "path": "", "value": [1]}]) == [1]
+
+
+@pytest.fixture
+def databases(tmp_path):
+    path = str(tmp_path / "saves.db")
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.row_factory = sqlite3.Row
+    writer.execute("PRAGMA journal_mode = WAL")
+    for statement in SCHEMA:
+        writer.execute(statement)
+    # Like a pooled connection: default (deferred) transaction handling.
+    reader = sqlite3.connect(path)
+    reader.row_factory = sqlite3.Row
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def _save(store, conn, step):
+    items = [{"id": index, "name": f"item {index}"} for index in range(50)] + list(range(step))
+    doc = {"game_state": {"step": step, "items": items}, "player_stats": {"xp": step * 10}}
+    conn.execute("BEGIN")
+    saved = store.save(conn, "u", "w", 1, "Auto", doc["game_state"], doc["player_stats"], 0.0, step, "s")
+    conn.execute("COMMIT")
+    return doc, saved
+
+
+def _head(conn):
+    return conn.execute(f"SELECT {save_deltas.HEAD_COLUMNS} FROM game_saves WHERE id = 's'").fetchone()
+
+
+def test_state_replays_deltas_and_compactions(databases):
+    writer, reader = databases
+    store = SaveStore(compact_every=4)
+    kinds = set()
+    for step in range(1, 12):
+        doc, saved = _save(store, writer, step)
+        kinds.add(saved.kind)
+        with read_transaction(reader):
+            assert SaveStore().state(reader, _head(reader)) == doc
+    assert kinds == {"snapshot", "delta"}
+
+
+def test_state_is_consistent_while_a_compaction_commits(databases):
+    writer, reader = databases
+    writer_store = SaveStore(compact_every=3)
+    doc, _ = _save(writer_store, writer, 1)
+    doc, _ = _save(writer_store, writer, 2)
+    reader_store = SaveStore()
+    with read_transaction(reader):
+        head = _head(reader)
+        assert head["version"] > head["snapshot_version"]
+        # The writer saves until it compacts: new snapshot, old patches deleted.
+        step = 3
+        while _save(writer_store, writer, step)[1].kind != "snapshot":
+            step += 1
+        assert reader_store.state(reader, head) == doc
+    with read_transaction(reader):
+        head = _head(reader)
+        assert head["version"] == head["snapshot_version"]
+        assert reader_store.state(reader, head)["game_state"]["step"] == step
+
+
+def test_read_transaction_reuses_open_transaction(databases):
+    _, reader = databases
+    reader.execute("BEGIN")
+    with read_transaction(reader):
+        pass
+    assert reader.in_transaction
+    reader.rollback()
@@ -0,0 +1,109 @@
+import random
+from bisect import bisect_left, bisect_right
+
+import pytest
+
+from sorted_keys import SortedKeys
+
+
+def _check(keys: SortedKeys, expected: list) -> None:
+    assert len(keys) == len(expected)
+    assert list(keys.ascending()) == expected
+    assert list(keys.descending()) == expected[::-1]
+    # Bucket invariants: no empty bucket, maxima in step, splits bounded.
+    assert all(keys._buckets)
+    assert keys._maxes == [bucket[-1] for bucket in keys._buckets]
+    assert all(len(bucket) <= 2 * keys.load for bucket in keys._buckets)
+    if keys._tree is not None:
+        assert keys._tree == keys._build_tree()
+
+
+def _probe(rng: random.Random, keys: SortedKeys, expected: list) -> None:
+    """Positional queries against the plain sorted list (also builds the Fenwick tree)."""
+    probe = (rng.randrange(-5, 105), f"u{rng.randrange(50)}")
+    assert keys.rank(probe) == bisect_left(expected, probe)
+    assert keys.count_below_or_equal(probe) == bisect_right(expected, probe)
+    assert (probe in keys) == (probe in expected)
+    if expected:
+        position = rng.randrange(len(expected))
+        assert keys.at(position) == expected[position]
+        existing = expected[position]
+        assert keys.rank(existing) == position
+        assert keys.count_below_or_equal(existing) == position + 1
+    start = rng.randrange(-2, len(expected) + 3)
+    assert list(keys.ascending(start)) == expected[max(0, start):]
+    assert list(keys.descending(probe)) == expected[: bisect_left(expected, probe)][::-1]
+
+
+@pytest.mark.parametrize("load", [1, 2, 3, 8])
+@pytest.mark.parametrize("seed", range(5))
+def test_random_operations_match_sorted_list(load, seed):
+    rng = random.Random(seed * 100 + load)
+    initial = {(rng.randrange(100), f"u{rng.randrange(50)}") for _ in range(rng.randrange(0, 40))}
+    keys = SortedKeys(initial, load=load)
+    expected = sorted(initial)
+    _check(keys, expected)
+
+    for step in range(1500):
+        roll = rng.random()
+        if roll < 0.5 or not expected:
+            key = (rng.randrange(100), f"u{rng.randrange(50)}")
+            if key not in expected:
+                keys.add(key)
+                expected.insert(bisect_left(expected, key), key)
+        elif roll < 0.9:
+            key = expected.pop(rng.randrange(len(expected)))
+            keys.remove(key)
+        else:
+            # Drain a run of keys so whole buckets empty out and vanish.
+            start = rng.randrange(len(expected))
+            for key in expected[start:start + 3 * load]:
+                keys.remove(key)
+            del expected[start:start + 3 * load]
+        if rng.random() < 0.3:
+            _probe(rng, keys, expected)
+        if step % 50 == 0:
+            _check(keys, expected)
+    _check(keys, expected)
+
+
+def test_empty():
+    keys = SortedKeys(load=2)
+    assert len(keys) == 0
+    assert list(keys.ascending()) == []
+    assert list(keys.descending()) == []
+    assert list(keys.descending((1,))) == []
+    assert keys.rank((1,)) == 0
+    assert (1,) not in keys
+    with pytest.raises(IndexError):
+        keys.at(0)
+    with pytest.raises(KeyError):
+        keys.remove((1,))
+
+
+def test_remove_missing_key():
+    keys = SortedKeys([(1,), (3,), (5,)], load=1)
+    for missing in [(0,), (2,), (4,), (6,)]:
+        with pytest.raises(KeyError):
+            keys.remove(missing)
+    assert list(keys.ascending()) == [(1,), (3,), (5,)]
+
+
+def test_at_out_of_range():
+    keys = SortedKeys([(1,), (2,)], load=1)
+    with pytest.raises(IndexError):
+        keys.at(2)
+    with pytest.raises(IndexError):
+        keys.at(-1)
+
+
+def test_empty_then_refilled():
+    keys = SortedKeys([(i,) for i in range(10)], load=2)
+    assert keys.at(9) == (9,)
+    for i in range(10):
+        keys.remove((i,))
+    _check(keys, [])
+    keys.add((4,))
+    keys.add((2,))
+    assert keys.at(0) == (2,)
+    _check(keys, [(2,), (4,)])
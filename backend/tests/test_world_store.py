@@ -0,0 +1,80 @@
+import gzip
+import json
+import os
+import sqlite3
+import zlib
+
+import pytest
+
+import compression
+import world_store
+
+PAYLOAD = {
+    "research": {"theme": "fantasía", "facts": ["a", "b"]},
+    "world": {"summary": "Bosque", "zones": [{"name": "Claro", "npcs": 3}], "npcs": []},
+    "story": "Érase una vez",
+    "mods": None,
+}
+
+
+@pytest.fixture
+def conn():
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    connection.execute(
+        "CREATE TABLE world_sections (world_id TEXT, section TEXT, position INTEGER, body TEXT, "
+        "encoding TEXT, size INTEGER, crc INTEGER, PRIMARY KEY (world_id, section)) WITHOUT ROWID"
+    )
+    world_store.save_sections(connection, "w1", PAYLOAD)
+    return connection
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [{}, {"a": 1}, {"world": {"a": 1}}, {"world": {"a": 1, "b": [2]}, "c": "x"}, PAYLOAD],
+)
+def test_render_json_round_trips(payload):
+    assert json.loads(world_store.render_json(world_store.split_payload(payload))) == payload
+
+
+def test_crc32_combine():
+    first, second = os.urandom(1000), os.urandom(333)
+    combined = compression.crc32_combine(zlib.crc32(first), zlib.crc32(second), len(second))
+    assert combined == zlib.crc32(first + second)
+    assert compression.crc32_combine(zlib.crc32(first), 0, 0) == zlib.crc32(first)
+
+
+def test_gzip_splice_mixes_glue_and_segments():
+    glue = b"g" * 70000
+    parts = [b"{", compression.stored_segment(b"hello" * 50), glue, compression.stored_segment(b"}"), b""]
+    assert gzip.decompress(compression.gzip_splice(parts)) == b"{" + b"hello" * 50 + glue + b"}"
+
+
+def test_sections_are_stored_once_as_segments(conn):
+    encodings = {row[0] for row in conn.execute("SELECT encoding FROM world_sections")}
+    assert encodings == {compression.DEFLATE}
+    assert world_store.load_payload(conn, "w1") == PAYLOAD
+
+
+@pytest.mark.parametrize(
+    "envelope, suffix, expected",
+    [
+        ("raw", "", PAYLOAD),
+        ("export", "}", {"format": "json", "payload": PAYLOAD}),
+        ("play", ', "play_count": 7}', {"payload": PAYLOAD, "play_count": 7}),
+    ],
+)
+def test_gzip_body_matches_document(conn, envelope, suffix, expected):
+    body = gzip.decompress(world_store.load_payload_gzip(conn, "w1", envelope, suffix))
+    assert json.loads(body) == expected
+    if envelope == "raw":
+        assert body.decode() == world_store.load_payload_json(conn, "w1")
+
+
+def test_gzip_body_with_selectors(conn):
+    body = world_store.load_payload_gzip(conn, "w1", selectors=["world.zones", "story"])
+    assert json.loads(gzip.decompress(body)) == world_store.load_payload(conn, "w1", ["world.zones", "story"])
+
+
+def test_gzip_body_missing_world(conn):
+    assert world_store.load_payload_gzip(conn, "nope") is None
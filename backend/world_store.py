@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import compression
+
+# Keys of payload["world"] are stored one row each ("world.zones", "world.npcs",
+# ...); every other top-level payload key ("research", "story", ...) is one row.
+WORLD_PREFIX = "world."
+
+
+def split_payload(payload: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Flatten a generated payload into ``(section, json_text)`` pairs in key order."""
+    sections: List[Tuple[str, str]] = []
+    for key, value in payload.items():
+        if key == "world" and isinstance(value, dict):
+            for world_key, world_value in value.items():
+                sections.append((WORLD_PREFIX + world_key, json.dumps(world_value)))
+        else:
+            sections.append((key, json.dumps(value)))
+    return sections
+
+
+# Rebuilds the payload of a world stored only as a generation recipe.
+Materializer = Callable[[sqlite3.Connection, str], Optional[Dict[str, Any]]]
+
+
+# Envelopes that can be served gzip-compressed straight from the stored
+# section segments.
+ENVELOPE_PREFIXES = {
+    "raw": b"",
+    "export": b'{"format": "json", "payload": ',
+    "play": b'{"payload": ',
+}
+
+
+def save_sections(conn: sqlite3.Connection, world_id: str, payload: Dict[str, Any]) -> None:
+    save_sections_many(conn, [(world_id, payload)])
+
+
+def save_sections_many(conn: sqlite3.Connection, worlds: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+    """Store the sections of several worlds with one executemany.
+
+    Each section is kept once, as a deflate segment that both section reads
+    and gzip responses use. That gives up the trained-dictionary compression
+    the sections had, in exchange for not storing a second whole-document copy
+    for gzip pass-through.
+    """
+    rows = []
+    for world_id, payload in worlds:
+        for position, (section, body) in enumerate(split_payload(payload)):
+            segment, size, crc = compression.stored_segment(body.encode())
+            rows.append((world_id, section, position, segment, compression.DEFLATE, size, crc))
+    conn.executemany(
+        """INSERT OR REPLACE INTO world_sections (world_id, section, position, body, encoding, size, crc)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        rows,
+    )
+
+
+def load_payload_gzip(
+    conn: sqlite3.Connection,
+    world_id: str,
+    envelope: str = "raw",
+    suffix: str = "",
+    selectors: Optional[List[str]] = None,
+) -> Optional[bytes]:
+    """gzip body for ENVELOPE_PREFIXES[envelope] + document + suffix, or None if not stored as segments."""
+    sql = "SELECT section, body, encoding, size, crc FROM world_sections WHERE world_id = ?"
+    params: List[Any] = [world_id]
+    if selectors:
+        clause, extra = _section_filter(selectors)
+        sql += f" AND ({clause})"
+        params.extend(extra)
+    rows = conn.execute(sql + " ORDER BY position", params).fetchall()
+    if not rows or any(row["encoding"] != compression.DEFLATE for row in rows):
+        return None
+    glue = [text.encode() for text in _layout([row["section"] for row in rows])]
+    parts: List[Any] = [ENVELOPE_PREFIXES[envelope] + glue[0]]
+    for row, after in zip(rows, glue[1:]):
+        parts.append((bytes(row["body"]), row["size"], row["crc"]))
+        parts.append(after)
+    parts.append(suffix.encode())
+    return compression.gzip_splice(parts)
+
+
+def parse_selectors(raw: Optional[str]) -> Optional[List[str]]:
+    """Parse ``?sections=world.zones,story`` into a list; None means everything."""
+    if not raw:
+        return None
+    selectors = [part.strip() for part in raw.split(",") if part.strip()]
+    return selectors or None
+
+
+def _section_filter(selectors: Iterable[str]) -> Tuple[str, List[Any]]:
+    exact: List[str] = []
+    prefixes: List[str] = []
+    for selector in selectors:
+        if selector == "world":
+            prefixes.append(WORLD_PREFIX)
+        exact.append(selector)
+    clauses = []
+    params: List[Any] = []
+    if exact:
+        clauses.append(f"section IN ({', '.join('?' for _ in exact)})")
+        params.extend(exact)
+    for prefix in prefixes:
+        # Range predicate instead of LIKE so the primary key index is used.
+        clauses.append("(section >= ? AND section < ?)")
+        params.extend([prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)])
+    return " OR ".join(clauses), params
+
+
+def fetch_sections(
+    conn: sqlite3.Connection,
+    world_id: str,
+    selectors: Optional[List[str]] = None,
+) -> List[Tuple[str, str]]:
+    """Return the stored ``(section, json_text)`` rows for a world, in payload order."""
+    sql = "SELECT section, body, encoding FROM world_sections WHERE world_id = ?"
+    params: List[Any] = [world_id]
+    if selectors:
+        clause, extra = _section_filter(selectors)
+        sql += f" AND ({clause})"
+        params.extend(extra)
+    rows = conn.execute(sql + " ORDER BY position", params).fetchall()
+    return [(row["section"], compression.decode(conn, row["body"], row["encoding"])) for row in rows]
+
+
+def assemble(rows: List[Tuple[str, str]]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {}
+    for section, body in rows:
+        value = json.loads(body)
+        if section.startswith(WORLD_PREFIX):
+            payload.setdefault("world", {})[section[len(WORLD_PREFIX):]] = value
+        else:
+            payload[section] = value
+    return payload
+
+
+def load_payload(
+    conn: sqlite3.Connection,
+    world_id: str,
+    selectors: Optional[List[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Load a world payload, decoding only the requested sections.
+
+    Returns None when the world does not exist. Rows written before the
+    section store existed fall back to the legacy ``worlds.payload`` blob.
+    """
+    rows = fetch_sections(conn, world_id, selectors)
+    if rows:
+        return assemble(rows)
+
+    row = conn.execute("SELECT payload FROM worlds WHERE id = ?", (world_id,)).fetchone()
+    if not row:
+        return None
+    if not row["payload"]:
+        # Sections exist for this world, just none of the requested ones.
+        return {}
+    payload = json.loads(row["payload"])
+    if selectors:
+        return assemble(
+            [(section, body) for section, body in split_payload(payload) if _selected(section, selectors)]
+        )
+    return payload
+
+
+def _layout(sections: List[str]) -> List[str]:
+    """The JSON text before each section body and after the last one.
+
+    Interleaving it with the bodies of ``sections`` (in payload order, as
+    split_payload produces them) gives the whole document.
+    """
+    glue: List[str] = []
+    text = "{"
+    in_world = False
+    for section in sections:
+        nested = section.startswith(WORLD_PREFIX)
+        if in_world and not nested:
+            text += "}"
+        if glue:
+            text += ", "
+        if nested and not in_world:
+            text += '"world": {'
+        glue.append(text + json.dumps(section[len(WORLD_PREFIX):] if nested else section) + ": ")
+        text = ""
+        in_world = nested
+    glue.append(text + ("}" if in_world else "") + "}")
+    return glue
+
+
+def render_json(rows: List[Tuple[str, str]]) -> str:
+    """Splice stored section bodies into one JSON document without decoding them."""
+    glue = _layout([section for section, _ in rows])
+    return glue[0] + "".join(body + after for (_, body), after in zip(rows, glue[1:]))
+
+
+def load_payload_json(
+    conn: sqlite3.Connection,
+    world_id: str,
+    selectors: Optional[List[str]] = None,
+    materialize: Optional[Materializer] = None,
+) -> Optional[str]:
+    """Like :func:`load_payload` but returns the payload as JSON text, skipping the decode.
+
+    Worlds with neither sections nor a legacy blob are rebuilt with
+    ``materialize`` when one is given.
+    """
+    rows = fetch_sections(conn, world_id, selectors)
+    if rows:
+        return render_json(rows)
+
+    row = conn.execute("SELECT payload FROM worlds WHERE id = ?", (world_id,)).fetchone()
+    if not row:
+        return None
+    if not row["payload"]:
+        if materialize is not None and not has_sections(conn, world_id):
+            payload = materialize(conn, world_id)
+            if payload is not None:
+                rows = split_payload(payload)
+                if selectors:
+                    rows = [(section, body) for section, body in rows if _selected(section, selectors)]
+                return render_json(rows)
+        return "{}"
+    if selectors:
+        return json.dumps(load_payload(conn, world_id, selectors))
+    return row["payload"]
+
+
+def has_sections(conn: sqlite3.Connection, world_id: str) -> bool:
+    return conn.execute("SELECT 1 FROM world_sections WHERE world_id = ? LIMIT 1", (world_id,)).fetchone() is not None
+
+
+def _selected(section: str, selectors: List[str]) -> bool:
+    return section in selectors or (section.startswith(WORLD_PREFIX) and "world" in selectors)
+
+
+def list_sections(conn: sqlite3.Connection, world_id: str) -> List[Dict[str, Any]]:
+    rows = conn.execute(
+        "SELECT section, length(body) AS size FROM world_sections WHERE world_id = ? ORDER BY position",
+        (world_id,),
+    ).fetchall()
+    return [{"section": row["section"], "bytes": row["size"]} for row in rows]
+
+
+if __name__ == "__main__":
+    # Per-request CPU for a full world read: decode + FastAPI re-encode versus
+    # splicing the stored section bodies, and the same for gzip responses.
+    import gzip
+    import sys
+    import time
+
+    from fastapi.encoders import jsonable_encoder
+
+    import historical_research
+    import models_integration
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    research = historical_research.gather_context("Ciudad costera futurista", "ciencia ficción")
+    world = models_integration.generate_world("Ciudad costera futurista", research, ["Windows"], True)
+    payload = {"world": world, "research": research}
+
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE worlds (id TEXT PRIMARY KEY, payload TEXT NOT NULL)")
+    conn.execute(
+        "CREATE TABLE world_sections (world_id TEXT, section TEXT, position INTEGER, body TEXT, "
+        "encoding TEXT, size INTEGER, crc INTEGER, PRIMARY KEY (world_id, section)) WITHOUT ROWID"
+    )
+    conn.execute("INSERT INTO worlds VALUES ('bench', '')")
+    save_sections(conn, "bench", payload)
+
+    def _decode_encode() -> bytes:
+        data = load_payload(conn, "bench")
+        return json.dumps(jsonable_encoder(data), ensure_ascii=False).encode()
+
+    def _passthrough() -> bytes:
+        return load_payload_json(conn, "bench").encode()
+
+    def _gzip_on_the_fly() -> bytes:
+        return gzip.compress(load_payload_json(conn, "bench").encode(), compresslevel=compression.LEVEL)
+
+    def _gzip_passthrough() -> bytes:
+        return load_payload_gzip(conn, "bench")
+
+    assert json.loads(_decode_encode()) == json.loads(_passthrough())
+    assert gzip.decompress(_gzip_passthrough()) == _passthrough()
+    for label, fn in (
+        ("decode + re-encode", _decode_encode),
+        ("pass-through", _passthrough),
+        ("gzip on the fly", _gzip_on_the_fly),
+        ("gzip pass-through", _gzip_passthrough),
+    ):
+        started = time.process_time()
+        for _ in range(iterations):
+            fn()
+        cpu = time.process_time() - started
+        print(f"{label:20s}: {cpu / iterations * 1e6:8.1f} us CPU/request ({len(fn())} bytes)")